@@ -1,21 +1,37 @@
-import openai
-from openai import AzureOpenAI, BadRequestError
-import time
 import json
 import re
-# from yfinance import Ticker
-import requests, os
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
 from dotenv import load_dotenv
 
 
 
 load_dotenv()
 
+# Local modules read their settings from the environment at import time
+import assistant_engine
+import sessions
+import streaming
+import http_transport
+import tool_registry
+import context_packer
+import telemetry
+from embedding_cache import embedding_cache
+from embedding_batcher import EmbeddingBatcher
+
+# Tools are declared once: the schema, dispatch table and limits all come from these decorators
+tools = tool_registry.ToolRegistry()
+
 #-------------------------------------------------------------------------------------------------#
 #----Function to get Customer Information, using Phone Number, in Json Format---------------------#
 #-------------------------------------------------------------------------------------------------#
 
-def get_customer_information(phonenumber):
+@tools.register(timeout=5, cache_ttl=300, cache_class="account")
+def get_customer_information(phonenumber: str):
+    """Get the customer information based on their phone number
+
+    phonenumber: Customer phone number
+    """
     customer_info = {
         "name": "John Doe",
         "address": "123 Main St",
@@ -28,7 +44,13 @@ def get_customer_information(phonenumber):
 #----Function to get Promotions, using Account Number, in Json Format-----------------------------#
 #-------------------------------------------------------------------------------------------------#
 
-def get_promotions(account_number):
+# Started as soon as get_customer_information returns, with the account number from its output
+@tools.register(timeout=5, cache_ttl=300, cache_class="account", follows={"get_customer_information": {"account_number": "account_number"}})
+def get_promotions(account_number: str):
+    """Get the sales promotions for the customer based on their account number
+
+    account_number: Customer account number
+    """
     promotions = {
         "free_hulu_service": True,
         "discount_for_additional_line": "$10",
@@ -43,17 +65,43 @@ def get_promotions(account_number):
 #----Use your specific RAG function here----------------------------------------------------------#
 #-------------------------------------------------------------------------------------------------#
 
-def get_answer_from_kb(question):
+@tools.register(timeout=20, cache_ttl=3600, cache_class="kb", concurrency=8, max_output_chars=16000)
+def get_answer_from_kb(question: str):
+    """Answer customer query using the data from knowledge base
+
+    question: customer query to be answered using the knowledge base
+    """
     #print(f"Calling Function get_answer_from_kb with question: {question}")
 
     searchResult = search(question, os.getenv("AZURE_SEARCH_INDEX_NAME"), "vectorSemanticHybrid", 5, "vzw-semantic-config", "contentVector")
-    combinedContent = "\n".join([result['content'] for result in searchResult]) if searchResult else ""
+    if not searchResult:
+        return ""
+    if not KB_CONTEXT_PACKING:
+        return "\n".join([result.get('content') or "" for result in searchResult])
 
-    return combinedContent
+    # Best chunks first, near-duplicates dropped, trimmed to KB_CONTEXT_TOKEN_BUDGET with titles and chunk ids
+    with telemetry.span("kb.pack") as span:
+        packedContent, packStats = context_packer.pack(searchResult)
+        span.set(payload_bytes=len(packedContent), tokens_in=packStats.tokens_in, tokens_out=packStats.tokens_out,
+                 duplicates=packStats.duplicates, truncated=packStats.truncated)
+    return packedContent
 
 
 #------------------------Helper methods for Azure Search call----------------------#
 
+# Pack the chunks (context_packer.py) instead of joining their full content
+KB_CONTEXT_PACKING = os.getenv("KB_CONTEXT_PACKING", "true").lower() == "true"
+
+# Sub-queries of a multi-query search run concurrently on this pool, within SEARCH_DEADLINE seconds
+SEARCH_MAX_WORKERS = int(os.getenv("SEARCH_MAX_WORKERS", "8"))
+SEARCH_DEADLINE = float(os.getenv("SEARCH_DEADLINE_SECONDS", "20"))
+
+# Directory built with "python local_vector_index.py build"; when set, it replaces Azure Search
+LOCAL_KB_INDEX_PATH = os.getenv("LOCAL_KB_INDEX_PATH")
+if LOCAL_KB_INDEX_PATH:
+    import local_vector_index
+searchExecutor = ThreadPoolExecutor(max_workers=SEARCH_MAX_WORKERS, thread_name_prefix="search")
+
 fieldMap = {
     "id": ["id"],
     "url": ["url", "uri", "link", "document_link"],
@@ -124,6 +172,12 @@ def process_search_docs_response(docs):
     return outputs
 
 def get_query_embedding(query, endpoint, api_key, api_version, embedding_model_deployment):
+    # Repeated (normalized) questions are served from the memory / disk embedding cache
+    if isinstance(query, str):
+        cached = embedding_cache.get(query, embedding_model_deployment)
+        if cached is not None:
+            return [cached]
+
     request_url = f"{endpoint}/openai/deployments/{embedding_model_deployment}/embeddings?api-version={api_version}"
     headers = {
         "Content-Type": "application/json",
@@ -132,14 +186,38 @@ def get_query_embedding(query, endpoint, api_key, api_version, embedding_model_d
     request_payload = {
         'input': query
     }
-    embedding_response = requests.post(request_url, json = request_payload, headers = headers, timeout=None)
+    embedding_response = http_transport.post(request_url, service="embeddings", json = request_payload, headers = headers)
     if embedding_response.status_code == 200:
-        data_values = embedding_response.json()["data"]
+        data_values = sorted(embedding_response.json()["data"], key=lambda data_value: data_value.get("index", 0))
         embeddings_vectors = [data_value["embedding"] for data_value in data_values]
+        if isinstance(query, str) and len(embeddings_vectors) == 1:
+            embedding_cache.put(query, embedding_model_deployment, embeddings_vectors[0])
         return embeddings_vectors
     else:
         raise Exception(f"failed to get embedding: {embedding_response.json()}")
 
+embedding_batchers = {}
+
+def get_query_embeddings(queries, embedding_model_deployment):
+    # One vector per query: cached vectors first, the rest in as few embeddings requests as possible
+    vectors = [embedding_cache.get(query, embedding_model_deployment) for query in queries]
+    missing = list(dict.fromkeys(query for query, vector in zip(queries, vectors) if vector is None))
+    if missing:
+        batcher = embedding_batchers.get(embedding_model_deployment)
+        if batcher is None:
+            batcher = embedding_batchers.setdefault(embedding_model_deployment, EmbeddingBatcher(
+                lambda texts: get_query_embedding(
+                    texts,
+                    os.getenv("AZURE_OPENAI_ENDPOINT"),
+                    os.getenv("AZURE_OPENAI_KEY"),
+                    os.getenv("AZURE_OPENAI_VERSION"),
+                    embedding_model_deployment)))
+        fetched = dict(zip(missing, batcher.embed(missing)))
+        for query, vector in fetched.items():
+            embedding_cache.put(query, embedding_model_deployment, vector)
+        vectors = [vector if vector is not None else fetched[query] for query, vector in zip(queries, vectors)]
+    return vectors
+
 def search_query_api(
     endpoint, 
     api_key,
@@ -149,7 +227,8 @@ def search_query_api(
     query, 
     top_k, 
     semantic_configuration_name=None,
-    vectorFields=None):
+    vectorFields=None,
+    query_vectors=None):
     request_url = f"{endpoint}/indexes/{index_name}/docs/search?api-version={api_version}"
     request_payload = {
         'top': top_k,
@@ -164,13 +243,14 @@ def search_query_api(
         request_payload['semanticConfiguration'] = semantic_configuration_name
     elif query_type in ('vector', 'vectorSimpleHybrid', 'vectorSemanticHybrid'):
         embeddingModel = os.getenv("AZURE_OPENAI_EMBEDDING_MODEL")
-        if vectorFields and embeddingModel:
+        if vectorFields and embeddingModel and query_vectors is None:
             query_vectors = get_query_embedding(
                 query,
                 os.getenv("AZURE_OPENAI_ENDPOINT"),
                 os.getenv("AZURE_OPENAI_KEY"),
                 os.getenv("AZURE_OPENAI_VERSION"),
                 embeddingModel)
+        if vectorFields and query_vectors:
             payload_vectors = [{"value": query_vector, "fields": vectorFields, "k": top_k } for query_vector in query_vectors]
             request_payload['vectors'] = payload_vectors
 
@@ -187,228 +267,195 @@ def search_query_api(
         "Content-Type": "application/json",
         "api-key": api_key
     }
-    retrieved_docs = requests.post(request_url, json = request_payload, headers = headers, timeout=None)
+    retrieved_docs = http_transport.post(request_url, service="search", json = request_payload, headers = headers)
     if retrieved_docs.status_code == 200:
         return process_search_docs_response(retrieved_docs.json()["value"])
     else:
         raise Exception(f"failed to query search index : {retrieved_docs.json()}")
 
+def getDocKey(doc):
+    return doc.get('chunk_id') or doc.get('id') or doc.get('content')
+
+def mergeSearchOutputs(allOutputs, topK):
+    # Round-robin interleave of the per-query results, deduplicated by chunk_id / id, in linear time
+    includedOutputs = []
+    seenKeys = set()
+    longest = max((len(output) for output in allOutputs), default=0)
+    for rank in range(longest):
+        for output in allOutputs:
+            if rank >= len(output):
+                continue
+            key = getDocKey(output[rank])
+            if key in seenKeys:
+                continue
+            seenKeys.add(key)
+            includedOutputs.append(output[rank])
+            if len(includedOutputs) >= topK:
+                return includedOutputs
+    return includedOutputs
+
 def search(queries: str, indexName: str, queryType: str, topK: int, semanticConfiguration: str, vectorFields: str):
     semanticConfiguration = semanticConfiguration if semanticConfiguration != "None" else None
     vectorFields = vectorFields if vectorFields != "None" else None
-                      
-    # Do search.
-    allOutputs = [search_query_api(
-        os.getenv("AZURE_SEARCH_SERVICE_ENDPOINT"), 
-        os.getenv("AZURE_SEARCH_ADMIN_KEY"),
-        os.getenv("AZURE_SEARCH_VERSION"), 
-        indexName,
-        queryType,
-        query, 
-        topK, 
-        semanticConfiguration,
-        vectorFields) for query in getQueryList(queries)]
 
-    includedOutputs = []
-    while allOutputs and len(includedOutputs) < topK:
-        for output in list(allOutputs):
-            if len(output) == 0:
-                allOutputs.remove(output)
+    queryList = getQueryList(queries)
+
+    # Embed every sub-query up front in one batched request instead of one request per sub-query
+    queryVectors = [None] * len(queryList)
+    embeddingModel = os.getenv("AZURE_OPENAI_EMBEDDING_MODEL")
+    if queryType in ('vector', 'vectorSimpleHybrid', 'vectorSemanticHybrid') and vectorFields and embeddingModel:
+        queryVectors = [[vector] for vector in get_query_embeddings(queryList, embeddingModel)]
+
+    def searchOne(index):
+        if LOCAL_KB_INDEX_PATH:
+            # Local in-process backend: same document shape, no Azure Search round trip
+            queryVector = queryVectors[index][0] if queryVectors[index] else None
+            localIndex = local_vector_index.load_index(LOCAL_KB_INDEX_PATH)
+            return process_search_docs_response(localIndex.search(queryList[index], queryVector, topK))
+        return search_query_api(
+            os.getenv("AZURE_SEARCH_SERVICE_ENDPOINT"), 
+            os.getenv("AZURE_SEARCH_ADMIN_KEY"),
+            os.getenv("AZURE_SEARCH_VERSION"), 
+            indexName,
+            queryType,
+            queryList[index], 
+            topK, 
+            semanticConfiguration,
+            vectorFields,
+            queryVectors[index])
+
+    if len(queryList) == 1:
+        return mergeSearchOutputs([searchOne(0)], topK)
+
+    # Do search: every sub-query at once, bounded by a deadline
+    futures = {searchExecutor.submit(searchOne, index): index for index in range(len(queryList))}
+    allOutputs = [[] for _ in queryList]
+    uniqueKeys = set()
+    errors = []
+    try:
+        for future in as_completed(futures, timeout=SEARCH_DEADLINE):
+            try:
+                allOutputs[futures[future]] = future.result()
+            except Exception as e:
+                errors.append(e)
                 continue
-            value = output.pop(0)
-            if value not in includedOutputs:
-                includedOutputs.append(value)
-                if len(includedOutputs) >= topK:
-                    break
-    return includedOutputs
+            # Stop waiting for slower sub-queries once topK unique chunks have arrived
+            uniqueKeys.update(getDocKey(doc) for doc in allOutputs[futures[future]])
+            if len(uniqueKeys) >= topK:
+                break
+    except FuturesTimeoutError:
+        print(f"Search deadline of {SEARCH_DEADLINE}s reached, using the sub-queries that finished")
+    for future in futures:
+        future.cancel()
+
+    if errors and len(errors) == len(queryList):
+        raise errors[0]
+    return mergeSearchOutputs(allOutputs, topK)
 
 #--------------------------------------RAG Function END------------------------------------------------------#
 
 
 
 #-------------------------------------------------------------------------------------------------#
-#----Function to make Assistants API call---------------------------------------------------------#
+#----Tool schema, dispatch table and assistant configuration---------------------------------------#
 #-------------------------------------------------------------------------------------------------#
 
-def process_llm_request(question: str):
-
-
-    tools_list = [
-        {
-            "type": "function",
-            "function": {
-                "name": "get_customer_information",
-                "description": "Get the customer information based on their phone number",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "phonenumber": {
-                            "type": "string",
-                            "description": "Customer phone number",
-                        },
-                    },
-                    "required": ["phonenumber"]
-                },
-            },
-        },
-        {
-            "type": "function",
-            "function": {
-                "name": "get_promotions",
-                "description": "Get the sales promotions for the customer based on their account number",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "account_number": {
-                            "type": "string",
-                            "description": "Customer account number",
-                        },
-                    },
-                    "required": ["account_number"]
-                },
-            },
-        },
-        {
-            "type": "function",
-            "function": {
-                "name": "get_answer_from_kb",
-                "description": "Answer customer query using the data from knowledge base",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "question": {
-                            "type": "string",
-                            "description": "customer query to be answered using the knowledge base",
-                        },
-                    },
-                    "required": ["question"]
-                },
-            },
-        }
-    ]
-
-    # Initialize OPENAI client
-    client = AzureOpenAI(
-        api_key=os.getenv("AZURE_OPENAI_KEY"),
-        api_version=os.getenv("AZURE_OPENAI_VERSION"),
-        azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT")
-    )
-
-    # Step 1: Create an Assistant
-    assistant = client.beta.assistants.create(
-        name="Call Center Chat Assistant",
-        instructions="You are a personal  Chat Assistant",
-        model="gpt-35-turbo-16k",
-        tools=tools_list,
-    )
-
-    # Step 2: Create a Thread
-    thread = client.beta.threads.create()
-
-    # Step 3: Add a Message to a Thread
-    message = client.beta.threads.messages.create(
-        thread_id=thread.id,
-        role="user",
-        content=question
-    )
-
-    # Step 4: Run the Assistant
-    run = client.beta.threads.runs.create(
-        thread_id=thread.id,
-        assistant_id=assistant.id,
-        instructions="Please address the user as Bot."
-    )
-
-    #print(run.model_dump_json(indent=4))
-
-    # Define a dispatch table
-    function_dispatch_table = {
-        "get_promotions": get_promotions,
-        "get_customer_information": get_customer_information,
-        "get_answer_from_kb": get_answer_from_kb
-    }
+tools_list = tools.tools_list
+function_dispatch_table = tools.dispatch_table
 
-    run_result = None
-    while True:
-        # Wait for 5 seconds
-        time.sleep(5)
-
-        # Retrieve the run status
-        run_status = client.beta.threads.runs.retrieve(
-            thread_id=thread.id,
-            run_id=run.id
-        )
-        #print(run_status.model_dump_json(indent=4))
-
-        # If run is completed, get messages
-        if run_status.status == 'completed':
-            messages = client.beta.threads.messages.list(
-                thread_id=thread.id
-            )
-
-            # Loop through messages and print content based on role
-            for msg in messages.data:
-                role = msg.role
-                content = msg.content[0].text.value
-                #print(f"{role.capitalize()}: {content}")
-                if role == 'assistant': # If the role is assistant, print the assistant response
-                    return content      # Save the assistant response and return it
-            break
-        elif run_status.status == 'requires_action':
-            #print("Calling the required functions...")
-            required_actions = run_status.required_action.submit_tool_outputs.model_dump()
-            #print(required_actions)
-            tools_output = []
-
-            for action in required_actions["tool_calls"]:
-                func_name = action["function"]["name"]
-                arguments = json.loads(action["function"]["arguments"])
-
-                print(f"\033[93mFunction: {func_name}, Arguments: {arguments}\033[0m")
-
-                func = function_dispatch_table.get(func_name)
-                if func:
-                    result = func(**arguments)
-                    # Ensure the output is a JSON string
-                    output = json.dumps(result) if not isinstance(result, str) else result
-                    tools_output.append({
-                        "tool_call_id": action["id"],
-                        "output": output
-                    })
-                else:
-                    print(f"Function {func_name} not found")
-
-            # Submit the tool outputs to Assistant API
-            client.beta.threads.runs.submit_tool_outputs(
-                thread_id=thread.id,
-                run_id=run.id,
-                tool_outputs=tools_output
-            )
+assistant_config = assistant_engine.AssistantConfig(
+    name="Call Center Chat Assistant",
+    instructions="You are a personal  Chat Assistant",
+    model="gpt-35-turbo-16k",
+    tools=tools_list,
+    functions=function_dispatch_table,
+    timeouts=tools.timeouts,
+    cache_ttls=tools.cache_ttls,
+    tool_classes=tools.cache_classes,
+)
 
 
-        else:
-            print("Waiting for the Assistant to process...")
-            time.sleep(5)
+#-------------------------------------------------------------------------------------------------#
+#----Function to make Assistants API call (blocking and asyncio)----------------------------------#
+#-------------------------------------------------------------------------------------------------#
+
+def process_llm_request(question: str, use_cache: bool = True):
+    return assistant_engine.process_llm_request(question, assistant_config, use_cache)
+
+
+async def process_llm_request_async(question: str, use_cache: bool = True):
+    return await assistant_engine.process_llm_request_async(question, assistant_config, use_cache)
+
+
+# Follow-up questions of the same user continue one thread (sessions.py)
+def process_session_request(question: str, user_id: str = "console"):
+    return sessions.ask(question, assistant_config, user_id)
+
+
+async def process_session_request_async(question: str, user_id: str = "console"):
+    return await sessions.ask_async(question, assistant_config, user_id)
+
+
+# Streamed answers: StreamEvents with text deltas as they arrive (streaming.py)
+def stream_llm_request(question: str):
+    return streaming.stream_llm_request(question, assistant_config)
+
+
+def stream_llm_request_async(question: str):
+    return streaming.stream_llm_request_async(question, assistant_config)
+
+
+def stream_session_request(question: str, user_id: str = "console"):
+    return sessions.stream(question, assistant_config, user_id)
+
+
+def stream_session_request_async(question: str, user_id: str = "console"):
+    return sessions.stream_async(question, assistant_config, user_id)
+
+
+# Everything the first question would otherwise set up: client, assistant, connections
+WARM_UP_ENDPOINTS = [
+    ("search", os.getenv("AZURE_SEARCH_SERVICE_ENDPOINT")),
+    ("embeddings", os.getenv("AZURE_OPENAI_ENDPOINT")),
+]
+
+
+def warm_up():
+    return assistant_engine.warm_up(assistant_config, WARM_UP_ENDPOINTS)
+
+
+async def warm_up_async():
+    return await assistant_engine.warm_up_async(assistant_config, WARM_UP_ENDPOINTS)
 
 
 #--------------------------------------END------------------------------------------------------#
 
 
 #--------------------------------------Main loop------------------------------------------------------#
-while True:
-    # Get user input and display text in green color
-    user_input = input("\033[92mEnter user question: \033[0m")
+def main():
+    timings = warm_up()
+    print(f"\033[90mReady ({', '.join(f'{step} {seconds:.2f}s' for step, seconds in timings.items())})\033[0m")
+    while True:
+        # Get user input and display text in green color
+        user_input = input("\033[92mEnter user question: \033[0m")
 
-    if user_input == '':
-        user_input = """Can you please provide me customer information for phone number 123-456-7890,
+        if user_input == '':
+            user_input = """Can you please provide me customer information for phone number 123-456-7890,
         promotions available for the same customer,
         if customer need to qualify an address for 5G service?"""
-        print("Using the default question:")
-        print(user_input)
+            print("Using the default question:")
+            print(user_input)
+
+        if user_input == 'exit': # Exit the loop if user enters 'exit' or CTRL-C
+            break
+
+        if user_input == 'new': # Start a new conversation thread
+            sessions.session_store.end(sessions.session_key(assistant_config, "console"))
+            continue
+
+        streaming.print_stream(stream_session_request(user_input))
+    print("Goodbye!")
 
-    if user_input == 'exit': # Exit the loop if user enters 'exit' or CTRL-C
-        break
 
-    response = process_llm_request(user_input)
-    print(response)
-print("Goodbye!")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
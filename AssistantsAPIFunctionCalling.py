@@ -1,244 +1,188 @@
-import openai
-from openai import AzureOpenAI, BadRequestError
-import time
-import json
-from yfinance import Ticker
-import requests, os
+import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Local modules read their settings from the environment at import time
+import assistant_engine
+import sessions
+import streaming
+import fx_rates
+import news
+import stock_quotes
+import tool_registry
+from typing import Union
+
+
+# Tools are declared once: the schema, dispatch table and limits all come from these decorators
+tools = tool_registry.ToolRegistry()
+
 
 #-------------------------------------------------------------------------------------------------#
 #function description: get_stock_price
 #-------------------------------------------------------------------------------------------------#
 
-def get_stock_price(symbol: str) -> float:
-    stock = Ticker(symbol)
-    price = stock.history(period="1d")['Close'].iloc[-1]
-    return price
+@tools.register(timeout=15, cache_ttl=60, cache_class="market", concurrency=4)
+def get_stock_price(symbol: Union[str, list[str]]):
+    """Retrieve the latest closing price of one or more stocks using their ticker symbols
+
+    symbol: The ticker symbol of the stock, or a list of ticker symbols
+    """
+    # One ticker returns its price; a list returns {symbol: price} from a single bulk download
+    symbols = [symbol] if isinstance(symbol, str) else list(symbol)
+    prices = stock_quotes.get_prices(symbols)
+
+    if isinstance(symbol, str):
+        price = prices[symbols[0].strip().upper()]
+        if isinstance(price, Exception):
+            raise price
+        return price
+
+    return {
+        ticker: {"error": str(price)} if isinstance(price, Exception) else price
+        for ticker, price in prices.items()
+    }
 
 
 #-------------------------------------------------------------------------------------------------#
 #function description: get_latest_company_news
 #-------------------------------------------------------------------------------------------------#
-def get_latest_company_news(company_name):
-    response = call_bing(company_name)
-    return response['news']
+@tools.register(timeout=10, cache_ttl=news.NEWS_CACHE_TTL, cache_class="news", concurrency=8, max_output_chars=4000)
+def get_latest_company_news(company_name: str):
+    """Fetches the latest news articles related to a specified company
 
+    company_name: The name of the company
+    """
+    # Title, date, source, url and a short description per story, deduplicated and cached per company
+    return news.latest_news(company_name)
 
-def call_bing(query):
-    subscription_key = os.getenv("BING_SEARCH_KEY")
-    endpoint = os.getenv('BING_SEARCH_ENDPOINT') 
 
-    # Construct a request
-    mkt = 'en-US'
-    params = { 'q': query, 'mkt': mkt, }
-    headers = { 'Ocp-Apim-Subscription-Key': subscription_key }
+#-------------------------------------------------------------------------------------------------#
+#function description: usd_to_gbp
+#-------------------------------------------------------------------------------------------------#
 
+@tools.register(timeout=10, cache_ttl=300, cache_class="market")
+def usd_to_gbp(usd_amount: Union[float, list[float]]):
+    """Converts an amount in USD to GBP using the current exchange rate
 
-    # Call the API
-    response = requests.get(endpoint, headers=headers, params=params)
-    #response.raise_for_status()
-    
-    if response.status_code == 200:
-        return response.json()
-    else:
-        return []
+    usd_amount: The amount in USD to be converted, or a list of amounts
+    """
+    # One amount or a list of amounts, converted from the cached rate table
+    return fx_rates.convert(usd_amount, "USD", "GBP")
 
 
 #-------------------------------------------------------------------------------------------------#
-#function description: usd_to_gbp
+#function description: convert_currency
 #-------------------------------------------------------------------------------------------------#
 
-def usd_to_gbp(usd_amount):
-    url = "https://api.exchangerate-api.com/v4/latest/USD"
-    try:
-        response = requests.get(url)
-        data = response.json()
-        gbp_rate = data['rates']['GBP']
-        return usd_amount * gbp_rate
-    except Exception as e:
-        return f"Error: {e}"
+@tools.register(timeout=10, cache_ttl=300, cache_class="market")
+def convert_currency(amount: Union[float, list[float]], from_currency: str, to_currency: str):
+    """Converts an amount, or a list of amounts, between two currencies using the current exchange rates
+
+    amount: The amount to be converted, or a list of amounts
+    from_currency: ISO 4217 code of the source currency, e.g. USD
+    to_currency: ISO 4217 code of the target currency, e.g. EUR
+    """
+    return fx_rates.convert(amount, from_currency, to_currency)
 
 
 #-------------------------------------------------------------------------------------------------#
-#function description: process_llm_request
+#----Tool schema, dispatch table and assistant configuration---------------------------------------#
 #-------------------------------------------------------------------------------------------------#
 
-def process_llm_request(question: str):
-
-    tools_list = [
-        {
-            "type": "function",
-            "function": {
-                "name": "get_stock_price",
-                "description": "Retrieve the latest closing price of a stock using its ticker symbol",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "symbol": {
-                            "type": "string",
-                            "description": "The ticker symbol of the stock"
-                        }
-                    },
-                    "required": ["symbol"]
-                }
-            }
-        },
-        {
-            "type": "function",
-            "function": {
-                "name": "get_latest_company_news",
-                "description": "Fetches the latest news articles related to a specified company",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "company_name": {
-                            "type": "string",
-                            "description": "The name of the company"
-                        }
-                    },
-                    "required": ["company_name"]
-                }
-            }
-        },
-        {
-            "type": "function",
-            "function": {
-                "name": "usd_to_gbp",
-                "description": "Converts an amount in USD to GBP using the current exchange rate",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "usd_amount": {
-                            "type": "number",
-                            "description": "The amount in USD to be converted"
-                        }
-                    },
-                    "required": ["usd_amount"]
-                }
-            }
-        }
-    ]
-
-    # Initialize the client
-    client = AzureOpenAI(
-        api_key=os.getenv("AZURE_OPENAI_KEY"),
-        api_version=os.getenv("AZURE_OPENAI_VERSION"),
-        azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT")
-    )
-
-    # Step 1: Create an Assistant
-    assistant = client.beta.assistants.create(
-        name="Data Analyst Assistant",
-        instructions="You are a personal Data Analyst Assistant",
-        model="gpt-35-turbo-16k",
-        tools=tools_list,
-    )
-
-    # Step 2: Create a Thread
-    thread = client.beta.threads.create()
-
-    # Step 3: Add a Message to a Thread
-    message = client.beta.threads.messages.create(
-        thread_id=thread.id,
-        role="user",
-        content= question
-    )
-
-    # Step 4: Run the Assistant
-    run = client.beta.threads.runs.create(
-        thread_id=thread.id,
-        assistant_id=assistant.id,
-        instructions="Please address the user as Bot."
-    )
-
-    # print(run.model_dump_json(indent=4))
-
-    # Define a dispatch table
-    function_dispatch_table = {
-        "get_stock_price": get_stock_price,
-        "get_latest_company_news": get_latest_company_news,
-        "usd_to_gbp": usd_to_gbp
-    }
+tools_list = tools.tools_list
+function_dispatch_table = tools.dispatch_table
+
+assistant_config = assistant_engine.AssistantConfig(
+    name="Data Analyst Assistant",
+    instructions="You are a personal Data Analyst Assistant",
+    model="gpt-35-turbo-16k",
+    tools=tools_list,
+    functions=function_dispatch_table,
+    timeouts=tools.timeouts,
+    cache_ttls=tools.cache_ttls,
+    tool_classes=tools.cache_classes,
+)
+
+
+#-------------------------------------------------------------------------------------------------#
+#function description: process_llm_request / process_llm_request_async
+#-------------------------------------------------------------------------------------------------#
+
+def process_llm_request(question: str, use_cache: bool = True):
+    return assistant_engine.process_llm_request(question, assistant_config, use_cache)
+
+
+async def process_llm_request_async(question: str, use_cache: bool = True):
+    return await assistant_engine.process_llm_request_async(question, assistant_config, use_cache)
+
+
+# Follow-up questions of the same user continue one thread (sessions.py)
+def process_session_request(question: str, user_id: str = "console"):
+    return sessions.ask(question, assistant_config, user_id)
+
 
+async def process_session_request_async(question: str, user_id: str = "console"):
+    return await sessions.ask_async(question, assistant_config, user_id)
+
+
+# Streamed answers: StreamEvents with text deltas as they arrive (streaming.py)
+def stream_llm_request(question: str):
+    return streaming.stream_llm_request(question, assistant_config)
+
+
+def stream_llm_request_async(question: str):
+    return streaming.stream_llm_request_async(question, assistant_config)
+
+
+def stream_session_request(question: str, user_id: str = "console"):
+    return sessions.stream(question, assistant_config, user_id)
+
+
+def stream_session_request_async(question: str, user_id: str = "console"):
+    return sessions.stream_async(question, assistant_config, user_id)
+
+
+# Everything the first question would otherwise set up: client, assistant, connections, the
+# yfinance import and the exchange rate table
+WARM_UP_ENDPOINTS = [("bing", os.getenv("BING_SEARCH_ENDPOINT"))]
+WARM_UP_PRELOAD = [stock_quotes.yfinance_module, fx_rates.rate_cache.rates]
+
+
+def warm_up():
+    return assistant_engine.warm_up(assistant_config, WARM_UP_ENDPOINTS, WARM_UP_PRELOAD)
+
+
+async def warm_up_async():
+    return await assistant_engine.warm_up_async(assistant_config, WARM_UP_ENDPOINTS, WARM_UP_PRELOAD)
+
+
+def main():
+    timings = warm_up()
+    print(f"\033[90mReady ({', '.join(f'{step} {seconds:.2f}s' for step, seconds in timings.items())})\033[0m")
     while True:
-        # Wait for 5 seconds
-        time.sleep(5)
-
-        # Retrieve the run status
-        run_status = client.beta.threads.runs.retrieve(
-            thread_id=thread.id,
-            run_id=run.id
-        )
-        #print(run_status.model_dump_json(indent=4))
-
-        # If run is completed, get messages
-        if run_status.status == 'completed':
-            messages = client.beta.threads.messages.list(
-                thread_id=thread.id
-            )
-
-            # Loop through messages and print content based on role
-            for msg in messages.data:
-                role = msg.role
-                content = msg.content[0].text.value
-                #print(f"{role.capitalize()}: {content}")
-                if role == 'assistant': 
-                    return content
-            break
-        elif run_status.status == 'requires_action':
-            required_actions = run_status.required_action.submit_tool_outputs.model_dump()
-            #print(required_actions)
-            tools_output = []
-
-            for action in required_actions["tool_calls"]:
-                func_name = action["function"]["name"]
-                arguments = json.loads(action["function"]["arguments"])
-
-                print(f"\033[93mFunction: {func_name}, Arguments: {arguments}\033[0m")
-
-                func = function_dispatch_table.get(func_name)
-                if func:
-                    result = func(**arguments)
-                    # Ensure the output is a JSON string
-                    output = json.dumps(result) if not isinstance(result, str) else result
-                    tools_output.append({
-                        "tool_call_id": action["id"],
-                        "output": output
-                    })
-                else:
-                    print(f"Function {func_name} not found")
-
-            # Submit the tool outputs to Assistant API
-            client.beta.threads.runs.submit_tool_outputs(
-                thread_id=thread.id,
-                run_id=run.id,
-                tool_outputs=tools_output
-            )
-
-
-        else:
-            print("Waiting for the Assistant to process...")
-            time.sleep(5)
-
-while True:
-    # Get user input and display text in green color
-
-    user_input = input("\033[92mEnter your question: \033[0m")
+        # Get user input and display text in green color
+
+        user_input = input("\033[92mEnter your question: \033[0m")
     
-    #Use default question if user input is empty
-    if user_input == '':
-        user_input = """Can you please provide me stock price,
+        #Use default question if user input is empty
+        if user_input == '':
+            user_input = """Can you please provide me stock price,
         stock price in GBP,
         and the latest company news of Microsoft?"""
-        print("Using the default question:")
-        print(user_input)
+            print("Using the default question:")
+            print(user_input)
+
+        if user_input == 'exit':
+            break
+
+        if user_input == 'new': # Start a new conversation thread
+            sessions.session_store.end(sessions.session_key(assistant_config, "console"))
+            continue
+
+        streaming.print_stream(stream_session_request(user_input))
+    print("Goodbye!")
 
-    if user_input == 'exit':
-        break
 
-    response = process_llm_request(user_input)
-    print(response)
-print("Goodbye!")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
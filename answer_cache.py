@@ -0,0 +1,206 @@
+import os
+import re
+import time
+import threading
+from collections import Counter, OrderedDict
+from dataclasses import dataclass, field
+
+import http_transport
+from embedding_cache import embedding_cache, normalize_query
+
+
+#-------------------------------------------------------------------------------------------------#
+#----Semantic answer cache in front of process_llm_request: a question close enough to one---------#
+#----answered before gets the earlier answer without an assistant run. How long an answer is-------#
+#----kept depends on the tools that produced it (market data: minutes, KB answers: hours).---------#
+#----Template questions about different entities ("stock price of Microsoft" / "... of Apple")---#
+#----embed almost identically, so a similar question only matches when its numbers and names do.-#
+#-------------------------------------------------------------------------------------------------#
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))     # cosine similarity for a hit
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000"))   # per assistant
+# Questions are compared by embedding when a deployment is configured, by normalized text otherwise
+ANSWER_CACHE_EMBEDDING_MODEL = os.getenv("ANSWER_CACHE_EMBEDDING_MODEL", os.getenv("AZURE_OPENAI_EMBEDDING_MODEL", ""))
+
+# Seconds an answer is kept, by the class of the tools the run called; the shortest one wins.
+# 0 never caches (account-specific answers). "none" covers runs that called no tool.
+ANSWER_CACHE_TTLS = {
+    "market": 300,
+    "news": 900,
+    "kb": 6 * 3600,
+    "account": 0,
+    "none": 3600,
+    "default": 600,     # tools without a class
+}
+
+# ANSWER_CACHE_TTL_<CLASS>=seconds overrides a class, e.g. ANSWER_CACHE_TTL_MARKET=60
+for _name in list(ANSWER_CACHE_TTLS):
+    _value = os.getenv(f"ANSWER_CACHE_TTL_{_name.upper()}")
+    if _value:
+        ANSWER_CACHE_TTLS[_name] = float(_value)
+
+
+NUMBER = re.compile(r"\d+(?:[.,]\d+)*")
+NAME = re.compile(r"[A-Za-z][\w&'-]*")
+SENTENCE_START = re.compile(r"(?<=[.!?])\s+")
+SENTENCE_OPENERS = set("""
+    a about also an and are at but by can compare convert could did do does find for from get give hello hey hi how how's
+    i i'd i'm if in is it it's list may me might my no now of ok okay on or please shall should show so
+    tell thanks thank that that's the then there there's this to was were what what's whats when where
+    which who who's whose why will with would yes
+""".split())
+
+
+def question_entities(question: str):
+    # Numbers and capitalized names, the parts a template question changes. None for an all
+    # lower case question: its names cannot be told apart, so it only matches by exact text.
+    if question == question.lower() and not NUMBER.search(question):
+        return None
+    entities = {number.replace(",", "") for number in NUMBER.findall(question)}
+    if question != question.lower():
+        for sentence in SENTENCE_START.split(question.strip()):
+            for index, word in enumerate(NAME.findall(sentence)):
+                # The first word of a sentence is capitalized anyway: common openers are not names
+                if word[0].isupper() and word != "I" and (index > 0 or word.lower() not in SENTENCE_OPENERS):
+                    entities.add(word.lower().removesuffix("'s"))
+    return tuple(sorted(entities))
+
+
+def answer_ttl(tools_called, tool_classes: dict) -> float:
+    if not tools_called:
+        return ANSWER_CACHE_TTLS["none"]
+    classes = {tool_classes.get(name, "default") for name in tools_called}
+    return min(ANSWER_CACHE_TTLS.get(name, ANSWER_CACHE_TTLS["default"]) for name in classes)
+
+
+def embed_question(question: str):
+    # Unit vector for the question, or None when no embeddings deployment is configured
+    if not ANSWER_CACHE_EMBEDDING_MODEL:
+        return None
+    vector = embedding_cache.get(question, ANSWER_CACHE_EMBEDDING_MODEL)
+    if vector is None:
+        endpoint = os.getenv("AZURE_OPENAI_ENDPOINT")
+        response = http_transport.post(
+            f"{endpoint}/openai/deployments/{ANSWER_CACHE_EMBEDDING_MODEL}/embeddings?api-version={os.getenv('AZURE_OPENAI_VERSION')}",
+            service="embeddings",
+            json={"input": question},
+            headers={"Content-Type": "application/json", "api-key": os.getenv("AZURE_OPENAI_KEY")},
+        )
+        if response.status_code != 200:
+            raise Exception(f"failed to get embedding: {response.text}")
+        vector = response.json()["data"][0]["embedding"]
+        embedding_cache.put(question, ANSWER_CACHE_EMBEDDING_MODEL, vector)
+    # numpy is only needed once an embedding model is configured, so it is not imported with the module
+    import numpy as np
+    vector = np.asarray(vector, dtype=np.float32)
+    return vector / (np.linalg.norm(vector) or 1.0)
+
+
+@dataclass
+class CacheEntry:
+    question: str
+    answer: str
+    vector: object          # unit vector, or None when matched by normalized text
+    expires_at: float
+    latency: float          # seconds the original run took
+    entities: tuple = None  # question_entities(); None matches by normalized text only
+
+
+@dataclass
+class CacheLookup:
+    question: str
+    namespace: str
+    key: str                # normalized question
+    vector: object = None
+    entities: tuple = None
+    answer: str = None      # set on a hit
+    similarity: float = 0.0
+    started: float = field(default_factory=time.monotonic)
+
+
+#-------------------------------------------------------------------------------------------------#
+#----AnswerCache: one list of answers per assistant (namespace), searched by cosine similarity----#
+#-------------------------------------------------------------------------------------------------#
+
+class AnswerCache:
+    def __init__(self, threshold: float = ANSWER_CACHE_THRESHOLD, max_entries: int = ANSWER_CACHE_MAX_ENTRIES,
+                 embed=embed_question):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.embed = embed
+        self.counters = Counter()
+        self.latency_saved = 0.0
+        self._entries = {}      # namespace -> OrderedDict(key -> CacheEntry), oldest first
+        self._lock = threading.Lock()
+
+    def lookup(self, question: str, namespace: str, bypass: bool = False) -> CacheLookup:
+        lookup = CacheLookup(question, namespace, normalize_query(question), entities=question_entities(question))
+        try:
+            lookup.vector = self.embed(question)
+        except Exception as e:
+            # Without a vector the question can still match, and be stored, by its exact text
+            print(f"Answer cache embedding failed: {e}")
+
+        if bypass:
+            self.counters["bypassed"] += 1
+            return lookup
+
+        now = time.time()
+        with self._lock:
+            entries = self._entries.get(namespace, {})
+            entry = entries.get(lookup.key)
+            similarity = 1.0
+            if (entry is None or entry.expires_at <= now) and lookup.vector is not None and lookup.entities is not None:
+                entry, similarity = self.nearest(entries, lookup.vector, lookup.entities, now)
+            if entry is not None and entry.expires_at > now and similarity >= self.threshold:
+                self.counters["hits"] += 1
+                self.latency_saved += max(entry.latency - (time.monotonic() - lookup.started), 0.0)
+                lookup.answer, lookup.similarity = entry.answer, similarity
+                return lookup
+
+        self.counters["misses"] += 1
+        return lookup
+
+    def nearest(self, entries, vector, entities: tuple, now: float):
+        # Only answers to questions about the same numbers and names are candidates
+        candidates = [entry for entry in entries.values()
+                      if entry.vector is not None and entry.entities == entities and entry.expires_at > now]
+        if not candidates:
+            return None, 0.0
+        import numpy as np   # entries only carry vectors when embed_question ran (and imported it)
+        similarities = np.stack([entry.vector for entry in candidates]) @ vector
+        best = int(np.argmax(similarities))
+        return candidates[best], float(similarities[best])
+
+    def store(self, lookup: CacheLookup, answer, ttl: float):
+        if not answer or ttl <= 0 or answer.startswith("Error:"):
+            return
+        now = time.time()
+        entry = CacheEntry(lookup.question, answer, lookup.vector, now + ttl, time.monotonic() - lookup.started, lookup.entities)
+        with self._lock:
+            entries = self._entries.setdefault(lookup.namespace, OrderedDict())
+            entries.pop(lookup.key, None)
+            entries[lookup.key] = entry
+            for key in [key for key, old in entries.items() if old.expires_at <= now]:
+                del entries[key]
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+                self.counters["evictions"] += 1
+            self.counters["stores"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        stats = dict(self.counters)
+        lookups = stats.get("hits", 0) + stats.get("misses", 0)
+        stats["hit_rate"] = stats.get("hits", 0) / lookups if lookups else 0.0
+        stats["latency_saved_seconds"] = round(self.latency_saved, 3)
+        with self._lock:
+            stats["entries"] = sum(len(entries) for entries in self._entries.values())
+        return stats
+
+
+answer_cache = AnswerCache()
@@ -0,0 +1,412 @@
+import os
+import time
+import asyncio
+import weakref
+from collections import Counter
+from dataclasses import dataclass, field
+
+from openai import NotFoundError
+
+import telemetry
+import run_waiter
+import tool_executor
+import tool_prefetch
+import http_transport
+import assistant_registry
+from answer_cache import answer_cache, answer_ttl, ANSWER_CACHE_ENABLED
+
+
+#-------------------------------------------------------------------------------------------------#
+#----Assistant engine: create thread -> run -> tool dispatch -> submit, sync and asyncio----------#
+#-------------------------------------------------------------------------------------------------#
+
+# Conversations one event loop keeps in flight at the same time (process_llm_request_async)
+MAX_CONCURRENT_CONVERSATIONS = int(os.getenv("MAX_CONCURRENT_CONVERSATIONS", "200"))
+
+
+@dataclass
+class AssistantConfig:
+    name: str
+    instructions: str
+    model: str
+    tools: list
+    functions: dict                                 # function name -> python callable
+    timeouts: dict = field(default_factory=dict)    # function name -> seconds
+    cache_ttls: dict = field(default_factory=dict)  # function name -> seconds to reuse its output, absent = never
+    run_instructions: str = "Please address the user as Bot."
+    tool_classes: dict = field(default_factory=dict)  # function name -> answer cache class (answer_cache.ANSWER_CACHE_TTLS)
+
+
+@dataclass
+class RunTrace:
+    tools_called: set = field(default_factory=set)
+    tool_errors: int = 0
+    tool_cache_events: list = field(default_factory=list)   # (function name, "hit" | "shared" | "prefetched")
+    prefetch: tool_prefetch.RunPrefetch = field(default_factory=tool_prefetch.RunPrefetch)
+
+    def record(self, tool_calls, tools_output):
+        self.tools_called.update(action["function"]["name"] for action in tool_calls)
+        self.tool_errors += sum(tool_executor.is_error_output(output["output"]) for output in tools_output)
+
+    def cache_counts(self, since: int) -> dict:
+        # Tool span attributes for the outputs reused since the step began (events[since:])
+        sources = Counter(source for _, source in self.tool_cache_events[since:])
+        return {"cache_hits": sources["hit"], "cache_shared": sources["shared"], "prefetched": sources["prefetched"]}
+
+    def cache_ttl(self, config: AssistantConfig) -> float:
+        # Answers built on failed tool calls are not worth repeating
+        return 0 if self.tool_errors else answer_ttl(self.tools_called, config.tool_classes)
+
+
+def run_error(run_status) -> str:
+    # failed, cancelled, expired or incomplete: the run will not produce an answer
+    error = run_status.last_error.message if run_status.last_error else "no answer produced"
+    return f"Error: run {run_status.status}: {error}"
+
+
+def record_wait(span, run_status, run_wait):
+    telemetry.bind(run_id=run_status.id)
+    span.set(status=run_status.status, wait_mode=run_wait.mode, polls=run_wait.polls)
+
+
+def output_bytes(tools_output) -> int:
+    return sum(len(output["output"]) for output in tools_output)
+
+
+def first_assistant_message(messages):
+    # Loop through messages (newest first) and return the latest assistant response
+    for msg in messages.data:
+        if msg.role == 'assistant':
+            return msg.content[0].text.value
+    return None
+
+
+#-------------------------------------------------------------------------------------------------#
+#function description: process_llm_request
+#   use_cache=False skips the answer cache lookup for this request; the fresh answer is still
+#   stored for the next one.
+#-------------------------------------------------------------------------------------------------#
+
+def process_llm_request(question: str, config: AssistantConfig, use_cache: bool = True):
+    telemetry.start_conversation(assistant=config.name)
+    with telemetry.span("conversation"):
+        if not ANSWER_CACHE_ENABLED:
+            return run_conversation(question, config, RunTrace())
+
+        with telemetry.span("answer_cache.lookup") as span:
+            lookup = answer_cache.lookup(question, config.name, bypass=not use_cache)
+            span.set(hit=lookup.answer is not None)
+        if lookup.answer is not None:
+            print(f"\033[90mAnswer cache hit (similarity {lookup.similarity:.3f})\033[0m")
+            return lookup.answer
+
+        trace = RunTrace()
+        answer = run_conversation(question, config, trace)
+        answer_cache.store(lookup, answer, trace.cache_ttl(config))
+        return answer
+
+
+def run_conversation(question: str, config: AssistantConfig, trace: RunTrace):
+
+    # Reuse the process-wide client
+    client = assistant_registry.get_client()
+
+    # Step 1: Get the Assistant (created once, then reused from the registry cache)
+    with telemetry.span("assistants.get"):
+        assistant_id = assistant_registry.get_assistant_id(
+            name=config.name,
+            instructions=config.instructions,
+            model=config.model,
+            tools=config.tools,
+        )
+
+    # Step 2: Create a Thread
+    with telemetry.span("threads.create"):
+        thread = client.beta.threads.create()
+    telemetry.bind(thread_id=thread.id)
+
+    # Step 3: Add a Message to a Thread
+    with telemetry.span("messages.create", payload_bytes=len(question)):
+        client.beta.threads.messages.create(
+            thread_id=thread.id,
+            role="user",
+            content=question
+        )
+
+    try:
+        # Step 4: Run the Assistant, calling the requested functions until it finishes
+        run_status = drive_run(client, thread.id, assistant_id, config, trace)
+    except run_waiter.RunTimeoutError as e:
+        return f"Error: {e}"
+
+    if run_status.status != 'completed':
+        return run_error(run_status)
+
+    with telemetry.span("messages.list") as span:
+        messages = client.beta.threads.messages.list(thread_id=thread.id)
+        answer = first_assistant_message(messages)
+        span.set(payload_bytes=len(answer or ""))
+    return answer
+
+
+#-------------------------------------------------------------------------------------------------#
+#function description: drive_run
+#   Creates a run on the thread and answers its requires_action steps until it settles.
+#   run_options go to runs.create (truncation_strategy, max_prompt_tokens, ...).
+#   Returns the terminal run; raises run_waiter.RunTimeoutError past the deadline.
+#-------------------------------------------------------------------------------------------------#
+
+def replacement_assistant(assistant_id: str, config: AssistantConfig) -> str:
+    # Called on a NotFoundError from runs.create: a new assistant id if the old one was deleted,
+    # None when the assistant still exists
+    return assistant_registry.replace_missing_assistant(
+        assistant_id,
+        name=config.name,
+        instructions=config.instructions,
+        model=config.model,
+        tools=config.tools,
+    )
+
+
+def drive_run(client, thread_id: str, assistant_id: str, config: AssistantConfig, trace: RunTrace, **run_options):
+    def start(assistant_id):
+        return run_waiter.create_run(
+            client,
+            thread_id=thread_id,
+            assistant_id=assistant_id,
+            instructions=config.run_instructions,
+            **run_options
+        )
+
+    with telemetry.span("runs.create") as span:
+        try:
+            run_status, run_wait = start(assistant_id)
+        except NotFoundError:
+            # The assistant may have been deleted after it was verified: recreate it once
+            assistant_id = replacement_assistant(assistant_id, config)
+            if assistant_id is None:
+                raise
+            run_status, run_wait = start(assistant_id)
+        record_wait(span, run_status, run_wait)
+
+    while True:
+        print(f"\033[90mRun {run_status.status} ({run_wait.describe()})\033[0m")
+
+        if run_status.status != 'requires_action':
+            return run_status
+
+        # Call all the requested functions at once; failures come back as error outputs
+        required_actions = run_status.required_action.submit_tool_outputs.model_dump()
+        with telemetry.span("tools", tool_calls=len(required_actions["tool_calls"])) as span:
+            step_events = len(trace.tool_cache_events)
+            tools_output = tool_executor.execute_tool_calls(
+                required_actions["tool_calls"],
+                config.functions,
+                timeouts=config.timeouts,
+                cache_ttls=config.cache_ttls,
+                cache_events=trace.tool_cache_events,
+                prefetch=trace.prefetch
+            )
+            span.set(payload_bytes=output_bytes(tools_output), **trace.cache_counts(step_events))
+        trace.record(required_actions["tool_calls"], tools_output)
+
+        # Submit the tool outputs to Assistant API and wait for the next step
+        with telemetry.span("runs.submit_tool_outputs") as span:
+            run_status, run_wait = run_waiter.submit_tool_outputs(
+                client,
+                thread_id=thread_id,
+                run_id=run_status.id,
+                tool_outputs=tools_output
+            )
+            record_wait(span, run_status, run_wait)
+
+
+#-------------------------------------------------------------------------------------------------#
+#function description: process_llm_request_async
+#   Same cycle on AsyncAzureOpenAI. Blocking tools run on the tool executor's pool, and at most
+#   MAX_CONCURRENT_CONVERSATIONS requests per event loop are in flight at once.
+#-------------------------------------------------------------------------------------------------#
+
+_semaphores = weakref.WeakKeyDictionary()
+
+
+def conversation_slots():
+    loop = asyncio.get_running_loop()
+    if loop not in _semaphores:
+        _semaphores[loop] = asyncio.Semaphore(MAX_CONCURRENT_CONVERSATIONS)
+    return _semaphores[loop]
+
+
+async def process_llm_request_async(question: str, config: AssistantConfig, use_cache: bool = True):
+    telemetry.start_conversation(assistant=config.name)
+    with telemetry.span("conversation"):
+        if not ANSWER_CACHE_ENABLED:
+            return await run_conversation_async(question, config, RunTrace())
+
+        # The cache lookup embeds the question with a blocking HTTP call
+        with telemetry.span("answer_cache.lookup") as span:
+            lookup = await asyncio.to_thread(answer_cache.lookup, question, config.name, not use_cache)
+            span.set(hit=lookup.answer is not None)
+        if lookup.answer is not None:
+            return lookup.answer
+
+        trace = RunTrace()
+        answer = await run_conversation_async(question, config, trace)
+        answer_cache.store(lookup, answer, trace.cache_ttl(config))
+        return answer
+
+
+async def run_conversation_async(question: str, config: AssistantConfig, trace: RunTrace):
+    async with conversation_slots():
+        client = assistant_registry.get_async_client()
+
+        # The registry is synchronous; after the first call per process this returns from memory
+        with telemetry.span("assistants.get"):
+            assistant_id = await asyncio.to_thread(
+                assistant_registry.get_assistant_id,
+                name=config.name,
+                instructions=config.instructions,
+                model=config.model,
+                tools=config.tools,
+            )
+
+        with telemetry.span("threads.create"):
+            thread = await client.beta.threads.create()
+        telemetry.bind(thread_id=thread.id)
+
+        with telemetry.span("messages.create", payload_bytes=len(question)):
+            await client.beta.threads.messages.create(
+                thread_id=thread.id,
+                role="user",
+                content=question
+            )
+
+        try:
+            run_status = await drive_run_async(client, thread.id, assistant_id, config, trace)
+        except run_waiter.RunTimeoutError as e:
+            return f"Error: {e}"
+
+        if run_status.status != 'completed':
+            return run_error(run_status)
+
+        with telemetry.span("messages.list") as span:
+            messages = await client.beta.threads.messages.list(thread_id=thread.id)
+            answer = first_assistant_message(messages)
+            span.set(payload_bytes=len(answer or ""))
+        return answer
+
+
+async def drive_run_async(client, thread_id: str, assistant_id: str, config: AssistantConfig, trace: RunTrace, **run_options):
+    def start(assistant_id):
+        return run_waiter.create_run_async(
+            client,
+            thread_id=thread_id,
+            assistant_id=assistant_id,
+            instructions=config.run_instructions,
+            **run_options
+        )
+
+    with telemetry.span("runs.create") as span:
+        try:
+            run_status, run_wait = await start(assistant_id)
+        except NotFoundError:
+            assistant_id = await asyncio.to_thread(replacement_assistant, assistant_id, config)
+            if assistant_id is None:
+                raise
+            run_status, run_wait = await start(assistant_id)
+        record_wait(span, run_status, run_wait)
+
+    while True:
+        if run_status.status != 'requires_action':
+            return run_status
+
+        required_actions = run_status.required_action.submit_tool_outputs.model_dump()
+        with telemetry.span("tools", tool_calls=len(required_actions["tool_calls"])) as span:
+            step_events = len(trace.tool_cache_events)
+            tools_output = await tool_executor.execute_tool_calls_async(
+                required_actions["tool_calls"],
+                config.functions,
+                timeouts=config.timeouts,
+                cache_ttls=config.cache_ttls,
+                cache_events=trace.tool_cache_events,
+                prefetch=trace.prefetch
+            )
+            span.set(payload_bytes=output_bytes(tools_output), **trace.cache_counts(step_events))
+        trace.record(required_actions["tool_calls"], tools_output)
+
+        with telemetry.span("runs.submit_tool_outputs") as span:
+            run_status, run_wait = await run_waiter.submit_tool_outputs_async(
+                client,
+                thread_id=thread_id,
+                run_id=run_status.id,
+                tool_outputs=tools_output
+            )
+            record_wait(span, run_status, run_wait)
+
+
+#-------------------------------------------------------------------------------------------------#
+#function description: warm_up / warm_up_async
+#   Pays the first question's setup before it arrives: the OpenAI client, the assistant (created
+#   or verified), a pooled connection to the service, keep-alive connections to the tool
+#   endpoints ((service, url) pairs) and any preload callables (lazy imports, reference data).
+#   Returns seconds per step. The async client's connections belong to one event loop, so
+#   warm_up_async runs on the loop that will serve the questions.
+#-------------------------------------------------------------------------------------------------#
+
+def warm_up(config: AssistantConfig, endpoints=(), preload=()) -> dict:
+    # Only the assistant is required; every other step is best effort, like preconnect, so a down
+    # tool backend fails its own tool calls rather than the start of the process. A failed step
+    # is timed as "<step>_failed".
+    timings = {}
+    started = time.perf_counter()
+
+    def lap(name):
+        nonlocal started
+        timings[name] = round(time.perf_counter() - started, 3)
+        started = time.perf_counter()
+
+    def attempt(name, step):
+        try:
+            step()
+        except Exception as e:
+            print(f"Warm-up step {name} failed: {e}")
+            name += "_failed"
+        lap(name)
+
+    client = assistant_registry.get_client()
+    lap("client")
+    assistant_id = assistant_registry.get_assistant_id(
+        name=config.name,
+        instructions=config.instructions,
+        model=config.model,
+        tools=config.tools,
+    )
+    lap("assistant")
+    attempt("connection", lambda: client.beta.assistants.retrieve(assistant_id))
+    for service, url in endpoints:
+        if url:
+            http_transport.preconnect(url, service)
+    lap("endpoints")
+    for func in preload:
+        attempt(getattr(func, "__name__", "preload"), func)
+    return timings
+
+
+async def warm_up_async(config: AssistantConfig, endpoints=(), preload=()) -> dict:
+    timings = await asyncio.to_thread(warm_up, config, endpoints, preload)
+    started = time.perf_counter()
+    client = assistant_registry.get_async_client()
+    assistant_id = assistant_registry.get_assistant_id(
+        name=config.name,
+        instructions=config.instructions,
+        model=config.model,
+        tools=config.tools,
+    )
+    step = "async_connection"
+    try:
+        await client.beta.assistants.retrieve(assistant_id)
+    except Exception as e:
+        print(f"Warm-up step {step} failed: {e}")
+        step += "_failed"
+    timings[step] = round(time.perf_counter() - started, 3)
+    return timings
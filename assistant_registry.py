@@ -0,0 +1,253 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import threading
+
+from openai import AzureOpenAI, AsyncAzureOpenAI, NotFoundError, DefaultHttpxClient, DefaultAsyncHttpxClient
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import telemetry
+import rate_limiter
+
+
+#-------------------------------------------------------------------------------------------------#
+#----Process-wide registry: one long-lived client and cached assistant IDs------------------------#
+#-------------------------------------------------------------------------------------------------#
+
+# Assistant IDs keyed by a hash of model, instructions and tool schema, kept across restarts
+ASSISTANT_CACHE_PATH = os.getenv("ASSISTANT_CACHE_PATH", ".assistants.json")
+
+_lock = threading.RLock()
+_client = None
+_async_client = None
+_cache = None
+_verified = set()   # keys whose assistant was confirmed to exist in this process
+
+
+def get_client():
+    global _client
+    with _lock:
+        if _client is None:
+            _client = AzureOpenAI(
+                api_key=os.getenv("AZURE_OPENAI_KEY"),
+                api_version=os.getenv("AZURE_OPENAI_VERSION"),
+                azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+                # Every request, polls and SDK retries included, goes through the "openai" limiter
+                http_client=DefaultHttpxClient(transport=rate_limiter.LimitedTransport("openai"))
+                if rate_limiter.RATE_LIMIT_ENABLED else None,
+            )
+        return _client
+
+
+def get_async_client():
+    global _async_client
+    with _lock:
+        if _async_client is None:
+            _async_client = AsyncAzureOpenAI(
+                api_key=os.getenv("AZURE_OPENAI_KEY"),
+                api_version=os.getenv("AZURE_OPENAI_VERSION"),
+                azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+                http_client=DefaultAsyncHttpxClient(transport=rate_limiter.AsyncLimitedTransport("openai"))
+                if rate_limiter.RATE_LIMIT_ENABLED else None,
+            )
+        return _async_client
+
+
+# (model, instructions, id(tools)) -> (tools, key). The tools list of an assistant is built once
+# (tool_registry.py) and passed on every request, so its schema is serialized and hashed only once.
+_keys = {}
+
+
+def assistant_key(model: str, instructions: str, tools) -> str:
+    memo = _keys.get((model, instructions, id(tools)))
+    if memo is not None and memo[0] is tools:
+        return memo[1]
+    payload = json.dumps({"model": model, "instructions": instructions, "tools": tools}, sort_keys=True)
+    key = hashlib.sha256(payload.encode()).hexdigest()
+    _keys[(model, instructions, id(tools))] = (tools, key)
+    return key
+
+
+def load_cache() -> dict:
+    try:
+        with open(ASSISTANT_CACHE_PATH) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_cache(cache: dict, removed: dict = None):
+    # Merge with what other processes wrote since we loaded, then replace the file atomically.
+    # removed: key -> assistant id dropped here; kept when another process already replaced it.
+    merged = load_cache()
+    merged.update(cache)
+    for key, assistant_id in (removed or {}).items():
+        if merged.get(key, {}).get("id") == assistant_id:
+            del merged[key]
+    tmp_path = f"{ASSISTANT_CACHE_PATH}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(merged, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, ASSISTANT_CACHE_PATH)
+    return merged
+
+
+#-------------------------------------------------------------------------------------------------#
+#function description: get_assistant_id - cached assistant for this name, model, instructions and tools
+#   The first use in a process checks the cached assistant still exists; after that it is free.
+#-------------------------------------------------------------------------------------------------#
+
+def get_assistant_id(name: str, instructions: str, model: str, tools) -> str:
+    global _cache
+    key = assistant_key(model, instructions, tools)
+
+    with _lock:
+        if _cache is None:
+            _cache = load_cache()
+
+        entry = _cache.get(key)
+        if entry and key in _verified:
+            return entry["id"]
+
+        client = get_client()
+        if entry:
+            try:
+                with telemetry.span("assistants.retrieve"):
+                    client.beta.assistants.retrieve(entry["id"])
+                _verified.add(key)
+                return entry["id"]
+            except NotFoundError:
+                pass
+
+        with telemetry.span("assistants.create"):
+            assistant = client.beta.assistants.create(
+                name=name,
+                instructions=instructions,
+                model=model,
+                tools=tools,
+                metadata={"registry_key": key}
+            )
+        _cache[key] = {"id": assistant.id, "name": name, "model": model, "created_at": assistant.created_at}
+        _cache = save_cache(_cache)
+        _verified.add(key)
+        return assistant.id
+
+
+#-------------------------------------------------------------------------------------------------#
+#function description: replace_missing_assistant - after a NotFoundError from runs.create
+#   A verified assistant can still be deleted later (a cleanup run from another host). When the
+#   assistant is really gone it is dropped from the cache and created again; None means it still
+#   exists, so the missing resource was the thread or the run and the caller re-raises.
+#-------------------------------------------------------------------------------------------------#
+
+def forget_assistant(assistant_id: str):
+    global _cache
+    with _lock:
+        if _cache is None:
+            _cache = load_cache()
+        removed = {key: assistant_id for key, entry in _cache.items() if entry["id"] == assistant_id}
+        for key in removed:
+            _verified.discard(key)
+            del _cache[key]
+        if removed:
+            _cache = save_cache(_cache, removed)
+
+
+def replace_missing_assistant(assistant_id: str, name: str, instructions: str, model: str, tools):
+    try:
+        with telemetry.span("assistants.retrieve"):
+            get_client().beta.assistants.retrieve(assistant_id)
+        return None
+    except NotFoundError:
+        pass
+    print(f"Assistant {assistant_id} no longer exists; creating it again")
+    forget_assistant(assistant_id)
+    return get_assistant_id(name, instructions, model, tools)
+
+
+#-------------------------------------------------------------------------------------------------#
+#function description: cleanup_assistants - delete assistants the registry no longer points at
+#   Registry-created assistants whose registry_key is superseded, and any assistant with one of the
+#   given names, count as candidates, unless they are in the cache or younger than older_than_hours.
+#   Several hosts share one resource, each with its own cache file, so an assistant whose key is
+#   still current is kept even when this host's cache does not know its id.
+#-------------------------------------------------------------------------------------------------#
+
+def list_assistants(client):
+    after = None
+    while True:
+        page = client.beta.assistants.list(limit=100, order="asc", after=after) if after else \
+            client.beta.assistants.list(limit=100, order="asc")
+        yield from page.data
+        if not page.has_more or not page.data:
+            break
+        after = page.data[-1].id
+
+
+def current_keys() -> set:
+    # Registry keys of the assistants the scripts in this tree would use now
+    import assistants
+    keys = set()
+    for script in sorted(assistants.SCRIPTS):
+        config = assistants.load(script).assistant_config
+        keys.add(assistant_key(config.model, config.instructions, config.tools))
+    return keys
+
+
+def cleanup_assistants(names=(), older_than_hours: float = 24, dry_run: bool = False, keep_keys=None):
+    client = get_client()
+    cache = load_cache()
+    in_use = {entry["id"] for entry in cache.values()}
+    keep_keys = set(cache) | (current_keys() if keep_keys is None else set(keep_keys))
+    cutoff = time.time() - older_than_hours * 3600
+
+    def candidate(assistant):
+        key = (assistant.metadata or {}).get("registry_key")
+        if key:
+            return key not in keep_keys
+        return assistant.name in names
+
+    stale = [
+        assistant for assistant in list_assistants(client)
+        if assistant.id not in in_use
+        and assistant.created_at < cutoff
+        and candidate(assistant)
+    ]
+
+    for assistant in stale:
+        print(f"{'Would delete' if dry_run else 'Deleting'} {assistant.id} ({assistant.name})")
+        if not dry_run:
+            try:
+                client.beta.assistants.delete(assistant.id)
+            except NotFoundError:
+                pass
+    return stale
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage the cached assistants")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("list", help="show the cached assistants")
+
+    cleanup = commands.add_parser("cleanup", help="delete superseded assistants that are no longer cached")
+    cleanup.add_argument("--name", action="append", default=[],
+                         help="also treat assistants with this name as candidates (repeatable)")
+    cleanup.add_argument("--older-than-hours", type=float, default=24)
+    cleanup.add_argument("--dry-run", action="store_true")
+
+    args = parser.parse_args(argv)
+    if args.command == "list":
+        for key, entry in sorted(load_cache().items(), key=lambda item: item[1]["created_at"]):
+            print(f"{entry['id']}  {entry['name']}  {entry['model']}  {key[:12]}")
+    else:
+        stale = cleanup_assistants(args.name, args.older_than_hours, args.dry_run)
+        print(f"{len(stale)} stale assistant(s)")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,50 @@
+import os
+import sys
+import argparse
+import threading
+import importlib.util
+
+
+#-------------------------------------------------------------------------------------------------#
+#----Importable entry point for both assistants---------------------------------------------------#
+#----   import assistants                                                                         #
+#----   app = assistants.load("stock")       # AssistantsAPIFunctionCalling.py, loaded once         #
+#----   app.warm_up()                                                                             #
+#----   app.process_llm_request("What is the stock price of Microsoft?")                          #
+#----   python assistants.py rag             # the interactive loop of the RAG assistant           #
+#----Importing this module is cheap: a script (and the OpenAI SDK) loads on the first load().------#
+#-------------------------------------------------------------------------------------------------#
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+SCRIPTS = {
+    "stock": "AssistantsAPIFunctionCalling.py",
+    "rag": "AssistantsAPIFunctionCalling-RAG.py",
+}
+
+_lock = threading.Lock()
+_loaded = {}
+
+
+def load(name: str):
+    # The script names are not valid module names (RAG has a dash), so they are loaded by path
+    with _lock:
+        if name not in _loaded:
+            module_name = f"assistants_{name}"
+            spec = importlib.util.spec_from_file_location(module_name, os.path.join(ROOT, SCRIPTS[name]))
+            module = importlib.util.module_from_spec(spec)
+            sys.modules[module_name] = module
+            spec.loader.exec_module(module)
+            _loaded[name] = module
+        return _loaded[name]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Interactive assistant")
+    parser.add_argument("script", nargs="?", choices=sorted(SCRIPTS), default="stock")
+    args = parser.parse_args(argv)
+    load(args.script).main()
+
+
+if __name__ == "__main__":
+    main()
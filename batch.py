@@ -0,0 +1,190 @@
+import os
+import sys
+import time
+import json
+import asyncio
+import argparse
+
+import assistants
+import rate_limiter
+
+
+#-------------------------------------------------------------------------------------------------#
+#----Batch mode: answer a JSONL file of questions with bounded concurrency------------------------#
+#----   python batch.py questions.jsonl answers.jsonl --script stock --concurrency 16--------------#
+#----Each input line is {"id": ..., "question": ...} (id defaults to the line number) or a bare----#
+#----JSON string. One result line is appended per question as soon as it finishes; a line that---#
+#----is not valid JSON or has no question gets an error result like a failed answer. The output--#
+#----file is the checkpoint: a rerun with the same output skips the lines already answered.-------#
+#-------------------------------------------------------------------------------------------------#
+
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "16"))   # questions in flight at once
+BATCH_PROGRESS_EVERY = int(os.getenv("BATCH_PROGRESS_EVERY", "100"))
+
+
+class LineSet:
+    # Line numbers already answered: everything below `contiguous`, plus the ones finished
+    # out of order above it. Lines that never get an answer (blank input lines, errors to retry)
+    # are still settled so `contiguous` moves past them; `retry` keeps the ones to answer again.
+    # Stays small however long the file is.
+    def __init__(self):
+        self.contiguous = 0
+        self.above = set()
+        self.retry = set()
+
+    def add(self, line: int, answered: bool = True):
+        if answered:
+            self.retry.discard(line)
+        else:
+            self.retry.add(line)
+        if line >= self.contiguous:
+            self.above.add(line)
+        while self.contiguous in self.above:
+            self.above.remove(self.contiguous)
+            self.contiguous += 1
+
+    def __contains__(self, line: int):
+        return (line < self.contiguous or line in self.above) and line not in self.retry
+
+
+def blank_lines(input_path: str):
+    with open(input_path) as f:
+        for line, text in enumerate(f):
+            if not text.strip():
+                yield line
+
+
+def answered_lines(output_path: str, retry_errors: bool, input_path: str = None) -> LineSet:
+    done = LineSet()
+    if not os.path.exists(output_path):
+        return done
+    # Blank input lines have no result line; settle them first so they do not stall `contiguous`
+    for line in blank_lines(input_path) if input_path else ():
+        done.add(line)
+    with open(output_path) as f:
+        for text in f:
+            try:
+                record = json.loads(text)
+            except json.JSONDecodeError:
+                continue    # a line cut short when the last job was interrupted
+            done.add(record["line"], answered=not (retry_errors and record.get("error")))
+    return done
+
+
+def open_output(output_path: str):
+    f = open(output_path, "a+")
+    # Start on a new line after a partial line left by an interrupted job
+    if f.tell() > 0:
+        f.seek(f.tell() - 1)
+        if f.read(1) != "\n":
+            f.write("\n")
+    return f
+
+
+def read_questions(input_path: str, question_field: str, id_field: str):
+    # (line, id, question, error): a line that cannot be read is answered with its error
+    with open(input_path) as f:
+        for line, text in enumerate(f):
+            if not text.strip():
+                continue
+            try:
+                item = json.loads(text)
+                question_id, question = (line, item) if isinstance(item, str) else (item.get(id_field, line), item[question_field])
+            except (ValueError, KeyError, TypeError, AttributeError) as e:
+                yield line, line, None, f"Invalid input line: {type(e).__name__}: {e}"
+                continue
+            yield line, question_id, question, None
+
+
+#-------------------------------------------------------------------------------------------------#
+#function description: run_batch
+#   A reader fills a bounded queue from the input file; `concurrency` workers answer with
+#   process_llm_request_async and append each result to the output as it finishes.
+#-------------------------------------------------------------------------------------------------#
+
+async def answer_line(module, line, question_id, question, error, use_cache: bool) -> dict:
+    started = time.time()
+    t0 = time.perf_counter()
+    result = None
+    try:
+        if error is None:
+            result = await module.process_llm_request_async(question, use_cache)
+            error = result[len("Error: "):] if isinstance(result, str) and result.startswith("Error: ") else None
+    except Exception as e:
+        result, error = None, f"{type(e).__name__}: {e}"
+    return {
+        "line": line,
+        "id": question_id,
+        "question": question,
+        "answer": None if error else result,
+        "error": error,
+        "started_at": started,
+        "seconds": round(time.perf_counter() - t0, 3),
+    }
+
+
+async def run_batch(module, input_path: str, output_path: str, concurrency: int = BATCH_CONCURRENCY,
+                    question_field: str = "question", id_field: str = "id", use_cache: bool = True,
+                    retry_errors: bool = False) -> dict:
+    # Interactive questions in the same process go first (rate_limiter.py)
+    rate_limiter.set_priority(rate_limiter.BATCH)
+    done = answered_lines(output_path, retry_errors, input_path)
+    if hasattr(module, "warm_up_async"):
+        await module.warm_up_async()
+    queue = asyncio.Queue(maxsize=concurrency * 2)
+    stats = {"answered": 0, "errors": 0, "skipped": 0}
+    started = time.perf_counter()
+
+    async def reader():
+        for line, question_id, question, error in read_questions(input_path, question_field, id_field):
+            if line in done:
+                stats["skipped"] += 1
+                continue
+            await queue.put((line, question_id, question, error))
+        for _ in range(concurrency):
+            await queue.put(None)
+
+    async def worker(output):
+        while (item := await queue.get()) is not None:
+            record = await answer_line(module, *item, use_cache)
+            output.write(json.dumps(record) + "\n")
+            output.flush()
+            stats["answered"] += 1
+            stats["errors"] += record["error"] is not None
+            if stats["answered"] % BATCH_PROGRESS_EVERY == 0:
+                elapsed = time.perf_counter() - started
+                print(f"{stats['answered']} answered ({stats['errors']} errors), "
+                      f"{stats['answered'] / elapsed:.1f} questions/s", file=sys.stderr)
+
+    with open_output(output_path) as output:
+        await asyncio.gather(reader(), *[worker(output) for _ in range(concurrency)])
+    stats["seconds"] = round(time.perf_counter() - started, 3)
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Answer a JSONL file of questions; rerun to resume")
+    parser.add_argument("input", help="JSONL with one question per line")
+    parser.add_argument("output", help="JSONL the results are appended to, also the resume checkpoint")
+    parser.add_argument("--script", choices=sorted(assistants.SCRIPTS), default="stock")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY)
+    parser.add_argument("--question-field", default="question")
+    parser.add_argument("--id-field", default="id")
+    parser.add_argument("--no-cache", action="store_true", help="bypass the answer cache")
+    parser.add_argument("--retry-errors", action="store_true",
+                        help="answer again the lines whose earlier result was an error (the new result is appended)")
+    args = parser.parse_args(argv)
+
+    module = assistants.load(args.script)
+    try:
+        stats = asyncio.run(run_batch(module, args.input, args.output, args.concurrency, args.question_field,
+                                      args.id_field, not args.no_cache, args.retry_errors))
+    except KeyboardInterrupt:
+        print("Interrupted; rerun the same command to resume", file=sys.stderr)
+        return 130
+    print(json.dumps(stats))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
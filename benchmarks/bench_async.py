@@ -0,0 +1,129 @@
+import os
+import sys
+import time
+import json
+import asyncio
+import argparse
+import contextlib
+import tempfile
+import dataclasses
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import mock_server
+
+
+#-------------------------------------------------------------------------------------------------#
+#----Questions per second: blocking process_llm_request vs process_llm_request_async--------------#
+#----against the local mock server. The tools are replaced by fakes with a fixed latency.---------#
+#-------------------------------------------------------------------------------------------------#
+
+SCRIPTS = {
+    "stock": "AssistantsAPIFunctionCalling.py",
+    "rag": "AssistantsAPIFunctionCalling-RAG.py",
+}
+
+FAKE_RESULTS = {
+    "get_stock_price": 415.5,
+    "get_latest_company_news": [{"name": "mock headline"}],
+    "usd_to_gbp": 328.25,
+    "get_customer_information": {"name": "John Doe", "account_number": "000099998888"},
+    "get_promotions": {"free_hulu_service": True},
+    "get_answer_from_kb": "Mock knowledge base content",
+}
+
+
+def load_script(name):
+    # The script names are not valid module names (RAG has a dash), so load them by path
+    path = os.path.join(ROOT, SCRIPTS[name])
+    spec = importlib.util.spec_from_file_location(f"bench_{name}", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def fake_tools(names, latency):
+    def make(name):
+        def tool(**kwargs):
+            time.sleep(latency)
+            return FAKE_RESULTS.get(name, "ok")
+        return tool
+    return {name: make(name) for name in names}
+
+
+def run_sync(module, config, questions, concurrency):
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        answers = list(pool.map(lambda question: module.assistant_engine.process_llm_request(question, config), questions))
+    return time.perf_counter() - started, answers
+
+
+def run_async(module, config, questions):
+    async def main():
+        started = time.perf_counter()
+        answers = await asyncio.gather(*[
+            module.assistant_engine.process_llm_request_async(question, config) for question in questions
+        ])
+        return time.perf_counter() - started, answers
+    return asyncio.run(main())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Questions per second, blocking vs asyncio engine")
+    parser.add_argument("--script", choices=sorted(SCRIPTS), default="stock")
+    parser.add_argument("--questions", type=int, default=200)
+    parser.add_argument("--sync-concurrency", type=int, default=1,
+                        help="worker threads for the blocking engine (1 = the original one-at-a-time loop)")
+    parser.add_argument("--tool-latency", type=float, default=0.05)
+    parser.add_argument("--mock-url", help="use an already running mock_server.py instead of an in-process one")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    mock_server.add_server_arguments(parser)
+    args = parser.parse_args(argv)
+
+    url = args.mock_url
+    if not url:
+        server, url = mock_server.start_server(**mock_server.server_options(args))
+
+    os.environ.update(
+        AZURE_OPENAI_ENDPOINT=url,
+        AZURE_OPENAI_KEY="mock",
+        AZURE_OPENAI_VERSION=os.getenv("AZURE_OPENAI_VERSION", "2024-05-01-preview"),
+        ASSISTANT_CACHE_PATH=os.path.join(tempfile.mkdtemp(), "assistants.json"),
+    )
+
+    module = load_script(args.script)
+    config = dataclasses.replace(
+        module.assistant_config,
+        functions=fake_tools(module.assistant_config.functions, args.tool_latency)
+    )
+    questions = [f"Benchmark question {index}" for index in range(args.questions)]
+
+    # The engine prints every run step and function call; keep the benchmark output readable
+    with contextlib.redirect_stdout(open(os.devnull, "w")):
+        # One warm-up request resolves the assistant and opens the connections
+        module.assistant_engine.process_llm_request(questions[0], config)
+        sync_seconds, _ = run_sync(module, config, questions, args.sync_concurrency)
+        async_seconds, answers = run_async(module, config, questions)
+    failed = sum(1 for answer in answers if not answer or answer.startswith("Error"))
+
+    results = {
+        "script": args.script,
+        "questions": args.questions,
+        "sync": {"concurrency": args.sync_concurrency, "seconds": sync_seconds,
+                 "questions_per_second": args.questions / sync_seconds},
+        "async": {"concurrency_limit": module.assistant_engine.MAX_CONCURRENT_CONVERSATIONS,
+                  "seconds": async_seconds, "questions_per_second": args.questions / async_seconds,
+                  "failed": failed},
+    }
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    main()
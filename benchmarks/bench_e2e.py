@@ -0,0 +1,307 @@
+import os
+import sys
+import math
+import time
+import json
+import asyncio
+import argparse
+import tempfile
+import threading
+import contextlib
+import subprocess
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import mock_server
+from bench_async import SCRIPTS, load_script
+
+
+#-------------------------------------------------------------------------------------------------#
+#----End-to-end benchmark: both scripts against the local mock server, with their real tools------#
+#----(Bing, quotes, FX, embeddings and search all go to the mock). Reports p50/p95/p99 per phase,-#
+#----throughput and requests per mock endpoint, and compares against an earlier JSON result.-----#
+#-------------------------------------------------------------------------------------------------#
+
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(sorted_values, p):
+    # Nearest rank
+    return sorted_values[max(0, min(len(sorted_values) - 1, math.ceil(p / 100 * len(sorted_values)) - 1))]
+
+
+class PhaseRecorder:
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def add(self, phase, seconds):
+        with self._lock:
+            self.samples[phase].append(seconds)
+
+    def reset(self):
+        with self._lock:
+            self.samples.clear()
+
+    def timed(self, phase, func):
+        if asyncio.iscoroutinefunction(func):
+            async def timed_async(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    self.add(phase, time.perf_counter() - started)
+            return timed_async
+
+        def timed_sync(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.add(phase, time.perf_counter() - started)
+        return timed_sync
+
+    def summary(self):
+        with self._lock:
+            samples = {phase: sorted(values) for phase, values in self.samples.items()}
+        return {
+            phase: dict(
+                count=len(values),
+                mean_ms=round(1000 * sum(values) / len(values), 3),
+                max_ms=round(1000 * values[-1], 3),
+                **{f"p{p}_ms": round(1000 * percentile(values, p), 3) for p in PERCENTILES},
+            )
+            for phase, values in sorted(samples.items())
+        }
+
+
+#-------------------------------------------------------------------------------------------------#
+#----Instrumentation: the engine calls these through their modules, so wrapping the module--------#
+#----attributes (and the client's resource methods) times every phase without touching the code.--#
+#-------------------------------------------------------------------------------------------------#
+
+def instrument(recorder, module):
+    engine = module.assistant_engine
+    wrapped = [
+        (engine.assistant_registry, "get_assistant_id", "assistant"),
+        (engine.run_waiter, "create_run", "run.create"),
+        (engine.run_waiter, "create_run_async", "run.create"),
+        (engine.run_waiter, "submit_tool_outputs", "run.submit"),
+        (engine.run_waiter, "submit_tool_outputs_async", "run.submit"),
+        (engine.tool_executor, "execute_tool_calls", "tools"),
+        (engine.tool_executor, "execute_tool_calls_async", "tools"),
+        (engine.answer_cache, "lookup", "answer_cache"),
+    ]
+    for client in (engine.assistant_registry.get_client(), engine.assistant_registry.get_async_client()):
+        wrapped += [
+            (client.beta.threads, "create", "thread.create"),
+            (client.beta.threads.messages, "create", "message.create"),
+            (client.beta.threads.messages, "list", "messages.list"),
+        ]
+
+    originals = []
+    for owner, name, phase in wrapped:
+        original = getattr(owner, name)
+        originals.append((owner, name, original))
+        setattr(owner, name, recorder.timed(phase, original))
+
+    config = module.assistant_config
+    functions = {name: recorder.timed(f"tool.{name}", func) for name, func in config.functions.items()}
+    originals.append((config, "functions", config.functions))
+    config.functions = functions
+    return originals
+
+
+def uninstrument(originals):
+    for owner, name, original in reversed(originals):
+        setattr(owner, name, original)
+
+
+def point_tools_at_mock(url):
+    # yfinance cannot be redirected, so quotes are downloaded from the mock's /quotes endpoint
+    import stock_quotes
+    import http_transport
+
+    def download(symbols):
+        return http_transport.get(f"{url}/quotes", params={"symbols": ",".join(symbols)}).json()
+
+    stock_quotes.quote_service.download = download
+
+
+#-------------------------------------------------------------------------------------------------#
+#----Drivers--------------------------------------------------------------------------------------#
+#-------------------------------------------------------------------------------------------------#
+
+def drive_sync(module, recorder, questions, concurrency):
+    def ask(question):
+        started = time.perf_counter()
+        try:
+            return module.process_llm_request(question)
+        finally:
+            recorder.add("total", time.perf_counter() - started)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(ask, questions))
+
+
+# One loop for every script: the process-wide async client keeps its connections on the loop it started on
+_loop = None
+
+
+def drive_async(module, recorder, questions, concurrency):
+    global _loop
+    _loop = _loop or asyncio.new_event_loop()
+
+    async def main():
+        slots = asyncio.Semaphore(concurrency)
+
+        async def ask(question):
+            async with slots:
+                started = time.perf_counter()
+                try:
+                    return await module.process_llm_request_async(question)
+                finally:
+                    recorder.add("total", time.perf_counter() - started)
+
+        return await asyncio.gather(*[ask(question) for question in questions])
+    return _loop.run_until_complete(main())
+
+
+def mock_request(url, method="GET", path="/_stats"):
+    import http_transport
+    return http_transport.request(method, f"{url}{path}").json()
+
+
+def bench_script(name, url, args):
+    import http_transport
+    module = load_script(name)
+    recorder = PhaseRecorder()
+    questions = [f"Benchmark question {index} for {name}" for index in range(args.questions)]
+    drive = drive_async if args.mode == "async" else drive_sync
+
+    with contextlib.redirect_stdout(open(os.devnull, "w")):
+        # Warm-up outside the measurement: resolves the assistant, opens connections (and fills the caches
+        # with --with-caches)
+        module.process_llm_request(f"Warm-up question for {name}")
+        originals = instrument(recorder, module)
+        try:
+            mock_request(url, "POST", "/_reset")
+            started = time.perf_counter()
+            answers = drive(module, recorder, questions, args.concurrency)
+            seconds = time.perf_counter() - started
+        finally:
+            uninstrument(originals)
+
+    return {
+        "mode": args.mode,
+        "questions": args.questions,
+        "concurrency": args.concurrency,
+        "seconds": round(seconds, 3),
+        "throughput_qps": round(args.questions / seconds, 3),
+        "failed": sum(1 for answer in answers if not answer or answer.startswith("Error")),
+        "phases": recorder.summary(),
+        "endpoints": mock_request(url)["requests"],
+        "hedges": http_transport.hedge_stats(),
+    }
+
+
+#-------------------------------------------------------------------------------------------------#
+#----Regression check against an earlier result file----------------------------------------------#
+#-------------------------------------------------------------------------------------------------#
+
+def compare(baseline, results, tolerance, floor_ms):
+    regressions = []
+    for name, result in results["scripts"].items():
+        before = baseline.get("scripts", {}).get(name)
+        if not before:
+            continue
+        if result["throughput_qps"] < before["throughput_qps"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {before['throughput_qps']} -> {result['throughput_qps']} q/s")
+        for phase, stats in result["phases"].items():
+            old = before["phases"].get(phase)
+            if not old:
+                continue
+            for key in ("p50_ms", "p95_ms"):
+                if stats[key] > old[key] * (1 + tolerance) and stats[key] - old[key] > floor_ms:
+                    regressions.append(f"{name}: {phase} {key} {old[key]} -> {stats[key]}")
+    return regressions
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="End-to-end latency per phase against the local mock server")
+    parser.add_argument("--script", choices=sorted(SCRIPTS) + ["all"], default="all")
+    parser.add_argument("--mode", choices=["sync", "async"], default="sync")
+    parser.add_argument("--questions", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--with-caches", action="store_true",
+                        help="keep the answer, tool result, embedding, news, quote and exchange rate caches on "
+                             "(every question after the first would be a hit)")
+    parser.add_argument("--mock-url", help="use an already running mock_server.py instead of an in-process one")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", help="earlier --output file; exits with 1 when a phase or throughput regressed")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative slowdown against the baseline")
+    parser.add_argument("--floor-ms", type=float, default=2.0, help="ignore slowdowns smaller than this")
+    mock_server.add_server_arguments(parser)
+    args = parser.parse_args(argv)
+
+    url = args.mock_url
+    if not url:
+        server, url = mock_server.start_server(**mock_server.server_options(args))
+
+    # The modules read these at import time, so they are set before the scripts are loaded
+    os.environ.update(
+        AZURE_OPENAI_ENDPOINT=url,
+        AZURE_OPENAI_KEY="mock",
+        AZURE_OPENAI_VERSION=os.getenv("AZURE_OPENAI_VERSION", "2024-05-01-preview"),
+        AZURE_OPENAI_EMBEDDING_MODEL="embeddings",
+        AZURE_SEARCH_SERVICE_ENDPOINT=url,
+        AZURE_SEARCH_ADMIN_KEY="mock",
+        AZURE_SEARCH_INDEX_NAME="kb",
+        AZURE_SEARCH_VERSION="2023-11-01",
+        BING_SEARCH_ENDPOINT=f"{url}/bing",
+        BING_SEARCH_KEY="mock",
+        EXCHANGE_RATE_API_URL=f"{url}/fx/USD",
+        ASSISTANT_CACHE_PATH=os.path.join(tempfile.mkdtemp(), "assistants.json"),
+        EMBEDDING_CACHE_DIR="",
+    )
+    os.environ.pop("LOCAL_KB_INDEX_PATH", None)
+    if not args.with_caches:
+        os.environ.update(ANSWER_CACHE_ENABLED="false", TOOL_CACHE_ENABLED="false", EMBEDDING_CACHE_ENABLED="false",
+                          NEWS_CACHE_TTL_SECONDS="0", NEWS_COALESCE_ENABLED="false", STOCK_QUOTE_TTL_SECONDS="0",
+                          FX_RATES_TTL_SECONDS="0", FX_RATES_MAX_STALE_SECONDS="0")
+    point_tools_at_mock(url)
+
+    names = sorted(SCRIPTS) if args.script == "all" else [args.script]
+    results = {
+        "commit": git_commit(),
+        "settings": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+        "scripts": {name: bench_script(name, url, args) for name in names},
+    }
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(json.load(f), results, args.tolerance, args.floor_ms)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+import os
+import sys
+import json
+import tempfile
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import mock_server
+
+
+#-------------------------------------------------------------------------------------------------#
+#----Startup cost: import time, warm_up() and the first questions, each run in a fresh process----#
+#----against the local mock server, with and without warm_up() before the first question.---------#
+#-------------------------------------------------------------------------------------------------#
+
+SCRIPTS = ("stock", "rag")
+
+# Runs in the child process: timings of one cold start, printed as JSON
+CHILD = """
+import sys, json, time
+started = time.perf_counter()
+sys.path[:0] = [{root!r}, {benchmarks!r}]
+import assistants
+app = assistants.load({script!r})
+timings = {{"import_s": time.perf_counter() - started}}
+import bench_e2e
+bench_e2e.point_tools_at_mock({url!r})
+if {warm_up!r}:
+    started = time.perf_counter()
+    app.warm_up()
+    timings["warm_up_s"] = time.perf_counter() - started
+for name in ("first_question_s", "second_question_s"):
+    started = time.perf_counter()
+    app.process_llm_request("What is the stock price of Microsoft?", use_cache=False)
+    timings[name] = time.perf_counter() - started
+print(json.dumps({{key: round(value, 3) for key, value in timings.items()}}))
+"""
+
+
+def cold_start(script, url, warm_up, env):
+    code = CHILD.format(root=ROOT, benchmarks=os.path.dirname(os.path.abspath(__file__)), script=script,
+                        url=url, warm_up=warm_up)
+    # Every child starts with an empty assistant cache, as a fresh deployment would
+    env = dict(env, ASSISTANT_CACHE_PATH=os.path.join(tempfile.mkdtemp(), "assistants.json"))
+    output = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def median_timings(runs):
+    return {key: sorted(run[key] for run in runs)[len(runs) // 2] for key in runs[0]}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cold start cost against the local mock server")
+    parser.add_argument("--script", choices=list(SCRIPTS) + ["all"], default="all")
+    parser.add_argument("--repeat", type=int, default=5, help="cold starts per case; the median is reported")
+    parser.add_argument("--mock-url", help="use an already running mock_server.py instead of an in-process one")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    mock_server.add_server_arguments(parser)
+    args = parser.parse_args(argv)
+
+    url = args.mock_url
+    if not url:
+        server, url = mock_server.start_server(**mock_server.server_options(args))
+
+    env = dict(
+        os.environ,
+        AZURE_OPENAI_ENDPOINT=url,
+        AZURE_OPENAI_KEY="mock",
+        AZURE_OPENAI_VERSION=os.getenv("AZURE_OPENAI_VERSION", "2024-05-01-preview"),
+        AZURE_OPENAI_EMBEDDING_MODEL="embeddings",
+        AZURE_SEARCH_SERVICE_ENDPOINT=url,
+        AZURE_SEARCH_ADMIN_KEY="mock",
+        AZURE_SEARCH_INDEX_NAME="kb",
+        AZURE_SEARCH_VERSION="2023-11-01",
+        BING_SEARCH_ENDPOINT=f"{url}/bing",
+        BING_SEARCH_KEY="mock",
+        EXCHANGE_RATE_API_URL=f"{url}/fx/USD",
+        EMBEDDING_CACHE_DIR="",
+        ANSWER_CACHE_ENABLED="false",
+        SESSION_STORE_PATH="",
+    )
+    env.pop("LOCAL_KB_INDEX_PATH", None)
+
+    names = SCRIPTS if args.script == "all" else [args.script]
+    results = {
+        name: {
+            case: median_timings([cold_start(name, url, warm_up, env) for _ in range(args.repeat)])
+            for case, warm_up in (("cold", False), ("warm_up", True))
+        }
+        for name in names
+    }
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,526 @@
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+
+#-------------------------------------------------------------------------------------------------#
+#----Local stand-in for the Assistants API (threads, messages, runs, submit_tool_outputs)---------#
+#-------------------------------------------------------------------------------------------------#
+
+# Scripted requires_action sequences, picked by the first matching tool the assistant declares.
+# Every step but the last is a batch of tool calls; the last step is the final answer.
+DEFAULT_SCENARIOS = {
+    "get_stock_price": [
+        [
+            {"name": "get_stock_price", "arguments": {"symbol": "MSFT"}},
+            {"name": "get_latest_company_news", "arguments": {"company_name": "Microsoft"}},
+        ],
+        [
+            {"name": "usd_to_gbp", "arguments": {"usd_amount": 415.5}},
+        ],
+        "Bot, Microsoft (MSFT) last closed at $415.50 (about 328.25 GBP). Latest news: mock headline.",
+    ],
+    "get_customer_information": [
+        [
+            {"name": "get_customer_information", "arguments": {"phonenumber": "123-456-7890"}},
+            {"name": "get_answer_from_kb", "arguments": {"question": "how to qualify an address for 5G service"}},
+        ],
+        [
+            {"name": "get_promotions", "arguments": {"account_number": "000099998888"}},
+        ],
+        "Bot, John Doe has free Hulu, $10 off an additional line and a 50 Mbps upgrade. 5G qualification is checked by address.",
+    ],
+}
+
+# Per endpoint latency model: base seconds, uniform jitter, and an occasional spike
+DEFAULT_LATENCY = {"base": 0.0, "jitter": 0.0, "spike_rate": 0.0, "spike": 0.0}
+
+
+class MockState:
+    def __init__(self, scenarios=None, latency=None, run_step_seconds=0.3, quota=0):
+        self.scenarios = scenarios or DEFAULT_SCENARIOS
+        self.latency = latency or {}
+        self.run_step_seconds = run_step_seconds
+        self.quota = quota              # requests per second across all endpoints, 0 = unlimited
+        self.window = (0, 0)            # (second, requests admitted in it)
+        self.lock = threading.RLock()
+        self.counts = Counter()
+        self.assistants = {}
+        self.threads = {}
+        self.runs = {}
+        self.ids = Counter()
+
+    def new_id(self, prefix):
+        with self.lock:
+            self.ids[prefix] += 1
+            return f"{prefix}_{self.ids[prefix]:08d}"
+
+    def delay(self, endpoint):
+        settings = dict(DEFAULT_LATENCY, **self.latency.get(endpoint, {}))
+        seconds = settings["base"] + random.uniform(0, settings["jitter"])
+        if settings["spike_rate"] and random.random() < settings["spike_rate"]:
+            seconds += settings["spike"]
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def admit(self):
+        # Fixed one-second window: (admitted, remaining, seconds until the window resets)
+        now = time.time()
+        with self.lock:
+            second, used = self.window
+            if int(now) != second:
+                second, used = int(now), 0
+            admitted = used < self.quota
+            self.window = (second, used + admitted)
+            return admitted, max(self.quota - used - admitted, 0), second + 1 - now
+
+    def count(self, endpoint):
+        with self.lock:
+            self.counts[endpoint] += 1
+
+    def scenario_for(self, assistant):
+        names = [tool["function"]["name"] for tool in assistant.get("tools", []) if tool.get("type") == "function"]
+        for name in names:
+            if name in self.scenarios:
+                return self.scenarios[name]
+        return ["Bot, this is a mock answer."]
+
+
+#-------------------------------------------------------------------------------------------------#
+#----Run simulation: every step becomes ready run_step_seconds after it was started---------------#
+#-------------------------------------------------------------------------------------------------#
+
+def new_run(state, thread_id, assistant_id, body):
+    now = time.time()
+    run = {
+        "id": state.new_id("run"),
+        "object": "thread.run",
+        "created_at": int(now),
+        "thread_id": thread_id,
+        "assistant_id": assistant_id,
+        "status": "queued",
+        "required_action": None,
+        "last_error": None,
+        "expires_at": int(now) + 600,
+        "started_at": None,
+        "cancelled_at": None,
+        "failed_at": None,
+        "completed_at": None,
+        "incomplete_details": None,
+        "model": "mock",
+        "instructions": body.get("instructions") or "",
+        "tools": state.assistants.get(assistant_id, {}).get("tools", []),
+        "metadata": {},
+        "usage": None,
+        "truncation_strategy": body.get("truncation_strategy") or {"type": "auto", "last_messages": None},
+        "parallel_tool_calls": True,
+        "tool_choice": "auto",
+        "response_format": "auto",
+        "_step": 0,
+        "_ready_at": now + state.run_step_seconds,
+        "_started": now,
+    }
+    state.runs[run["id"]] = run
+    return run
+
+
+def advance_run(state, run):
+    # Moves a queued / in_progress run to its next scripted status once its step is ready
+    with state.lock:
+        if run["status"] not in ("queued", "in_progress"):
+            return run
+        if time.time() < run["_ready_at"]:
+            run["status"] = "in_progress"
+            run["started_at"] = run["started_at"] or int(run["_started"])
+            return run
+
+        scenario = state.scenario_for(state.assistants.get(run["assistant_id"], {}))
+        step = scenario[min(run["_step"], len(scenario) - 1)]
+        run["started_at"] = run["started_at"] or int(run["_started"])
+        if isinstance(step, list):
+            run["status"] = "requires_action"
+            run["required_action"] = {
+                "type": "submit_tool_outputs",
+                "submit_tool_outputs": {"tool_calls": [
+                    {
+                        "id": f"call_{run['id']}_{run['_step']}_{index}",
+                        "type": "function",
+                        "function": {"name": call["name"], "arguments": json.dumps(call["arguments"])},
+                    }
+                    for index, call in enumerate(step)
+                ]},
+            }
+        else:
+            run["status"] = "completed"
+            run["completed_at"] = int(time.time())
+            run["required_action"] = None
+            thread = state.threads[run["thread_id"]]
+            thread["messages"].append(new_message(state, run["thread_id"], "assistant", step, run["id"]))
+        return run
+
+
+def new_message(state, thread_id, role, text, run_id=None):
+    return {
+        "id": state.new_id("msg"),
+        "object": "thread.message",
+        "created_at": int(time.time()),
+        "thread_id": thread_id,
+        "role": role,
+        "content": [{"type": "text", "text": {"value": text, "annotations": []}}],
+        "assistant_id": None,
+        "run_id": run_id,
+        "attachments": [],
+        "metadata": {},
+        "status": "completed",
+    }
+
+
+def public(obj):
+    return {key: value for key, value in obj.items() if not key.startswith("_")}
+
+
+def page(items, query):
+    # Cursor pagination shared by list endpoints: order, limit, after, before
+    order = query.get("order", ["desc"])[0]
+    limit = int(query.get("limit", ["20"])[0])
+    items = list(items) if order == "asc" else list(reversed(items))
+    ids = [item["id"] for item in items]
+    if "after" in query and query["after"][0] in ids:
+        items = items[ids.index(query["after"][0]) + 1:]
+    if "before" in query and query["before"][0] in ids:
+        items = items[:ids.index(query["before"][0])]
+    data = [public(item) for item in items[:limit]]
+    return {
+        "object": "list",
+        "data": data,
+        "first_id": data[0]["id"] if data else None,
+        "last_id": data[-1]["id"] if data else None,
+        "has_more": len(items) > limit,
+    }
+
+
+#-------------------------------------------------------------------------------------------------#
+#----Mock tool endpoints: Bing news, stock quotes, exchange rates, embeddings, Azure Search------#
+#-------------------------------------------------------------------------------------------------#
+
+def mock_embedding(text, dimensions=64):
+    digest = hashlib.sha256(text.lower().encode()).digest()
+    rng = random.Random(digest)
+    return [rng.uniform(-1, 1) for _ in range(dimensions)]
+
+
+def mock_price(symbol):
+    return round(random.Random(symbol).uniform(20, 500), 2)
+
+
+def mock_news(query, count=10):
+    # Web Search shape; every third article is a syndicated copy of the one before it
+    stories = [index - 1 if index % 3 == 2 else index for index in range(count)]
+    return {"_type": "SearchResponse", "news": {"id": "https://api.bing.microsoft.com/api/v7/#News", "value": [
+        {
+            "name": f"{query} headline {story}" + (f" - Provider {index % 3}" if story != index else ""),
+            "url": f"https://news.example.com/{story}" + (f"?syndicated={index}" if story != index else ""),
+            "description": f"Mock story {story} about {query}. " * 8,
+            "datePublished": "2024-01-01T00:00:00.0000000Z",
+            "provider": [{"_type": "Organization", "name": f"Provider {index % 3}",
+                          "image": {"thumbnail": {"contentUrl": "https://img.example.com/p.png"}}}],
+            "image": {"thumbnail": {"contentUrl": "https://img.example.com/t.png", "width": 700, "height": 400}},
+            "category": "Business",
+        }
+        for index, story in zip(range(count), stories)
+    ]}}
+
+
+def mock_search_docs(query, top):
+    rng = random.Random(hashlib.sha256(query.encode()).digest())
+    return [
+        {
+            "@search.score": round(rng.uniform(1, 10), 3),
+            "id": f"doc-{(hash(query) + index) % 50}",
+            "chunk_id": f"chunk-{(hash(query) + index) % 50}",
+            "title": f"KB article {index}",
+            "page_content": f"title: KB article {index}\nMock knowledge base content for {query}. " * 4,
+            "filepath": f"kb/{index}.md",
+            "url": f"https://kb.example.com/{index}",
+        }
+        for index in range(top)
+    ]
+
+
+#-------------------------------------------------------------------------------------------------#
+#----HTTP handler---------------------------------------------------------------------------------#
+#-------------------------------------------------------------------------------------------------#
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    state: MockState = None
+    rate_headers = {}
+
+    def log_message(self, *args):
+        pass
+
+    def send_json(self, payload, status=200):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        for name, value in self.rate_headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}") if length else {}
+
+    def send_events(self, events):
+        self.send_response(200)
+        for name, value in self.rate_headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        for name, data in events:
+            payload = data if isinstance(data, str) else json.dumps(data)
+            self.wfile.write(f"event: {name}\ndata: {payload}\n\n".encode())
+            self.wfile.flush()
+        self.close_connection = True
+
+    def run_events(self, run):
+        # Streams a run from its current step up to the next requires_action or completion
+        yield "thread.run.created" if run["_step"] == 0 else "thread.run.queued", public(run)
+        wait = run["_ready_at"] - time.time()
+        advance_run(self.state, run)
+        yield "thread.run.in_progress", public(run)
+        if wait > 0:
+            time.sleep(wait)
+        advance_run(self.state, run)
+        if run["status"] == "completed":
+            message = self.state.threads[run["thread_id"]]["messages"][-1]
+            text = message["content"][0]["text"]["value"]
+            yield "thread.message.created", dict(public(message), status="in_progress", content=[])
+            for start in range(0, len(text), 16):
+                yield "thread.message.delta", {
+                    "id": message["id"],
+                    "object": "thread.message.delta",
+                    "delta": {"content": [{"index": 0, "type": "text", "text": {"value": text[start:start + 16]}}]},
+                }
+            yield "thread.message.completed", public(message)
+        yield f"thread.run.{run['status']}", public(run)
+        yield "done", "[DONE]"
+
+    def do_GET(self):
+        self.route("GET")
+
+    def do_POST(self):
+        self.route("POST")
+
+    def do_DELETE(self):
+        self.route("DELETE")
+
+    def route(self, method):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        parts = [part for part in url.path.split("/") if part]
+        if parts and parts[0] == "openai":
+            parts = parts[1:]
+        state = self.state
+
+        try:
+            if parts == ["_stats"]:
+                return self.send_json({"requests": dict(state.counts)})
+            if parts == ["_reset"] and method == "POST":
+                with state.lock:
+                    state.counts.clear()
+                return self.send_json({"ok": True})
+            if state.quota:
+                admitted, remaining, reset = state.admit()
+                self.rate_headers = {"x-ratelimit-remaining-requests": str(remaining),
+                                     "x-ratelimit-reset-requests": f"{reset:.3f}s"}
+                if not admitted:
+                    state.count("throttled")
+                    self.rate_headers["Retry-After"] = f"{reset:.3f}"
+                    return self.send_json({"error": {"code": "429", "message": "Rate limit exceeded"}}, 429)
+
+            # Assistants
+            if parts == ["assistants"] and method == "POST":
+                return self.assistant_create(self.read_json())
+            if parts == ["assistants"] and method == "GET":
+                return self.endpoint("assistants.list", lambda: page(list(state.assistants.values()), query))
+            if len(parts) == 2 and parts[0] == "assistants":
+                if parts[1] not in state.assistants:
+                    return self.send_json({"error": {"message": "No assistant found", "code": "not_found"}}, 404)
+                if method == "DELETE":
+                    state.assistants.pop(parts[1], None)
+                    return self.endpoint("assistants.delete", lambda: {"id": parts[1], "object": "assistant.deleted", "deleted": True})
+                return self.endpoint("assistants.retrieve", lambda: public(state.assistants[parts[1]]))
+
+            # Threads and messages
+            if parts == ["threads"] and method == "POST":
+                return self.thread_create(self.read_json())
+            if len(parts) == 3 and parts[0] == "threads" and parts[2] == "messages":
+                thread = state.threads[parts[1]]
+                if method == "POST":
+                    body = self.read_json()
+                    message = new_message(state, parts[1], body.get("role", "user"), body.get("content", ""))
+                    thread["messages"].append(message)
+                    return self.endpoint("messages.create", lambda: public(message))
+                messages = thread["messages"]
+                if "run_id" in query:
+                    messages = [message for message in messages if message["run_id"] == query["run_id"][0]]
+                return self.endpoint("messages.list", lambda: page(messages, query))
+
+            # Runs
+            if len(parts) == 3 and parts[0] == "threads" and parts[2] == "runs" and method == "POST":
+                body = self.read_json()
+                state.count("runs.create")
+                state.delay("runs.create")
+                for message in body.get("additional_messages") or []:
+                    state.threads[parts[1]]["messages"].append(
+                        new_message(state, parts[1], message.get("role", "user"), message.get("content", "")))
+                run = new_run(state, parts[1], body.get("assistant_id"), body)
+                if body.get("stream"):
+                    return self.send_events(self.run_events(run))
+                return self.send_json(public(run))
+            if len(parts) >= 4 and parts[0] == "threads" and parts[2] == "runs":
+                run = state.runs[parts[3]]
+                if len(parts) == 4:
+                    return self.endpoint("runs.retrieve", lambda: public(advance_run(state, run)))
+                if parts[4] == "cancel":
+                    run.update(status="cancelled", cancelled_at=int(time.time()))
+                    return self.endpoint("runs.cancel", lambda: public(run))
+                if parts[4] == "submit_tool_outputs":
+                    body = self.read_json()
+                    state.count("runs.submit_tool_outputs")
+                    state.delay("runs.submit_tool_outputs")
+                    expected = {call["id"] for call in run["required_action"]["submit_tool_outputs"]["tool_calls"]}
+                    submitted = {output["tool_call_id"] for output in body.get("tool_outputs", [])}
+                    if run["status"] != "requires_action" or expected != submitted:
+                        return self.send_json({"error": {"message": "tool outputs do not match the pending tool calls"}}, 400)
+                    run.update(status="queued", required_action=None, _step=run["_step"] + 1,
+                               _ready_at=time.time() + state.run_step_seconds)
+                    if body.get("stream"):
+                        return self.send_events(self.run_events(run))
+                    return self.send_json(public(run))
+
+            # Tool endpoints
+            if parts[:1] == ["bing"]:
+                return self.endpoint("bing", lambda: mock_news(query.get("q", [""])[0]))
+            if parts == ["quotes"]:
+                symbols = [symbol for symbol in query.get("symbols", [""])[0].split(",") if symbol]
+                return self.endpoint("quotes", lambda: {symbol: mock_price(symbol) for symbol in symbols})
+            if parts[:1] == ["fx"]:
+                return self.endpoint("fx", lambda: {"base": "USD", "rates": {"USD": 1.0, "GBP": 0.79, "EUR": 0.92, "JPY": 151.3}})
+            if len(parts) == 3 and parts[0] == "deployments" and parts[2] == "embeddings":
+                body = self.read_json()
+                inputs = body.get("input")
+                inputs = inputs if isinstance(inputs, list) else [inputs]
+                return self.endpoint("embeddings", lambda: {"object": "list", "data": [
+                    {"object": "embedding", "index": index, "embedding": mock_embedding(text)}
+                    for index, text in enumerate(inputs)
+                ]})
+            if len(parts) == 4 and parts[0] == "indexes" and parts[2:] == ["docs", "search"]:
+                body = self.read_json()
+                return self.endpoint("search", lambda: {"value": mock_search_docs(body.get("search", ""), body.get("top", 5))})
+
+            self.send_json({"error": {"message": f"no mock for {method} {url.path}"}}, 404)
+        except KeyError as e:
+            self.send_json({"error": {"message": f"not found: {e}"}}, 404)
+
+    def endpoint(self, name, build):
+        self.state.count(name)
+        self.state.delay(name)
+        return self.send_json(build())
+
+    def assistant_create(self, body):
+        assistant = {
+            "id": self.state.new_id("asst"),
+            "object": "assistant",
+            "created_at": int(time.time()),
+            "name": body.get("name"),
+            "description": None,
+            "model": body.get("model"),
+            "instructions": body.get("instructions"),
+            "tools": body.get("tools", []),
+            "metadata": body.get("metadata") or {},
+        }
+        self.state.assistants[assistant["id"]] = assistant
+        return self.endpoint("assistants.create", lambda: public(assistant))
+
+    def thread_create(self, body):
+        thread = {"id": self.state.new_id("thread"), "object": "thread", "created_at": int(time.time()),
+                  "metadata": {}, "messages": []}
+        for message in body.get("messages") or []:
+            thread["messages"].append(new_message(self.state, thread["id"], message.get("role", "user"), message.get("content", "")))
+        self.state.threads[thread["id"]] = thread
+        return self.endpoint("threads.create", lambda: public(thread))
+
+
+def start_server(host="127.0.0.1", port=0, **state_options):
+    handler = type("Handler", (MockHandler,), {"state": MockState(**state_options)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def parse_latency(latency_args=(), spike_args=()):
+    # --latency NAME=BASE[:JITTER]   --spike NAME=RATE:SECONDS
+    latency = {}
+    for spec in latency_args:
+        name, value = spec.split("=", 1)
+        base, _, jitter = value.partition(":")
+        latency.setdefault(name, {}).update(base=float(base), jitter=float(jitter or 0))
+    for spec in spike_args:
+        name, value = spec.split("=", 1)
+        rate, seconds = value.split(":")
+        latency.setdefault(name, {}).update(spike_rate=float(rate), spike=float(seconds))
+    return latency
+
+
+def add_server_arguments(parser):
+    parser.add_argument("--run-step-seconds", type=float, default=0.3,
+                        help="time the mock takes to produce each run step")
+    parser.add_argument("--latency", action="append", default=[], metavar="NAME=BASE[:JITTER]",
+                        help="extra latency for an endpoint, e.g. runs.create=0.05 or search=0.03:0.02")
+    parser.add_argument("--spike", action="append", default=[], metavar="NAME=RATE:SECONDS",
+                        help="occasional latency spikes, e.g. search=0.02:1.5")
+    parser.add_argument("--scenarios", help="JSON file with scripted requires_action sequences")
+    parser.add_argument("--quota", type=float, default=0,
+                        help="requests per second before the mock answers 429 with Retry-After (0 = unlimited)")
+
+
+def server_options(args):
+    scenarios = None
+    if args.scenarios:
+        with open(args.scenarios) as f:
+            scenarios = json.load(f)
+    return {
+        "scenarios": scenarios,
+        "latency": parse_latency(args.latency, args.spike),
+        "run_step_seconds": args.run_step_seconds,
+        "quota": args.quota,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local mock of the Assistants API and the tool endpoints")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8700)
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    server, url = start_server(args.host, args.port, **server_options(args))
+    print(f"Mock server listening on {url}  (AZURE_OPENAI_ENDPOINT={url}, stats at {url}/_stats)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
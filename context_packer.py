@@ -0,0 +1,144 @@
+import os
+import re
+from dataclasses import dataclass, field
+
+
+#-------------------------------------------------------------------------------------------------#
+#----Context packer for knowledge base chunks: best chunks first, near-duplicates dropped, and the-#
+#----rest trimmed on sentence boundaries to a token budget. Each chunk keeps its title and chunk-#
+#----id so the answer can cite it.-----------------------------------------------------------------#
+#-------------------------------------------------------------------------------------------------#
+
+KB_CONTEXT_TOKEN_BUDGET = int(os.getenv("KB_CONTEXT_TOKEN_BUDGET", "1200"))        # tokens of chunk text per tool output
+KB_DUPLICATE_THRESHOLD = float(os.getenv("KB_DUPLICATE_THRESHOLD", "0.8"))         # shingle overlap that counts as a duplicate
+KB_SHINGLE_WORDS = int(os.getenv("KB_SHINGLE_WORDS", "4"))
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+
+    def count_tokens(text: str) -> int:
+        return len(_encoding.encode(text))
+
+    def truncate_tokens(text: str, tokens: int) -> str:
+        return _encoding.decode(_encoding.encode(text)[:tokens])
+except ImportError:
+    # About four characters per token for English text
+    def count_tokens(text: str) -> int:
+        return (len(text) + 3) // 4
+
+    def truncate_tokens(text: str, tokens: int) -> str:
+        return text[:tokens * 4]
+
+
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+|\n+")
+WORD = re.compile(r"\w+")
+
+
+@dataclass
+class PackStats:
+    chunks_in: int = 0
+    chunks_out: int = 0
+    duplicates: int = 0                 # chunks dropped as near-duplicates of a better one
+    repeated_sentences: int = 0         # sentences already included from a better chunk
+    tokens_in: int = 0
+    tokens_out: int = 0
+    truncated: bool = False
+    dropped: list = field(default_factory=list)   # chunk ids left out
+
+
+def shingles(text: str, size: int = KB_SHINGLE_WORDS) -> set:
+    words = WORD.findall(text.lower())
+    if len(words) <= size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def overlap(a: set, b: set) -> float:
+    # Containment of the smaller set in the larger one: a chunk inside an overlapping window of
+    # another counts as a duplicate even though their Jaccard similarity is lower
+    if not a or not b:
+        return 0.0
+    return len(a & b) / min(len(a), len(b))
+
+
+def split_sentences(text: str) -> list:
+    return [sentence.strip() for sentence in SENTENCE_END.split(text) if sentence.strip()]
+
+
+def chunk_label(chunk: dict, number: int) -> str:
+    parts = [f"[{number}]"]
+    if chunk.get("title"):
+        parts.append(chunk["title"])
+    if chunk.get("chunk_id"):
+        parts.append(f"(chunk_id: {chunk['chunk_id']})")
+    return " ".join(parts)
+
+
+#-------------------------------------------------------------------------------------------------#
+#function description: pack
+#   chunks: search results with content, title, chunk_id and search_score (process_search_docs_response)
+#   returns: (text, PackStats). Chunks are ranked by search_score; a chunk whose shingles overlap a
+#            higher ranked one by KB_DUPLICATE_THRESHOLD is dropped, sentences already included are
+#            skipped, and sentences are added in rank order until token_budget is reached.
+#-------------------------------------------------------------------------------------------------#
+
+def cut_sentence(sentence: str, tokens: int) -> str:
+    # The first `tokens` tokens, ended on a word boundary when there is one
+    text = truncate_tokens(sentence, max(tokens - 1, 1))
+    if " " in text.strip():
+        text = text.rstrip().rsplit(" ", 1)[0]
+    return text.rstrip() + "..."
+
+
+def pack(chunks, token_budget: int = KB_CONTEXT_TOKEN_BUDGET, threshold: float = KB_DUPLICATE_THRESHOLD):
+    stats = PackStats(chunks_in=len(chunks))
+    ranked = sorted(chunks, key=lambda chunk: chunk.get("search_score") or 0.0, reverse=True)
+
+    kept, kept_shingles = [], []
+    for chunk in ranked:
+        content = chunk.get("content") or ""
+        stats.tokens_in += count_tokens(content)
+        chunk_shingles = shingles(content)
+        if any(overlap(chunk_shingles, other) >= threshold for other in kept_shingles):
+            stats.duplicates += 1
+            stats.dropped.append(chunk.get("chunk_id"))
+            continue
+        kept.append(chunk)
+        kept_shingles.append(chunk_shingles)
+
+    sections, seen_sentences, remaining = [], set(), token_budget
+    for chunk in kept:
+        if remaining <= 0:
+            stats.truncated = True
+            stats.dropped.append(chunk.get("chunk_id"))
+            continue
+        sentences = []
+        for sentence in split_sentences(chunk.get("content") or ""):
+            key = " ".join(WORD.findall(sentence.lower()))
+            if key in seen_sentences:
+                stats.repeated_sentences += 1
+                continue
+            tokens = count_tokens(sentence)
+            if tokens > remaining:
+                stats.truncated = True
+                if not sections and not sentences:
+                    # The best chunk opens with a sentence longer than the whole budget: cut it
+                    # rather than return no context at all
+                    sentence = cut_sentence(sentence, remaining)
+                    tokens = count_tokens(sentence)
+                    sentences.append(sentence)
+                    stats.tokens_out += tokens
+                remaining = 0   # later chunks would only add fragments after a cut
+                break
+            seen_sentences.add(key)
+            sentences.append(sentence)
+            remaining -= tokens
+            stats.tokens_out += tokens
+        if sentences:
+            sections.append(chunk_label(chunk, len(sections) + 1) + "\n" + " ".join(sentences))
+        else:
+            stats.dropped.append(chunk.get("chunk_id"))
+
+    stats.chunks_out = len(sections)
+    return "\n\n".join(sections), stats
@@ -0,0 +1,80 @@
+import os
+import time
+import threading
+from concurrent.futures import Future
+
+
+#-------------------------------------------------------------------------------------------------#
+#----Embedding batcher: many query texts -> one embeddings request per max batch size-------------#
+#----With EMBEDDING_BATCH_WINDOW_SECONDS > 0 (server mode) texts from concurrent requests that----#
+#----arrive within the window share the same request.---------------------------------------------#
+#-------------------------------------------------------------------------------------------------#
+
+EMBEDDING_MAX_BATCH = int(os.getenv("EMBEDDING_MAX_BATCH", "16"))
+EMBEDDING_BATCH_WINDOW = float(os.getenv("EMBEDDING_BATCH_WINDOW_SECONDS", "0"))
+EMBEDDING_BATCH_TIMEOUT = float(os.getenv("EMBEDDING_BATCH_TIMEOUT_SECONDS", "60"))
+
+
+class EmbeddingBatcher:
+    def __init__(self, send, max_batch: int = EMBEDDING_MAX_BATCH, window: float = EMBEDDING_BATCH_WINDOW):
+        self.send = send            # list of texts -> list of vectors, in the same order
+        self.max_batch = max_batch
+        self.window = window
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._pending = {}          # text -> Future, waiting for the next flush
+        self._batch_open = False
+
+    def chunks(self, texts):
+        return [texts[start:start + self.max_batch] for start in range(0, len(texts), self.max_batch)]
+
+    def send_chunk(self, chunk) -> list:
+        self.requests += 1
+        vectors = list(self.send(chunk))
+        if len(vectors) != len(chunk):
+            raise ValueError(f"embeddings request for {len(chunk)} texts returned {len(vectors)} vectors")
+        return vectors
+
+    def send_chunks(self, texts) -> dict:
+        vectors = {}
+        for chunk in self.chunks(texts):
+            vectors.update(zip(chunk, self.send_chunk(chunk)))
+        return vectors
+
+    def embed(self, texts) -> list:
+        unique = list(dict.fromkeys(texts))
+        if self.window <= 0:
+            vectors = self.send_chunks(unique)
+            return [vectors[text] for text in texts]
+
+        with self._lock:
+            futures = {}
+            for text in unique:
+                if text not in self._pending:
+                    self._pending[text] = Future()
+                futures[text] = self._pending[text]
+            lead_batch = not self._batch_open
+            self._batch_open = True
+
+        if lead_batch:
+            time.sleep(self.window)
+            self.flush()
+        return [futures[text].result(timeout=EMBEDDING_BATCH_TIMEOUT) for text in texts]
+
+    def flush(self):
+        with self._lock:
+            pending = self._pending
+            self._pending = {}
+            self._batch_open = False
+
+        # Every future of a chunk is completed, with its vector or the chunk's error; a caller never
+        # waits out EMBEDDING_BATCH_TIMEOUT because of a failed or short response
+        for chunk in self.chunks(list(pending)):
+            try:
+                vectors = self.send_chunk(chunk)
+            except Exception as e:
+                for text in chunk:
+                    pending[text].set_exception(e)
+                continue
+            for text, vector in zip(chunk, vectors):
+                pending[text].set_result(vector)
@@ -0,0 +1,254 @@
+import os
+import re
+import mmap
+import time
+import zlib
+import sqlite3
+import threading
+from array import array
+from collections import Counter, OrderedDict
+
+
+#-------------------------------------------------------------------------------------------------#
+#----Two-tier embedding cache: in-memory LRU in front of a shared on-disk float32 store-----------#
+#-------------------------------------------------------------------------------------------------#
+
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", ".embedding_cache")     # "" keeps it in memory only
+EMBEDDING_CACHE_MEMORY_ITEMS = int(os.getenv("EMBEDDING_CACHE_MEMORY_ITEMS", "2048"))
+EMBEDDING_CACHE_MAX_BYTES = int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))  # per deployment
+EMBEDDING_CACHE_TOUCH_BATCH = int(os.getenv("EMBEDDING_CACHE_TOUCH_BATCH", "64"))   # disk hits per last_used write
+
+FLOAT_SIZE = array("f").itemsize
+
+
+def normalize_query(text: str) -> str:
+    # Case and whitespace differences do not change what the customer asked
+    return " ".join(text.lower().split())
+
+
+#-------------------------------------------------------------------------------------------------#
+#----Disk tier: one preallocated, memory-mapped file of fixed-size float32 slots per deployment---#
+#----and dimension, plus a SQLite index (key -> slot, last use). Worker processes map the same----#
+#----files, so they share one copy and restarts start warm. When a file is full the least---------#
+#----recently used slot is reused. Each row keeps a CRC of its slot's bytes: a reader that raced--#
+#----a writer reusing the slot sees a mismatch and treats it as a miss.---------------------------#
+#-------------------------------------------------------------------------------------------------#
+
+class DiskVectorStore:
+    def __init__(self, directory: str, max_bytes: int = EMBEDDING_CACHE_MAX_BYTES, touch_batch: int = EMBEDDING_CACHE_TOUCH_BATCH):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.touch_batch = touch_batch
+        self.evictions = 0
+        self.torn_reads = 0
+        self._touched = {}   # (deployment, key) -> last hit, written to the index in batches
+        os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._maps = {}   # (deployment, dim) -> mmap
+        with self.connection() as db:
+            db.execute("""CREATE TABLE IF NOT EXISTS vectors (
+                key TEXT NOT NULL, deployment TEXT NOT NULL, dim INTEGER NOT NULL,
+                slot INTEGER NOT NULL, last_used REAL NOT NULL, checksum INTEGER,
+                PRIMARY KEY (deployment, key))""")
+            db.execute("CREATE INDEX IF NOT EXISTS vectors_lru ON vectors (deployment, dim, last_used)")
+            if "checksum" not in [column[1] for column in db.execute("PRAGMA table_info(vectors)")]:
+                # Stores written before the checksum: their rows read as misses and are written again
+                try:
+                    db.execute("ALTER TABLE vectors ADD COLUMN checksum INTEGER")
+                except sqlite3.OperationalError:
+                    pass   # another process added it first
+
+    def connection(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(os.path.join(self.directory, "index.sqlite"), timeout=30, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            self._local.db = db
+        return db
+
+    def capacity(self, dim: int) -> int:
+        return max(self.max_bytes // (dim * FLOAT_SIZE), 1)
+
+    def vector_map(self, deployment: str, dim: int):
+        with self._lock:
+            if (deployment, dim) not in self._maps:
+                name = re.sub(r"[^A-Za-z0-9_.-]", "_", deployment)
+                path = os.path.join(self.directory, f"{name}-{dim}.f32")
+                size = self.capacity(dim) * dim * FLOAT_SIZE
+                with open(path, "a+b") as f:
+                    if os.fstat(f.fileno()).st_size < size:
+                        f.truncate(size)   # sparse until the slots are written
+                    self._maps[(deployment, dim)] = mmap.mmap(f.fileno(), size)
+            return self._maps[(deployment, dim)]
+
+    def get(self, key: str, deployment: str):
+        db = self.connection()
+        row = db.execute("SELECT dim, slot, checksum FROM vectors WHERE deployment = ? AND key = ?", (deployment, key)).fetchone()
+        if row is None or row[2] is None:
+            return None
+        dim, slot, checksum = row
+        vectors = self.vector_map(deployment, dim)
+        data = vectors[slot * dim * FLOAT_SIZE:(slot + 1) * dim * FLOAT_SIZE]
+        if zlib.crc32(data) != checksum:
+            # Another process evicted this row and is reusing the slot: the bytes are not ours
+            self.torn_reads += 1
+            return None
+        vector = array("f")
+        vector.frombytes(data)
+        self.touch(key, deployment)
+        return vector.tolist()
+
+    def touch(self, key: str, deployment: str):
+        # Hits only move the LRU clock; writing it once per batch keeps reads from taking the write lock
+        with self._lock:
+            self._touched[(deployment, key)] = time.time()
+            if len(self._touched) < self.touch_batch:
+                return
+        try:
+            self.flush_touched()
+        except sqlite3.Error:
+            pass   # best effort: a busy index only ages these entries a little
+
+    def flush_touched(self, db=None):
+        with self._lock:
+            touched, self._touched = self._touched, {}
+        if touched:
+            (db or self.connection()).executemany(
+                "UPDATE vectors SET last_used = MAX(last_used, ?) WHERE deployment = ? AND key = ?",
+                [(used, deployment, key) for (deployment, key), used in touched.items()])
+
+    def put(self, key: str, deployment: str, vector):
+        dim = len(vector)
+        vectors = self.vector_map(deployment, dim)
+        db = self.connection()
+        # IMMEDIATE takes the write lock up front, so concurrent processes never pick the same slot
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            # Pending hits first, so the eviction below sees recent use
+            self.flush_touched(db)
+            existing = db.execute("SELECT slot FROM vectors WHERE deployment = ? AND key = ? AND dim = ?",
+                                  (deployment, key, dim)).fetchone()
+            if existing:
+                slot = existing[0]
+            else:
+                db.execute("DELETE FROM vectors WHERE deployment = ? AND key = ?", (deployment, key))
+                # The lowest free slot in the file: rows removed out of LRU order (a key written again
+                # with another dim) leave holes below MAX(slot)
+                capacity = self.capacity(dim)
+                slot = db.execute(
+                    """SELECT MIN(free) FROM (SELECT 0 AS free UNION ALL
+                                              SELECT slot + 1 FROM vectors WHERE deployment = ? AND dim = ?)
+                       WHERE free < ? AND free NOT IN (SELECT slot FROM vectors WHERE deployment = ? AND dim = ?)""",
+                    (deployment, dim, capacity, deployment, dim)).fetchone()[0]
+                if slot is None:
+                    # Full: reuse the least recently used slot (below capacity, if max_bytes shrank)
+                    oldest_key, slot = db.execute(
+                        "SELECT key, slot FROM vectors WHERE deployment = ? AND dim = ? AND slot < ? ORDER BY last_used LIMIT 1",
+                        (deployment, dim, capacity)).fetchone()
+                    db.execute("DELETE FROM vectors WHERE deployment = ? AND key = ?", (deployment, oldest_key))
+                    self.evictions += 1
+
+            # Write the vector before the index row becomes visible to other processes
+            data = array("f", vector).tobytes()
+            vectors[slot * dim * FLOAT_SIZE:(slot + 1) * dim * FLOAT_SIZE] = data
+            db.execute("INSERT OR REPLACE INTO vectors (key, deployment, dim, slot, last_used, checksum) VALUES (?, ?, ?, ?, ?, ?)",
+                       (key, deployment, dim, slot, time.time(), zlib.crc32(data)))
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+
+    def count(self) -> int:
+        return self.connection().execute("SELECT COUNT(*) FROM vectors").fetchone()[0]
+
+
+#-------------------------------------------------------------------------------------------------#
+#----EmbeddingCache: LRU keyed by (deployment, normalized query), then the disk store--------------#
+#-------------------------------------------------------------------------------------------------#
+
+class EmbeddingCache:
+    def __init__(self, directory: str = EMBEDDING_CACHE_DIR, memory_items: int = EMBEDDING_CACHE_MEMORY_ITEMS,
+                 max_bytes: int = EMBEDDING_CACHE_MAX_BYTES, enabled: bool = EMBEDDING_CACHE_ENABLED):
+        self.enabled = enabled
+        self.memory_items = memory_items
+        self.counters = Counter()
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk = None
+        self._disk_failed = False
+        self._directory = directory
+        self._max_bytes = max_bytes
+
+    def disk(self):
+        with self._lock:
+            if self._disk is None and self._directory and not self._disk_failed:
+                try:
+                    self._disk = DiskVectorStore(self._directory, self._max_bytes)
+                except (OSError, sqlite3.Error) as e:
+                    print(f"Embedding disk cache disabled: {e}")
+                    self._disk_failed = True
+            return self._disk
+
+    def remember(self, memory_key, vector):
+        with self._lock:
+            self._memory[memory_key] = vector
+            self._memory.move_to_end(memory_key)
+            while len(self._memory) > self.memory_items:
+                self._memory.popitem(last=False)
+
+    def get(self, text: str, deployment: str):
+        if not self.enabled:
+            return None
+        key = normalize_query(text)
+        with self._lock:
+            vector = self._memory.get((deployment, key))
+            if vector is not None:
+                self._memory.move_to_end((deployment, key))
+                self.counters["memory_hits"] += 1
+                return vector
+
+        disk = self.disk()
+        try:
+            vector = disk.get(key, deployment) if disk is not None else None
+        except sqlite3.Error as e:
+            # A locked or broken index is a miss, not a failed tool call
+            print(f"Embedding disk cache read failed: {e}")
+            self.counters["disk_errors"] += 1
+            vector = None
+        if vector is None:
+            self.counters["misses"] += 1
+            return None
+        self.counters["disk_hits"] += 1
+        self.remember((deployment, key), vector)
+        return vector
+
+    def put(self, text: str, deployment: str, vector):
+        if not self.enabled:
+            return
+        key = normalize_query(text)
+        self.remember((deployment, key), vector)
+        disk = self.disk()
+        if disk is None:
+            return
+        try:
+            disk.put(key, deployment, vector)
+        except (OSError, sqlite3.Error) as e:
+            # "database is locked" and full disks leave the vector in memory only
+            print(f"Embedding disk cache write failed: {e}")
+            self.counters["disk_errors"] += 1
+
+    def stats(self) -> dict:
+        stats = dict(self.counters)
+        lookups = stats.get("memory_hits", 0) + stats.get("disk_hits", 0) + stats.get("misses", 0)
+        stats["hit_rate"] = (stats.get("memory_hits", 0) + stats.get("disk_hits", 0)) / lookups if lookups else 0.0
+        stats["memory_items"] = len(self._memory)
+        if self._disk is not None:
+            stats["disk_items"] = self._disk.count()
+            stats["disk_evictions"] = self._disk.evictions
+            stats["disk_torn_reads"] = self._disk.torn_reads
+        return stats
+
+
+embedding_cache = EmbeddingCache()
@@ -0,0 +1,86 @@
+import os
+import time
+import threading
+
+import http_transport
+
+
+#-------------------------------------------------------------------------------------------------#
+#----Exchange-rate cache: one rate table, refreshed in the background (stale-while-revalidate)----#
+#-------------------------------------------------------------------------------------------------#
+
+EXCHANGE_RATE_API_URL = os.getenv("EXCHANGE_RATE_API_URL", "https://api.exchangerate-api.com/v4/latest/USD")
+FX_RATES_TTL = float(os.getenv("FX_RATES_TTL_SECONDS", "3600"))            # fresh for this long
+FX_RATES_MAX_STALE = float(os.getenv("FX_RATES_MAX_STALE_SECONDS", "86400"))  # then served while refreshing
+
+
+class RateCache:
+    def __init__(self, url: str = EXCHANGE_RATE_API_URL, ttl: float = FX_RATES_TTL, max_stale: float = FX_RATES_MAX_STALE):
+        self.url = url
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.fetches = 0
+        self._rates = None
+        self._fetched_at = 0.0
+        self._lock = threading.Lock()
+        self._fetch_lock = threading.Lock()
+        self._refreshing = False
+
+    def fetch(self):
+        response = http_transport.get(self.url, service="fx")
+        response.raise_for_status()
+        rates = response.json()["rates"]
+        with self._lock:
+            self._rates = rates
+            self._fetched_at = time.monotonic()
+            self.fetches += 1
+        return rates
+
+    def refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def refresh():
+            try:
+                self.fetch()
+            except Exception as e:
+                print(f"Exchange rate refresh failed, serving the cached table: {e}")
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=refresh, name="fx-refresh", daemon=True).start()
+
+    def rates(self) -> dict:
+        age = time.monotonic() - self._fetched_at
+        if self._rates is not None and age <= self.ttl:
+            return self._rates
+        if self._rates is not None and age <= self.max_stale:
+            self.refresh_in_background()
+            return self._rates
+        # Nothing usable cached: wait for the download, sharing it with concurrent callers
+        with self._fetch_lock:
+            if self._rates is not None and time.monotonic() - self._fetched_at <= self.ttl:
+                return self._rates
+            return self.fetch()
+
+    def convert(self, amount, from_currency: str = "USD", to_currency: str = "GBP"):
+        rates = self.rates()
+        from_currency, to_currency = from_currency.upper(), to_currency.upper()
+        for currency in (from_currency, to_currency):
+            if currency not in rates:
+                raise ValueError(f"Unknown currency: {currency}")
+
+        # The table is relative to one base currency, so any pair is a ratio of two rates
+        rate = rates[to_currency] / rates[from_currency]
+        if isinstance(amount, (list, tuple)):
+            return [value * rate for value in amount]
+        return amount * rate
+
+
+rate_cache = RateCache()
+
+
+def convert(amount, from_currency: str = "USD", to_currency: str = "GBP"):
+    return rate_cache.convert(amount, from_currency, to_currency)
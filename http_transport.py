@@ -0,0 +1,407 @@
+import os
+import time
+import random
+import threading
+import contextvars
+from collections import Counter, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, replace
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit, urlunsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+import rate_limiter
+
+
+#-------------------------------------------------------------------------------------------------#
+#----Shared HTTP transport for Bing, exchange rates, embeddings and Azure Search------------------#
+#----One keep-alive pool per host, per-service timeouts, retries that honour Retry-After----------#
+#----Every attempt goes through the service's limiter in rate_limiter.py---------------------------#
+#-------------------------------------------------------------------------------------------------#
+
+HTTP_POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", "16"))   # hosts kept in the pool manager
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "32"))           # keep-alive connections per host
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "false").lower() == "true"    # needs httpx[http2]
+HTTP_MAX_RETRY_AFTER = float(os.getenv("HTTP_MAX_RETRY_AFTER_SECONDS", "30"))
+
+# Hedged requests (opt-in per service): a duplicate is sent when the first copy is slower than
+# the service's recent HTTP_HEDGE_PERCENTILE latency, within a budget of HTTP_HEDGE_BUDGET of requests
+HTTP_HEDGE_SERVICES = [name.strip() for name in os.getenv("HTTP_HEDGE_SERVICES", "").split(",") if name.strip()]
+HTTP_HEDGE_PERCENTILE = float(os.getenv("HTTP_HEDGE_PERCENTILE", "0.95"))
+HTTP_HEDGE_BUDGET = float(os.getenv("HTTP_HEDGE_BUDGET", "0.05"))
+HTTP_HEDGE_MIN_SAMPLES = int(os.getenv("HTTP_HEDGE_MIN_SAMPLES", "20"))   # latencies before the percentile is trusted
+HTTP_HEDGE_WINDOW = int(os.getenv("HTTP_HEDGE_WINDOW", "500"))            # recent latencies the percentile is taken over
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+@dataclass
+class ServiceSettings:
+    connect_timeout: float = 3.05
+    read_timeout: float = 30.0
+    retries: int = 2
+    backoff: float = 0.5
+    throttle_retries: int = 5   # 429s are retried separately, after the Retry-After the service asks for
+    hedge: bool = False         # send a duplicate when a request is slower than the service's usual tail
+    hedge_url: str = None       # scheme://host of a secondary region for the duplicate, the same host when None
+    hedge_key: str = None       # api-key header for hedge_url
+
+
+SERVICES = {
+    "default": ServiceSettings(),
+    "bing": ServiceSettings(read_timeout=10.0),
+    "fx": ServiceSettings(read_timeout=10.0),
+    "embeddings": ServiceSettings(read_timeout=30.0),
+    "search": ServiceSettings(read_timeout=30.0),
+}
+
+
+def configure_service(name: str, **settings):
+    SERVICES[name] = ServiceSettings(**{**SERVICES.get(name, ServiceSettings()).__dict__, **settings})
+
+
+# HTTP_TIMEOUT_<SERVICE>="connect,read" overrides the timeouts, e.g. HTTP_TIMEOUT_SEARCH="2,10"
+for _name in list(SERVICES):
+    _value = os.getenv(f"HTTP_TIMEOUT_{_name.upper()}")
+    if _value:
+        _connect, _read = (float(part) for part in _value.split(","))
+        configure_service(_name, connect_timeout=_connect, read_timeout=_read)
+
+# HTTP_HEDGE_SERVICES="search,embeddings" turns hedging on; HTTP_HEDGE_SECONDARY_<SERVICE> and
+# HTTP_HEDGE_SECONDARY_KEY_<SERVICE> send the duplicate to another region
+for _name in HTTP_HEDGE_SERVICES:
+    configure_service(_name, hedge=True, hedge_url=os.getenv(f"HTTP_HEDGE_SECONDARY_{_name.upper()}"),
+                      hedge_key=os.getenv(f"HTTP_HEDGE_SECONDARY_KEY_{_name.upper()}"))
+
+
+#-------------------------------------------------------------------------------------------------#
+#----Pool statistics: urllib3 pools that count the connections they open--------------------------#
+#-------------------------------------------------------------------------------------------------#
+
+_stats_lock = threading.Lock()
+_stats = Counter()
+
+
+def count(name: str, amount: int = 1):
+    with _stats_lock:
+        _stats[name] += amount
+
+
+class CountingHTTPConnectionPool(HTTPConnectionPool):
+    def _get_conn(self, timeout=None):
+        count("connections_checked_out")
+        return super()._get_conn(timeout)
+
+    def _new_conn(self):
+        count("connections_opened")
+        return super()._new_conn()
+
+
+class CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    def _get_conn(self, timeout=None):
+        count("connections_checked_out")
+        return super()._get_conn(timeout)
+
+    def _new_conn(self):
+        count("connections_opened")
+        return super()._new_conn()
+
+
+class PooledAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": CountingHTTPConnectionPool,
+            "https": CountingHTTPSConnectionPool,
+        }
+
+
+def pool_stats() -> dict:
+    # requests / retries / connections_opened / connections_reused (reuse is not visible with HTTP/2)
+    with _stats_lock:
+        stats = dict(_stats)
+    checked_out = stats.pop("connections_checked_out", 0)
+    if checked_out:
+        stats["connections_reused"] = max(checked_out - stats.get("connections_opened", 0), 0)
+    stats["http2"] = HTTP2_ENABLED
+    return stats
+
+
+#-------------------------------------------------------------------------------------------------#
+#----Clients: one requests.Session, or one httpx.Client when HTTP/2 is enabled--------------------#
+#-------------------------------------------------------------------------------------------------#
+
+_client_lock = threading.Lock()
+_session = None
+_httpx_client = None
+
+
+def get_session():
+    global _session
+    with _client_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = PooledAdapter(pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE, max_retries=0)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+
+def get_httpx_client():
+    # None when httpx or h2 is not installed; requests (HTTP/1.1) is used instead
+    global _httpx_client, HTTP2_ENABLED
+    with _client_lock:
+        if _httpx_client is None and HTTP2_ENABLED:
+            try:
+                import httpx
+                _httpx_client = httpx.Client(
+                    http2=True,
+                    limits=httpx.Limits(max_connections=HTTP_POOL_CONNECTIONS * HTTP_POOL_MAXSIZE,
+                                        max_keepalive_connections=HTTP_POOL_MAXSIZE),
+                )
+            except ImportError as e:
+                print(f"HTTP/2 disabled: {e}")
+                HTTP2_ENABLED = False
+        return _httpx_client
+
+
+def retry_delay(response, attempt: int, settings: ServiceSettings) -> float:
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after:
+        try:
+            delay = float(retry_after)
+        except ValueError:
+            try:
+                delay = parsedate_to_datetime(retry_after).timestamp() - time.time()
+            except (TypeError, ValueError):
+                delay = 0.0
+        return min(max(delay, 0.0), HTTP_MAX_RETRY_AFTER)
+    return settings.backoff * (2 ** attempt) * random.uniform(0.5, 1.5)
+
+
+#-------------------------------------------------------------------------------------------------#
+#function description: request / get / post
+#   service: key into SERVICES for timeouts and retries ("bing", "fx", "embeddings", "search")
+#   Retries connection errors, timeouts and 429/5xx responses. The last response is returned
+#   as is, so callers keep checking status_code themselves. Services with hedge=True go through
+#   hedged_request.
+#-------------------------------------------------------------------------------------------------#
+
+def request(method: str, url: str, service: str = "default", **kwargs):
+    settings = SERVICES.get(service, SERVICES["default"])
+    if settings.hedge:
+        return hedged_request(method, url, service, settings, **kwargs)
+    return send_request(method, url, service, settings, **kwargs)
+
+
+def send_request(method: str, url: str, service: str, settings: ServiceSettings, **kwargs):
+
+    client = get_httpx_client() if HTTP2_ENABLED else None
+    if client is not None:
+        import httpx
+        send = lambda: client.request(method, url, timeout=httpx.Timeout(settings.read_timeout, connect=settings.connect_timeout), **kwargs)
+        transient_errors = (httpx.TransportError,)
+    else:
+        session = get_session()
+        send = lambda: session.request(method, url, timeout=(settings.connect_timeout, settings.read_timeout), **kwargs)
+        transient_errors = (requests.ConnectionError, requests.Timeout)
+
+    attempt = throttled = 0
+    while True:
+        count("requests")
+        try:
+            response = send_limited(send, service)
+        except transient_errors:
+            if attempt == settings.retries:
+                raise
+            count("retries")
+            time.sleep(retry_delay(None, attempt, settings))
+            attempt += 1
+            continue
+
+        if response.status_code == 429 and throttled < settings.throttle_retries:
+            delay = retry_delay(response, throttled, settings)
+            throttled += 1
+        elif response.status_code in RETRY_STATUSES and attempt < settings.retries:
+            delay = retry_delay(response, attempt, settings)
+            attempt += 1
+        else:
+            return response
+        count("retries")
+        response.close()
+        time.sleep(delay)
+
+
+def send_limited(send, service: str):
+    # Waits for a slot of the service's limiter (rate_limiter.py) and reports the response back to it
+    if not rate_limiter.RATE_LIMIT_ENABLED:
+        return send()
+    with rate_limiter.limiter(service).slot() as outcome:
+        response = send()
+        outcome.update(status=response.status_code, headers=response.headers)
+        return response
+
+
+#-------------------------------------------------------------------------------------------------#
+#----Hedged requests: when the first copy has not answered within the service's recent------------#
+#----HTTP_HEDGE_PERCENTILE latency, a duplicate goes to the same host (or hedge_url) and the first-#
+#----good response wins. Only the first attempt is hedged: each copy makes a single attempt, and--#
+#----the retries (with their backoff) follow once both have failed, so the hedge clock never-----#
+#----runs through a retry sleep. Hedges spend a credit; every request earns HTTP_HEDGE_BUDGET of--#
+#----one, so at most that share of traffic is duplicated. A blocking call cannot be cancelled, so-#
+#----the losing copy finishes in the background and its response is closed.----------------------#
+#-------------------------------------------------------------------------------------------------#
+
+class Hedger:
+    def __init__(self, percentile: float = HTTP_HEDGE_PERCENTILE, budget: float = HTTP_HEDGE_BUDGET,
+                 min_samples: int = HTTP_HEDGE_MIN_SAMPLES, window: int = HTTP_HEDGE_WINDOW):
+        self.percentile = percentile
+        self.budget = budget
+        self.min_samples = min_samples
+        self.counters = Counter()
+        self._latencies = deque(maxlen=window)
+        self._delay = None
+        self._credit = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._latencies.append(seconds)
+            # The percentile is re-sorted every few samples rather than on every request
+            if len(self._latencies) >= self.min_samples and (self._delay is None or len(self._latencies) % 16 == 0):
+                ordered = sorted(self._latencies)
+                self._delay = ordered[min(int(len(ordered) * self.percentile), len(ordered) - 1)]
+
+    def delay(self):
+        # Seconds to wait before hedging, None until enough latencies have been seen
+        with self._lock:
+            self.counters["requests"] += 1
+            self._credit = min(self._credit + self.budget, 10.0)
+            return self._delay
+
+    def try_hedge(self) -> bool:
+        with self._lock:
+            if self._credit < 1.0:
+                self.counters["over_budget"] += 1
+                return False
+            self._credit -= 1.0
+            self.counters["hedges"] += 1
+            return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.counters)
+            stats["delay_ms"] = round(self._delay * 1000, 1) if self._delay is not None else None
+        stats["hedge_rate"] = stats.get("hedges", 0) / stats["requests"] if stats.get("requests") else 0.0
+        return stats
+
+
+_hedgers = {}
+_hedge_executor = ThreadPoolExecutor(max_workers=HTTP_POOL_MAXSIZE * 2, thread_name_prefix="hedge")
+
+
+def hedger(service: str) -> Hedger:
+    with _client_lock:
+        return _hedgers.setdefault(service, Hedger())
+
+
+def hedge_stats() -> dict:
+    return {service: tracker.stats() for service, tracker in list(_hedgers.items())}
+
+
+def hedge_target(url: str, settings: ServiceSettings, kwargs: dict):
+    # The duplicate's url and arguments: the secondary region's host and key when configured
+    if not settings.hedge_url:
+        return url, kwargs
+    secondary = urlsplit(settings.hedge_url)
+    url = urlunsplit(urlsplit(url)._replace(scheme=secondary.scheme, netloc=secondary.netloc))
+    if settings.hedge_key and "api-key" in (kwargs.get("headers") or {}):
+        kwargs = dict(kwargs, headers=dict(kwargs["headers"], **{"api-key": settings.hedge_key}))
+    return url, kwargs
+
+
+def timed_send(hedger: Hedger, method: str, url: str, service: str, settings: ServiceSettings, kwargs: dict):
+    started = time.monotonic()
+    response = send_request(method, url, service, settings, **kwargs)
+    if response.status_code < 300:
+        hedger.record(time.monotonic() - started)
+    return response
+
+
+def close_response(future):
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+
+def good_response(future) -> bool:
+    return future.exception() is None and future.result().status_code not in RETRY_STATUSES
+
+
+def hedged_request(method: str, url: str, service: str, settings: ServiceSettings, **kwargs):
+    tracker = hedger(service)
+    delay = tracker.delay()
+    if delay is None:
+        return timed_send(tracker, method, url, service, settings, kwargs)
+
+    # The copies run on the hedge pool, in this caller's context (rate limiter priority, telemetry)
+    first_attempt = replace(settings, retries=0, throttle_retries=0)
+    submit = lambda target, arguments: _hedge_executor.submit(
+        contextvars.copy_context().run, timed_send, tracker, method, target, service, first_attempt, arguments)
+    primary = submit(url, kwargs)
+    copies = [primary]
+    if not wait(copies, timeout=delay).done and tracker.try_hedge():
+        count("hedges")
+        copies.append(submit(*hedge_target(url, settings, kwargs)))
+
+    pending, failed = set(copies), []
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        # Both copies can finish in the same wait: any good one wins over a failed one
+        good = [future for future in copies if future in done and good_response(future)]
+        if good:
+            if good[0] is not primary:
+                with tracker._lock:
+                    tracker.counters["hedge_wins"] += 1
+            for loser in failed + [future for future in done if future is not good[0]]:
+                close_response(loser)
+            for loser in pending:
+                loser.add_done_callback(close_response)
+            return good[0].result()
+        failed += [future for future in copies if future in done]
+
+    # Every copy failed its first attempt: the retries follow as usual, without hedging
+    responses = [future for future in failed if future.exception() is None]
+    for future in responses[1:]:
+        close_response(future)
+    response = responses[0].result() if responses else None
+    throttled = response is not None and response.status_code == 429
+    remaining = replace(settings, retries=settings.retries - (not throttled), throttle_retries=settings.throttle_retries - throttled)
+    if remaining.retries < 0 or remaining.throttle_retries < 0:
+        return response if response is not None else failed[0].result()
+    count("retries")
+    delay = retry_delay(response, 0, settings)
+    if response is not None:
+        response.close()
+    time.sleep(delay)
+    return send_request(method, url, service, remaining, **kwargs)
+
+
+def get(url: str, service: str = "default", **kwargs):
+    return request("GET", url, service, **kwargs)
+
+
+def post(url: str, service: str = "default", **kwargs):
+    return request("POST", url, service, **kwargs)
+
+
+def preconnect(url: str, service: str = "default"):
+    # Opens a keep-alive connection to the host of url ahead of the first real call; the status
+    # of the response does not matter
+    try:
+        request("HEAD", url, service).close()
+    except Exception as e:
+        print(f"Could not open a connection to {url}: {e}")
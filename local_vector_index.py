@@ -0,0 +1,385 @@
+import os
+import re
+import sys
+import json
+import mmap
+import time
+import argparse
+import tempfile
+import threading
+from array import array
+from collections import Counter
+
+import numpy as np
+
+
+#-------------------------------------------------------------------------------------------------#
+#----Local in-process knowledge base index: a memory-mapped float32 matrix of chunk vectors-------#
+#----searched with vectorized cosine similarity (optionally through a coarse IVF partition),------#
+#----fused with a small BM25 keyword index. search() returns raw documents shaped like the--------#
+#----Azure Search response, so process_search_docs_response formats them as before.--------------#
+#-------------------------------------------------------------------------------------------------#
+
+LOCAL_KB_NPROBE = int(os.getenv("LOCAL_KB_NPROBE", "8"))               # IVF lists scanned per query, 0 = brute force
+LOCAL_KB_HYBRID_WEIGHT = float(os.getenv("LOCAL_KB_HYBRID_WEIGHT", "0.5"))  # 1 = vector only, 0 = keyword only
+
+RRF_K = 60
+BM25_K1 = 1.2
+BM25_B = 0.75
+SCAN_ROWS = 65536   # rows per matmul when brute forcing a memory-mapped matrix
+BUILD_ROWS = 4096   # vectors parsed before they are normalized and written out during a build
+
+TEXT_FIELDS = ("title", "content", "page_content")   # what the keyword index reads
+
+tokenRegex = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str):
+    return tokenRegex.findall(text.lower())
+
+
+def normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (matrix / norms).astype(np.float32)
+
+
+def top_k(scores, k: int):
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    candidates = np.argpartition(-scores, k - 1)[:k]
+    return candidates[np.argsort(-scores[candidates])]
+
+
+class LocalVectorIndex:
+    def __init__(self, path: str):
+        self.path = path
+        self.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        self.offsets = np.load(os.path.join(path, "chunk_offsets.npy"))
+        with open(os.path.join(path, "chunks.jsonl"), "rb") as f:
+            self.chunks = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        ivf_path = os.path.join(path, "ivf.npz")
+        self.ivf = dict(np.load(ivf_path)) if os.path.exists(ivf_path) else None
+
+        bm25_path = os.path.join(path, "bm25.npz")
+        if os.path.exists(bm25_path):
+            self.bm25 = dict(np.load(bm25_path))
+            with open(os.path.join(path, "vocabulary.json")) as f:
+                self.vocabulary = {term: index for index, term in enumerate(json.load(f))}
+        else:
+            self.bm25, self.vocabulary = None, {}
+
+    def __len__(self):
+        return self.vectors.shape[0]
+
+    def document(self, row: int) -> dict:
+        return json.loads(self.chunks[self.offsets[row]:self.offsets[row + 1]])
+
+    #---------------------------------------------------------------------------------------------#
+    #----Vector search: cosine similarity on unit vectors, brute force or IVF------------------------#
+    #---------------------------------------------------------------------------------------------#
+
+    def brute_force(self, query_vector, k: int):
+        query = np.asarray(query_vector, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1.0
+        scores = np.empty(len(self), dtype=np.float32)
+        for start in range(0, len(self), SCAN_ROWS):
+            scores[start:start + SCAN_ROWS] = self.vectors[start:start + SCAN_ROWS] @ query
+        rows = top_k(scores, k)
+        return rows, scores[rows]
+
+    def vector_search(self, query_vector, k: int, nprobe: int = LOCAL_KB_NPROBE):
+        if self.ivf is None or nprobe <= 0:
+            return self.brute_force(query_vector, k)
+
+        query = np.asarray(query_vector, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1.0
+        lists = top_k(self.ivf["centroids"] @ query, nprobe)
+        list_offsets, order = self.ivf["offsets"], self.ivf["order"]
+        candidates = np.concatenate([order[list_offsets[index]:list_offsets[index + 1]] for index in lists])
+        candidates.sort()   # sequential reads from the memory-mapped matrix
+        scores = self.vectors[candidates] @ query
+        best = top_k(scores, k)
+        return candidates[best], scores[best]
+
+    #---------------------------------------------------------------------------------------------#
+    #----Keyword search: BM25 over compressed postings (term -> documents, term frequencies)---------#
+    #---------------------------------------------------------------------------------------------#
+
+    def keyword_search(self, text: str, k: int):
+        if self.bm25 is None:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        bm25 = self.bm25
+        scores = np.zeros(len(self), dtype=np.float32)
+        length_norm = BM25_K1 * (1 - BM25_B + BM25_B * bm25["doc_lengths"] / bm25["average_length"])
+        for term in set(tokenize(text)):
+            term_id = self.vocabulary.get(term)
+            if term_id is None:
+                continue
+            start, end = bm25["term_offsets"][term_id], bm25["term_offsets"][term_id + 1]
+            docs, frequencies = bm25["postings"][start:end], bm25["frequencies"][start:end]
+            idf = np.log(1 + (len(self) - len(docs) + 0.5) / (len(docs) + 0.5))
+            scores[docs] += idf * frequencies * (BM25_K1 + 1) / (frequencies + length_norm[docs])
+
+        rows = top_k(scores, k)
+        rows = rows[scores[rows] > 0]
+        return rows, scores[rows]
+
+    #---------------------------------------------------------------------------------------------#
+    #----Hybrid: reciprocal rank fusion of the vector and keyword rankings---------------------------#
+    #---------------------------------------------------------------------------------------------#
+
+    def search(self, text: str, query_vector, k: int, hybrid_weight: float = LOCAL_KB_HYBRID_WEIGHT,
+               nprobe: int = LOCAL_KB_NPROBE):
+        fused = Counter()
+        depth = max(k * 4, 20)
+        if query_vector is not None and hybrid_weight > 0:
+            rows, _ = self.vector_search(query_vector, depth, nprobe)
+            for rank, row in enumerate(rows):
+                fused[int(row)] += hybrid_weight / (RRF_K + rank + 1)
+        if text and hybrid_weight < 1:
+            rows, _ = self.keyword_search(text, depth)
+            for rank, row in enumerate(rows):
+                fused[int(row)] += (1 - hybrid_weight) / (RRF_K + rank + 1)
+
+        docs = []
+        for row, score in fused.most_common(k):
+            doc = self.document(row)
+            doc["@search.score"] = score
+            docs.append(doc)
+        return docs
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def load_index(path: str) -> LocalVectorIndex:
+    # One instance per index directory per process; the matrix itself is shared through the page cache
+    with _indexes_lock:
+        if path not in _indexes:
+            _indexes[path] = LocalVectorIndex(path)
+        return _indexes[path]
+
+
+#-------------------------------------------------------------------------------------------------#
+#----Offline build: chunks JSONL (documents + vectors) -> index directory-------------------------#
+#-------------------------------------------------------------------------------------------------#
+
+def kmeans(vectors, clusters: int, iterations: int = 10, sample: int = 256, seed: int = 0):
+    # Spherical k-means on a sample of the (unit) vectors
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(vectors), size=min(len(vectors), clusters * sample), replace=False)
+    rows.sort()
+    training = np.asarray(vectors[rows], dtype=np.float32)
+    centroids = training[rng.choice(len(training), size=clusters, replace=False)]
+    for _ in range(iterations):
+        assignment = np.argmax(training @ centroids.T, axis=1)
+        for cluster in range(clusters):
+            members = training[assignment == cluster]
+            if len(members):
+                centroids[cluster] = members.sum(axis=0)
+        centroids = normalize_rows(centroids)
+    return centroids
+
+
+def build_ivf(vectors, clusters: int):
+    centroids = kmeans(vectors, clusters)
+    assignment = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), SCAN_ROWS):
+        assignment[start:start + SCAN_ROWS] = np.argmax(vectors[start:start + SCAN_ROWS] @ centroids.T, axis=1)
+    order = np.argsort(assignment, kind="stable").astype(np.int64)
+    offsets = np.zeros(clusters + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(np.bincount(assignment, minlength=clusters))
+    return {"centroids": centroids, "order": order, "offsets": offsets}
+
+
+class BM25Builder:
+    # Postings collected as flat typed arrays (doc, term, frequency) as documents stream in, so the
+    # build does not hold one Python tuple per posting
+    def __init__(self):
+        self.vocabulary = {}
+        self.docs = array("i")
+        self.terms = array("i")
+        self.frequencies = array("f")
+        self.doc_lengths = array("f")
+
+    def add(self, text: str):
+        doc_id = len(self.doc_lengths)
+        tokens = tokenize(text)
+        self.doc_lengths.append(len(tokens))
+        for term, frequency in Counter(tokens).items():
+            self.docs.append(doc_id)
+            self.terms.append(self.vocabulary.setdefault(term, len(self.vocabulary)))
+            self.frequencies.append(frequency)
+
+    def arrays(self):
+        terms = np.frombuffer(self.terms, dtype=np.int32)
+        order = np.argsort(terms, kind="stable")   # grouped by term, documents ascending within a term
+        term_offsets = np.zeros(len(self.vocabulary) + 1, dtype=np.int64)
+        term_offsets[1:] = np.cumsum(np.bincount(terms, minlength=len(self.vocabulary)))
+        doc_lengths = np.frombuffer(self.doc_lengths, dtype=np.float32)
+        arrays = {
+            "term_offsets": term_offsets,
+            "postings": np.frombuffer(self.docs, dtype=np.int32)[order],
+            "frequencies": np.frombuffer(self.frequencies, dtype=np.float32)[order],
+            "doc_lengths": doc_lengths.copy(),
+            "average_length": np.float32(doc_lengths.mean() if len(doc_lengths) else 1.0),
+        }
+        return arrays, list(self.vocabulary)
+
+
+def build_bm25(texts):
+    builder = BM25Builder()
+    for text in texts:
+        builder.add(text)
+    return builder.arrays()
+
+
+def count_rows(input_path: str, vector_field: str):
+    # First pass: rows and dimensions, so the matrix can be allocated on disk before any vector is read
+    rows, dimensions = 0, None
+    with open(input_path) as source:
+        for line in source:
+            if not line.strip():
+                continue
+            if dimensions is None:
+                dimensions = len(json.loads(line)[vector_field])
+            rows += 1
+    return rows, dimensions or 0
+
+
+def build_index(input_path: str, output_path: str, vector_field: str = "contentVector", clusters: int = 0):
+    os.makedirs(output_path, exist_ok=True)
+    rows, dimensions = count_rows(input_path, vector_field)
+    # Normalized float32 rows go straight into the .npy file; only one batch is held in memory
+    matrix = np.lib.format.open_memmap(os.path.join(output_path, "vectors.npy"), mode="w+",
+                                       dtype=np.float32, shape=(rows, dimensions))
+    offsets = np.zeros(rows + 1, dtype=np.int64)
+    bm25 = BM25Builder()
+    batch, row = [], 0
+
+    with open(input_path) as source, open(os.path.join(output_path, "chunks.jsonl"), "wb") as chunks:
+        for line in source:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            batch.append(record.pop(vector_field))
+            # Keep the index's own field names (page_content, source, ...) for process_search_docs_response
+            doc = {field: value for field, value in record.items() if not field.startswith("@")}
+            bm25.add(" ".join(str(doc.get(field) or "") for field in TEXT_FIELDS))
+            encoded = (json.dumps(doc) + "\n").encode()
+            chunks.write(encoded)
+            offsets[row + 1] = offsets[row] + len(encoded)
+            row += 1
+            if len(batch) == BUILD_ROWS:
+                matrix[row - len(batch):row] = normalize_rows(np.asarray(batch, dtype=np.float32))
+                batch = []
+    if batch:
+        matrix[row - len(batch):row] = normalize_rows(np.asarray(batch, dtype=np.float32))
+    matrix.flush()
+    np.save(os.path.join(output_path, "chunk_offsets.npy"), offsets)
+
+    clusters = clusters or int(np.sqrt(rows))
+    if rows >= 1000 and clusters > 1:
+        np.savez(os.path.join(output_path, "ivf.npz"), **build_ivf(matrix, clusters))
+    del matrix
+
+    arrays, vocabulary = bm25.arrays()
+    np.savez(os.path.join(output_path, "bm25.npz"), **arrays)
+    with open(os.path.join(output_path, "vocabulary.json"), "w") as f:
+        json.dump(vocabulary, f)
+    return rows
+
+
+#-------------------------------------------------------------------------------------------------#
+#----Benchmark: IVF recall@k and latency against brute force---------------------------------------#
+#-------------------------------------------------------------------------------------------------#
+
+def write_synthetic_chunks(path: str, count: int, dimensions: int, topics: int = 256, seed: int = 0):
+    # Clustered random vectors, a rough stand-in for real embeddings
+    rng = np.random.default_rng(seed)
+    centers = normalize_rows(rng.standard_normal((topics, dimensions)))
+    with open(path, "w") as f:
+        for start in range(0, count, 10000):
+            size = min(10000, count - start)
+            topic = rng.integers(0, topics, size)
+            batch = normalize_rows(centers[topic] + 0.6 * rng.standard_normal((size, dimensions)) / np.sqrt(dimensions))
+            for offset, vector in enumerate(batch):
+                row = start + offset
+                f.write(json.dumps({
+                    "id": f"doc-{row}", "chunk_id": f"chunk-{row}", "title": f"Topic {topic[offset]}",
+                    "content": f"Synthetic chunk {row} about topic {topic[offset]}",
+                    "contentVector": [round(float(value), 5) for value in vector],
+                }) + "\n")
+
+
+def benchmark(index: LocalVectorIndex, queries: int = 200, k: int = 5, nprobe: int = LOCAL_KB_NPROBE, seed: int = 1):
+    rng = np.random.default_rng(seed)
+    rows = rng.integers(0, len(index), queries)
+    probes = normalize_rows(np.asarray(index.vectors[np.sort(rows)]) + 0.05 * rng.standard_normal((queries, index.vectors.shape[1])).astype(np.float32))
+
+    def timed(search):
+        latencies, results = [], []
+        for probe in probes:
+            started = time.perf_counter()
+            results.append(search(probe)[0])
+            latencies.append((time.perf_counter() - started) * 1000)
+        return results, latencies
+
+    exact, brute_ms = timed(lambda probe: index.brute_force(probe, k))
+    approximate, ivf_ms = timed(lambda probe: index.vector_search(probe, k, nprobe))
+    recall = np.mean([len(set(a.tolist()) & set(e.tolist())) / len(e) for a, e in zip(approximate, exact)])
+
+    summary = lambda values: {"p50_ms": float(np.percentile(values, 50)), "p95_ms": float(np.percentile(values, 95))}
+    return {
+        "chunks": len(index),
+        "dimensions": int(index.vectors.shape[1]),
+        "k": k,
+        "nprobe": nprobe if index.ivf is not None else 0,
+        "recall_at_k": float(recall),
+        "brute_force": summary(brute_ms),
+        "ivf": summary(ivf_ms),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build and benchmark the local knowledge base index")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build = commands.add_parser("build", help="build an index directory from a chunks JSONL file")
+    build.add_argument("--input", required=True, help="one search document per line, including its vector field")
+    build.add_argument("--output", required=True)
+    build.add_argument("--vector-field", default="contentVector")
+    build.add_argument("--clusters", type=int, default=0, help="IVF lists (default sqrt(chunks), none below 1000 chunks)")
+
+    bench = commands.add_parser("bench", help="recall and latency of IVF against brute force")
+    bench.add_argument("--index", help="index directory (omit with --synthetic)")
+    bench.add_argument("--synthetic", type=int, default=0, help="build a synthetic index with this many chunks")
+    bench.add_argument("--dimensions", type=int, default=1536)
+    bench.add_argument("--queries", type=int, default=200)
+    bench.add_argument("--k", type=int, default=5)
+    bench.add_argument("--nprobe", type=int, default=LOCAL_KB_NPROBE)
+
+    args = parser.parse_args(argv)
+    if args.command == "build":
+        count = build_index(args.input, args.output, args.vector_field, args.clusters)
+        print(f"Indexed {count} chunks into {args.output}")
+        return
+
+    path = args.index
+    if args.synthetic:
+        path = tempfile.mkdtemp(prefix="kb_index_")
+        chunks_path = os.path.join(path, "chunks.source.jsonl")
+        write_synthetic_chunks(chunks_path, args.synthetic, args.dimensions)
+        build_index(chunks_path, path)
+    if not path:
+        parser.error("bench needs --index or --synthetic")
+    print(json.dumps(benchmark(load_index(path), args.queries, args.k, args.nprobe), indent=2))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
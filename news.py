@@ -0,0 +1,142 @@
+import os
+import re
+import time
+import threading
+from concurrent.futures import Future
+from urllib.parse import urlsplit
+
+import http_transport
+import context_packer
+
+
+#-------------------------------------------------------------------------------------------------#
+#----Company news: Bing results projected to the fields the model uses, syndicated copies of the-#
+#----same story dropped, and the article list cached per company for a short TTL.----------------#
+#-------------------------------------------------------------------------------------------------#
+
+NEWS_MAX_ARTICLES = int(os.getenv("NEWS_MAX_ARTICLES", "5"))                     # articles per tool output
+NEWS_DESCRIPTION_CHARS = int(os.getenv("NEWS_DESCRIPTION_CHARS", "200"))         # description cut on a word boundary
+NEWS_CACHE_TTL = float(os.getenv("NEWS_CACHE_TTL_SECONDS", "300"))
+NEWS_DUPLICATE_THRESHOLD = float(os.getenv("NEWS_DUPLICATE_THRESHOLD", "0.8"))   # title overlap of a syndicated copy
+NEWS_MIN_CONTAINMENT_SHINGLES = int(os.getenv("NEWS_MIN_CONTAINMENT_SHINGLES", "4"))   # shorter titles compare by Jaccard
+NEWS_COALESCE = os.getenv("NEWS_COALESCE_ENABLED", "true").lower() == "true"   # concurrent questions share one fetch
+
+# "Title - Provider" and "Title | Provider" suffixes added by syndication
+TITLE_SUFFIX = re.compile(r"\s+[-|–—]\s+[^-|–—]{1,40}$")
+
+
+def call_bing(query: str) -> dict:
+    params = {"q": query, "mkt": "en-US", "count": NEWS_MAX_ARTICLES * 3}   # room for the duplicates
+    headers = {"Ocp-Apim-Subscription-Key": os.getenv("BING_SEARCH_KEY")}
+
+    # Call the API over the shared keep-alive pool
+    response = http_transport.get(os.getenv("BING_SEARCH_ENDPOINT"), service="bing", headers=headers, params=params)
+    response.raise_for_status()
+    return response.json()
+
+
+def news_values(response: dict) -> list:
+    # Web Search nests the articles under "news"; the News Search endpoint returns them at the top
+    news = response.get("news", response) if isinstance(response, dict) else None
+    return news.get("value", []) if isinstance(news, dict) else []
+
+
+def truncate(text: str, limit: int = NEWS_DESCRIPTION_CHARS) -> str:
+    text = " ".join((text or "").split())
+    if len(text) <= limit:
+        return text
+    return text[:limit].rsplit(" ", 1)[0] + "..."
+
+
+def project(article: dict) -> dict:
+    providers = article.get("provider") or [{}]
+    return {
+        "title": article.get("name", ""),
+        "date": (article.get("datePublished") or "")[:10],
+        "source": providers[0].get("name", ""),
+        "url": article.get("url", ""),
+        "description": truncate(article.get("description")),
+    }
+
+
+def story_key(article: dict):
+    # Shingles of the title without its provider suffix, and the URL without query or fragment
+    title = TITLE_SUFFIX.sub("", article["title"])
+    parts = urlsplit(article["url"])
+    return context_packer.shingles(title, 2), (parts.netloc.lower().removeprefix("www.") + parts.path.rstrip("/"))
+
+
+def title_overlap(a: set, b: set) -> float:
+    # Containment lets a copy with a few extra words match, but a short title such as "Microsoft
+    # earnings" is contained in any headline about them: short titles have to match as a whole
+    if min(len(a), len(b)) < NEWS_MIN_CONTAINMENT_SHINGLES:
+        return len(a & b) / len(a | b) if a or b else 0.0
+    return context_packer.overlap(a, b)
+
+
+def compact_news(response: dict, max_articles: int = NEWS_MAX_ARTICLES, threshold: float = NEWS_DUPLICATE_THRESHOLD) -> list:
+    # Bing ranks the articles; the first copy of each story is kept
+    articles, seen_titles, seen_urls = [], [], set()
+    for article in map(project, news_values(response)):
+        title, url = story_key(article)
+        if url in seen_urls or any(title_overlap(title, other) >= threshold for other in seen_titles):
+            continue
+        seen_titles.append(title)
+        seen_urls.add(url)
+        articles.append(article)
+        if len(articles) == max_articles:
+            break
+    return articles
+
+
+class NewsService:
+    def __init__(self, fetch=call_bing, ttl: float = NEWS_CACHE_TTL, coalesce: bool = NEWS_COALESCE):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.coalesce = coalesce
+        self.fetches = 0
+        self._lock = threading.Lock()
+        self._cache = {}      # company -> (articles, expires_at)
+        self._inflight = {}   # company -> Future shared by every caller waiting on it
+
+    def latest(self, company_name: str) -> list:
+        # "Microsoft", "microsoft" and "Microsoft " share one cache entry and one request
+        company = " ".join(company_name.lower().split())
+        with self._lock:
+            cached = self._cache.get(company)
+            if cached and cached[1] > time.monotonic():
+                return cached[0]
+            future = self._inflight.get(company) if self.coalesce else None
+            lead = future is None
+            if lead:
+                self.fetches += 1
+                future = Future()
+                if self.coalesce:
+                    self._inflight[company] = future
+
+        if not lead:
+            # The leader always settles the future, so a follower waits exactly as long as the
+            # leader's request takes, retries included (http_transport.py), and gets its outcome
+            return future.result()
+
+        try:
+            articles = compact_news(self.fetch(company_name))
+        except BaseException as e:
+            # Failures are not cached: the next question asks Bing again
+            with self._lock:
+                self._inflight.pop(company, None)
+            future.set_exception(e)
+            raise
+        with self._lock:
+            if self.ttl > 0:
+                self._cache[company] = (articles, time.monotonic() + self.ttl)
+            self._inflight.pop(company, None)
+        future.set_result(articles)
+        return articles
+
+
+news_service = NewsService()
+
+
+def latest_news(company_name: str) -> list:
+    return news_service.latest(company_name)
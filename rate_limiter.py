@@ -0,0 +1,298 @@
+import os
+import re
+import time
+import heapq
+import asyncio
+import itertools
+import threading
+import contextlib
+import contextvars
+from email.utils import parsedate_to_datetime
+
+try:
+    import httpx2 as httpx   # newer openai releases build their clients on httpx2
+except ImportError:
+    import httpx
+
+
+#-------------------------------------------------------------------------------------------------#
+#----Rate-limit-aware scheduler shared by every outbound call-------------------------------------#
+#----One limiter per endpoint ("openai", "embeddings", "search", "bing", "fx"), each with:--------#
+#----   a token bucket, tuned from x-ratelimit-* response headers--------------------------------#
+#----   an AIMD concurrency limit: +1/limit per success, halved on 429 / Retry-After-------------#
+#----   a priority queue, so interactive questions go ahead of batch jobs------------------------#
+#-------------------------------------------------------------------------------------------------#
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() != "false"
+RATE_LIMIT_MAX_CONCURRENCY = int(os.getenv("RATE_LIMIT_MAX_CONCURRENCY", "256"))   # per endpoint
+RATE_LIMIT_HEADROOM = float(os.getenv("RATE_LIMIT_HEADROOM", "0.9"))               # share of the quota we aim for
+RATE_LIMIT_MAX_WAIT = float(os.getenv("RATE_LIMIT_MAX_WAIT_SECONDS", "60"))        # longest Retry-After honoured
+
+INTERACTIVE = 0
+BATCH = 10
+
+THROTTLE_STATUSES = (429, 503)
+
+# Priority of the calls made in this context; asyncio tasks and the tool pool inherit it
+_priority = contextvars.ContextVar("rate_limit_priority", default=INTERACTIVE)
+
+
+@contextlib.contextmanager
+def priority(value: int):
+    token = _priority.set(value)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def set_priority(value: int):
+    _priority.set(value)
+
+
+def parse_seconds(value) -> float:
+    # "12", "1.5", "20ms", "6m0s" (OpenAI reset headers) or an HTTP date (Retry-After)
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = re.findall(r"(\d+(?:\.\d+)?)(ms|h|m|s)", value)
+    if parts and "".join(number + unit for number, unit in parts) == value:
+        scale = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+        return sum(float(number) * scale[unit] for number, unit in parts)
+    try:
+        return parsedate_to_datetime(value).timestamp() - time.time()
+    except (TypeError, ValueError):
+        return None
+
+
+def retry_after(headers) -> float:
+    if headers.get("retry-after-ms"):
+        seconds = parse_seconds(headers["retry-after-ms"])
+        return seconds / 1000 if seconds is not None else None
+    return parse_seconds(headers.get("Retry-After"))
+
+
+class Waiter:
+    __slots__ = ("granted", "cancelled", "wake")
+
+    def __init__(self, wake):
+        self.granted = False
+        self.cancelled = False
+        self.wake = wake
+
+
+class EndpointLimiter:
+    def __init__(self, name: str, rate: float = float("inf"), burst: float = None,
+                 concurrency: int = RATE_LIMIT_MAX_CONCURRENCY, max_concurrency: int = RATE_LIMIT_MAX_CONCURRENCY):
+        self.name = name
+        self.rate = rate                                    # tokens per second
+        self.burst = burst or (rate if rate != float("inf") else 1.0)
+        self.tokens = self.burst
+        self.refilled_at = time.monotonic()
+        self.limit = float(concurrency)                     # AIMD concurrency limit
+        self.max_concurrency = max_concurrency
+        self.slow_start = True                              # +1 per success until the first throttle
+        self.in_flight = 0
+        self.blocked_until = 0.0                            # Retry-After: nothing starts before this
+        self.decreased_at = 0.0
+        self.stats = {"granted": 0, "waited": 0, "throttled": 0}
+        self._lock = threading.Lock()
+        self._queue = []                                    # (priority, seq, Waiter)
+        self._seq = itertools.count()
+
+    #---Scheduling (called with the lock held)-------------------------------------------------#
+
+    def _refill(self, now: float):
+        if self.rate != float("inf"):
+            self.tokens = min(self.burst, self.tokens + (now - self.refilled_at) * self.rate)
+        self.refilled_at = now
+
+    def _dispatch(self) -> float:
+        # Grants the head of the queue while it can start; returns how long until it could
+        now = time.monotonic()
+        self._refill(now)
+        while self._queue:
+            waiter = self._queue[0][2]
+            if waiter.cancelled:
+                heapq.heappop(self._queue)
+                continue
+            if now < self.blocked_until:
+                return self.blocked_until - now
+            if self.in_flight >= max(int(self.limit), 1):
+                return None     # a release wakes the queue
+            if self.rate != float("inf") and self.tokens < 1:
+                return (1 - self.tokens) / self.rate
+            heapq.heappop(self._queue)
+            self.in_flight += 1
+            if self.rate != float("inf"):
+                self.tokens -= 1
+            self.stats["granted"] += 1
+            waiter.granted = True
+            waiter.wake()
+        return None
+
+    def _enqueue(self, wake) -> Waiter:
+        waiter = Waiter(wake)
+        heapq.heappush(self._queue, (_priority.get(), next(self._seq), waiter))
+        return waiter
+
+    #---Acquire / release---------------------------------------------------------------------#
+
+    def acquire(self):
+        event = threading.Event()
+        with self._lock:
+            waiter = self._enqueue(event.set)
+            delay = self._dispatch()
+            self.stats["waited"] += not waiter.granted
+        while not waiter.granted:
+            event.wait(delay)
+            with self._lock:
+                delay = self._dispatch()
+
+    async def acquire_async(self):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        wake = lambda: loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None))
+        with self._lock:
+            waiter = self._enqueue(wake)
+            delay = self._dispatch()
+            self.stats["waited"] += not waiter.granted
+        try:
+            while not waiter.granted:
+                try:
+                    await asyncio.wait_for(asyncio.shield(future), delay)
+                except asyncio.TimeoutError:
+                    pass
+                with self._lock:
+                    delay = self._dispatch()
+        except BaseException:
+            with self._lock:
+                waiter.cancelled = True
+                if waiter.granted:
+                    self._release(None)
+            raise
+
+    def release(self, status: int = None, headers=None):
+        with self._lock:
+            self._release(status, headers)
+
+    def _release(self, status, headers=None):
+        self.in_flight -= 1
+        if status is not None:
+            self._observe(status, headers or {})
+        self._dispatch()
+
+    #---Feedback from responses---------------------------------------------------------------#
+
+    def _observe(self, status: int, headers):
+        now = time.monotonic()
+        throttled = status in THROTTLE_STATUSES and (status == 429 or "Retry-After" in headers)
+        if throttled:
+            self.stats["throttled"] += 1
+            wait = retry_after(headers)
+            wait = min(wait if wait is not None else 1.0, RATE_LIMIT_MAX_WAIT)
+            self.blocked_until = max(self.blocked_until, now + wait)
+            # One decrease per throttle window: the other calls in flight hit the same limit
+            if now - self.decreased_at > max(wait, 0.1):
+                self.limit = max(1.0, min(self.limit, self.in_flight + 1) / 2)
+                self.slow_start = False
+                self.decreased_at = now
+        elif status < 400:
+            self.limit = min(float(self.max_concurrency), self.limit + (1 if self.slow_start else 1 / self.limit))
+
+        remaining = parse_seconds(headers.get("x-ratelimit-remaining-requests"))
+        if remaining is not None:
+            reset = parse_seconds(headers.get("x-ratelimit-reset-requests"))
+            limit = parse_seconds(headers.get("x-ratelimit-limit-requests"))
+            if reset:
+                # Spend what is left of this window evenly until it resets
+                self.rate = max(remaining * RATE_LIMIT_HEADROOM / reset, 0.1)
+                self.burst = max(self.rate, 1.0)
+            elif limit:
+                self.rate = max(limit * RATE_LIMIT_HEADROOM / 60, 0.1)    # Azure quotas are per minute
+                self.burst = max(self.rate, 1.0)
+            self.tokens = min(self.tokens, remaining * RATE_LIMIT_HEADROOM)
+            if remaining < 1:
+                self.blocked_until = max(self.blocked_until, now + (reset or 1.0))
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self.stats, limit=round(self.limit, 2), in_flight=self.in_flight, queued=len(self._queue),
+                        rate=None if self.rate == float("inf") else round(self.rate, 2))
+
+    #---Call wrappers-------------------------------------------------------------------------#
+
+    @contextlib.contextmanager
+    def slot(self):
+        # with limiter.slot() as outcome: response = send(); outcome.update(status=..., headers=...)
+        self.acquire()
+        outcome = {}
+        try:
+            yield outcome
+        finally:
+            self.release(outcome.get("status"), outcome.get("headers"))
+
+    @contextlib.asynccontextmanager
+    async def slot_async(self):
+        await self.acquire_async()
+        outcome = {}
+        try:
+            yield outcome
+        finally:
+            self.release(outcome.get("status"), outcome.get("headers"))
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def limiter(name: str) -> EndpointLimiter:
+    # RATE_LIMIT_RPS_<NAME> sets a starting request rate; otherwise only the headers set one
+    with _limiters_lock:
+        if name not in _limiters:
+            rate = os.getenv(f"RATE_LIMIT_RPS_{name.upper()}")
+            _limiters[name] = EndpointLimiter(name, float(rate) if rate else float("inf"))
+        return _limiters[name]
+
+
+def limiter_stats() -> dict:
+    with _limiters_lock:
+        limiters = dict(_limiters)
+    return {name: value.snapshot() for name, value in sorted(limiters.items())}
+
+
+#-------------------------------------------------------------------------------------------------#
+#----httpx transports for the OpenAI clients: every request (polls and SDK retries included)------#
+#----takes a slot. The slot is released when the headers arrive, so event streams do not hold it.-#
+#-------------------------------------------------------------------------------------------------#
+
+# Same pool limits as the OpenAI client's own default transport
+CLIENT_LIMITS = httpx.Limits(max_connections=1000, max_keepalive_connections=100)
+
+
+class LimitedTransport(httpx.HTTPTransport):
+    def __init__(self, name: str, **kwargs):
+        super().__init__(**{"limits": CLIENT_LIMITS, **kwargs})
+        self.limiter = limiter(name)
+
+    def handle_request(self, request):
+        with self.limiter.slot() as outcome:
+            response = super().handle_request(request)
+            outcome.update(status=response.status_code, headers=response.headers)
+        return response
+
+
+class AsyncLimitedTransport(httpx.AsyncHTTPTransport):
+    def __init__(self, name: str, **kwargs):
+        super().__init__(**{"limits": CLIENT_LIMITS, **kwargs})
+        self.limiter = limiter(name)
+
+    async def handle_async_request(self, request):
+        async with self.limiter.slot_async() as outcome:
+            response = await super().handle_async_request(request)
+            outcome.update(status=response.status_code, headers=response.headers)
+        return response
@@ -0,0 +1,291 @@
+import os
+import re
+import asyncio
+import time
+import random
+from dataclasses import dataclass
+from typing import Optional
+
+from openai import APIConnectionError, BadRequestError
+
+# openai 3.x is built on httpx2, earlier versions on httpx
+try:
+    import httpx2 as httpx
+except ImportError:
+    import httpx
+
+
+#-------------------------------------------------------------------------------------------------#
+#----Run waiting engine: streamed run events when available, adaptive polling otherwise-----------#
+#-------------------------------------------------------------------------------------------------#
+
+# Statuses after which the run will never change again
+TERMINAL_STATUSES = ("completed", "failed", "cancelled", "expired", "incomplete")
+
+# Statuses on which the caller has to act (or read the result)
+ACTIONABLE_STATUSES = TERMINAL_STATUSES + ("requires_action",)
+
+POLL_INITIAL_INTERVAL = float(os.getenv("RUN_POLL_INITIAL_INTERVAL", "0.25"))
+POLL_MAX_INTERVAL = float(os.getenv("RUN_POLL_MAX_INTERVAL", "2.0"))
+POLL_BACKOFF = float(os.getenv("RUN_POLL_BACKOFF", "1.5"))
+POLL_JITTER = float(os.getenv("RUN_POLL_JITTER", "0.2"))
+RUN_DEADLINE = float(os.getenv("RUN_DEADLINE_SECONDS", "300"))
+RUN_STREAM_IDLE_TIMEOUT = float(os.getenv("RUN_STREAM_IDLE_TIMEOUT_SECONDS", "30"))   # longest gap between two stream events
+
+# Flipped to False the first time the service rejects the stream parameter (older api-versions)
+_streaming_supported = os.getenv("RUN_STREAMING", "true").lower() != "false"
+
+
+class RunTimeoutError(TimeoutError):
+    pass
+
+
+# A stream that stalls past its read timeout or loses its connection; the run is finished by polling
+STREAM_DROPPED = (APIConnectionError, httpx.TransportError)
+
+
+def streaming_unsupported(error: BadRequestError) -> bool:
+    # Only a 400 about the stream parameter means this api-version has no streamed runs; any other
+    # 400 (invalid tool output, run already active, ...) is the caller's error and is raised
+    if getattr(error, "param", None) == "stream":
+        return True
+    return re.search(r"\bstream\b", str(error), re.IGNORECASE) is not None
+
+
+def stream_timeout(deadline: float, started: float) -> httpx.Timeout:
+    # Read timeout between stream events, so a stalled stream cannot outlive the deadline
+    remaining = max(deadline - (time.monotonic() - started), 1.0)
+    return httpx.Timeout(min(RUN_STREAM_IDLE_TIMEOUT, remaining), connect=10.0)
+
+
+@dataclass
+class RunWait:
+    mode: str                            # "stream" or "poll"
+    status: str
+    waited: float                        # wall-clock seconds we spent waiting on this step
+    polls: int = 0                       # runs.retrieve calls made
+    run_seconds: Optional[float] = None  # server side duration, once the run is terminal
+
+    def describe(self):
+        text = f"{self.mode}: waited {self.waited:.2f}s"
+        if self.polls:
+            text += f" over {self.polls} polls"
+        if self.run_seconds is not None:
+            text += f", run took {self.run_seconds:.2f}s"
+        return text
+
+
+def run_duration(run) -> Optional[float]:
+    ended_at = run.completed_at or run.failed_at or run.cancelled_at
+    if run.status == "expired":
+        ended_at = run.expires_at
+    if not ended_at:
+        return None
+    return float(ended_at - (run.started_at or run.created_at))
+
+
+#-------------------------------------------------------------------------------------------------#
+#function description: poll_run - capped exponential backoff with jitter and an overall deadline
+#-------------------------------------------------------------------------------------------------#
+
+def poll_run(client, thread_id: str, run_id: str, deadline: float = RUN_DEADLINE, started: float = None):
+    started = started or time.monotonic()
+    interval = POLL_INITIAL_INTERVAL
+    polls = 0
+
+    while True:
+        remaining = deadline - (time.monotonic() - started)
+        if remaining <= 0:
+            cancel_run(client, thread_id, run_id)
+            raise RunTimeoutError(f"Run {run_id} did not finish within {deadline:.0f}s")
+
+        time.sleep(min(interval * random.uniform(1 - POLL_JITTER, 1 + POLL_JITTER), remaining))
+
+        run = client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run_id)
+        polls += 1
+        if run.status in ACTIONABLE_STATUSES:
+            return run, RunWait("poll", run.status, time.monotonic() - started, polls, run_duration(run))
+
+        interval = min(interval * POLL_BACKOFF, POLL_MAX_INTERVAL)
+
+
+def cancel_run(client, thread_id: str, run_id: str):
+    try:
+        client.beta.threads.runs.cancel(thread_id=thread_id, run_id=run_id)
+    except Exception:
+        pass
+
+
+#-------------------------------------------------------------------------------------------------#
+#function description: wait_for_events - consume a run event stream up to the next actionable status
+#-------------------------------------------------------------------------------------------------#
+
+def wait_for_events(client, thread_id: str, events, deadline: float = RUN_DEADLINE, started: float = None):
+    started = started or time.monotonic()
+    run = None
+
+    try:
+        with events:
+            for event in events:
+                if not event.event.startswith("thread.run.") or event.event.startswith("thread.run.step"):
+                    continue
+                run = event.data
+                if run.status in ACTIONABLE_STATUSES:
+                    return run, RunWait("stream", run.status, time.monotonic() - started, 0, run_duration(run))
+                if time.monotonic() - started > deadline:
+                    break
+    except STREAM_DROPPED:
+        pass
+
+    if run is None:
+        raise RuntimeError("Run event stream ended before the run was created")
+
+    # The stream dropped (or the deadline passed) before the run settled: finish by polling
+    run, wait = poll_run(client, thread_id, run.id, deadline, started)
+    wait.mode = "stream+poll"
+    return run, wait
+
+
+#-------------------------------------------------------------------------------------------------#
+#function description: create_run / submit_tool_outputs - start a run step and wait until it settles
+#-------------------------------------------------------------------------------------------------#
+
+def create_run(client, thread_id: str, assistant_id: str, deadline: float = RUN_DEADLINE, **kwargs):
+    global _streaming_supported
+    started = time.monotonic()
+
+    if _streaming_supported:
+        try:
+            events = client.beta.threads.runs.create(
+                thread_id=thread_id, assistant_id=assistant_id, stream=True,
+                timeout=stream_timeout(deadline, started), **kwargs
+            )
+        except BadRequestError as e:
+            if not streaming_unsupported(e):
+                raise
+            _streaming_supported = False
+        else:
+            return wait_for_events(client, thread_id, events, deadline, started)
+
+    run = client.beta.threads.runs.create(thread_id=thread_id, assistant_id=assistant_id, **kwargs)
+    return poll_run(client, thread_id, run.id, deadline, started)
+
+
+def submit_tool_outputs(client, thread_id: str, run_id: str, tool_outputs, deadline: float = RUN_DEADLINE):
+    global _streaming_supported
+    started = time.monotonic()
+
+    if _streaming_supported:
+        try:
+            events = client.beta.threads.runs.submit_tool_outputs(
+                thread_id=thread_id, run_id=run_id, tool_outputs=tool_outputs, stream=True,
+                timeout=stream_timeout(deadline, started)
+            )
+        except BadRequestError as e:
+            if not streaming_unsupported(e):
+                raise
+            _streaming_supported = False
+        else:
+            return wait_for_events(client, thread_id, events, deadline, started)
+
+    client.beta.threads.runs.submit_tool_outputs(thread_id=thread_id, run_id=run_id, tool_outputs=tool_outputs)
+    return poll_run(client, thread_id, run_id, deadline, started)
+
+
+#-------------------------------------------------------------------------------------------------#
+#----Asyncio counterparts for AsyncAzureOpenAI clients--------------------------------------------#
+#-------------------------------------------------------------------------------------------------#
+
+async def poll_run_async(client, thread_id: str, run_id: str, deadline: float = RUN_DEADLINE, started: float = None):
+    started = started or time.monotonic()
+    interval = POLL_INITIAL_INTERVAL
+    polls = 0
+
+    while True:
+        remaining = deadline - (time.monotonic() - started)
+        if remaining <= 0:
+            await cancel_run_async(client, thread_id, run_id)
+            raise RunTimeoutError(f"Run {run_id} did not finish within {deadline:.0f}s")
+
+        await asyncio.sleep(min(interval * random.uniform(1 - POLL_JITTER, 1 + POLL_JITTER), remaining))
+
+        run = await client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run_id)
+        polls += 1
+        if run.status in ACTIONABLE_STATUSES:
+            return run, RunWait("poll", run.status, time.monotonic() - started, polls, run_duration(run))
+
+        interval = min(interval * POLL_BACKOFF, POLL_MAX_INTERVAL)
+
+
+async def cancel_run_async(client, thread_id: str, run_id: str):
+    try:
+        await client.beta.threads.runs.cancel(thread_id=thread_id, run_id=run_id)
+    except Exception:
+        pass
+
+
+async def wait_for_events_async(client, thread_id: str, events, deadline: float = RUN_DEADLINE, started: float = None):
+    started = started or time.monotonic()
+    run = None
+
+    try:
+        async with events:
+            async for event in events:
+                if not event.event.startswith("thread.run.") or event.event.startswith("thread.run.step"):
+                    continue
+                run = event.data
+                if run.status in ACTIONABLE_STATUSES:
+                    return run, RunWait("stream", run.status, time.monotonic() - started, 0, run_duration(run))
+                if time.monotonic() - started > deadline:
+                    break
+    except STREAM_DROPPED:
+        pass
+
+    if run is None:
+        raise RuntimeError("Run event stream ended before the run was created")
+
+    run, wait = await poll_run_async(client, thread_id, run.id, deadline, started)
+    wait.mode = "stream+poll"
+    return run, wait
+
+
+async def create_run_async(client, thread_id: str, assistant_id: str, deadline: float = RUN_DEADLINE, **kwargs):
+    global _streaming_supported
+    started = time.monotonic()
+
+    if _streaming_supported:
+        try:
+            events = await client.beta.threads.runs.create(
+                thread_id=thread_id, assistant_id=assistant_id, stream=True,
+                timeout=stream_timeout(deadline, started), **kwargs
+            )
+        except BadRequestError as e:
+            if not streaming_unsupported(e):
+                raise
+            _streaming_supported = False
+        else:
+            return await wait_for_events_async(client, thread_id, events, deadline, started)
+
+    run = await client.beta.threads.runs.create(thread_id=thread_id, assistant_id=assistant_id, **kwargs)
+    return await poll_run_async(client, thread_id, run.id, deadline, started)
+
+
+async def submit_tool_outputs_async(client, thread_id: str, run_id: str, tool_outputs, deadline: float = RUN_DEADLINE):
+    global _streaming_supported
+    started = time.monotonic()
+
+    if _streaming_supported:
+        try:
+            events = await client.beta.threads.runs.submit_tool_outputs(
+                thread_id=thread_id, run_id=run_id, tool_outputs=tool_outputs, stream=True,
+                timeout=stream_timeout(deadline, started)
+            )
+        except BadRequestError as e:
+            if not streaming_unsupported(e):
+                raise
+            _streaming_supported = False
+        else:
+            return await wait_for_events_async(client, thread_id, events, deadline, started)
+
+    await client.beta.threads.runs.submit_tool_outputs(thread_id=thread_id, run_id=run_id, tool_outputs=tool_outputs)
+    return await poll_run_async(client, thread_id, run_id, deadline, started)
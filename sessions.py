@@ -0,0 +1,355 @@
+import os
+import json
+import time
+import asyncio
+import itertools
+import threading
+from dataclasses import dataclass, asdict
+from typing import Optional
+
+from openai import NotFoundError
+
+import telemetry
+import run_waiter
+import streaming
+import assistant_engine
+import assistant_registry
+
+
+#-------------------------------------------------------------------------------------------------#
+#----Conversation sessions: one thread per user, reused across questions--------------------------#
+#----The question rides on runs.create (additional_messages), only the messages after the last----#
+#----one seen are listed, and a truncation strategy caps the context each run reads.--------------#
+#-------------------------------------------------------------------------------------------------#
+
+SESSION_STORE_PATH = os.getenv("SESSION_STORE_PATH", ".sessions.json")      # "" keeps sessions in memory only
+SESSION_IDLE_SECONDS = float(os.getenv("SESSION_IDLE_SECONDS", "3600"))      # then the next question starts a new thread
+SESSION_CONTEXT_MESSAGES = int(os.getenv("SESSION_CONTEXT_MESSAGES", "20"))  # truncation_strategy last_messages, 0 = auto
+SESSION_MAX_PROMPT_TOKENS = int(os.getenv("SESSION_MAX_PROMPT_TOKENS", "0")) # 0 = no cap
+SESSION_MESSAGES_PAGE = int(os.getenv("SESSION_MESSAGES_PAGE", "20"))        # limit per messages.list page
+
+
+@dataclass
+class Session:
+    key: str
+    thread_id: Optional[str] = None
+    last_message_id: Optional[str] = None   # cursor: newest message already read
+    turns: int = 0
+    last_used: float = 0.0
+
+
+class SessionStore:
+    def __init__(self, path: str = SESSION_STORE_PATH, idle_seconds: float = SESSION_IDLE_SECONDS):
+        self.path = path
+        self.idle_seconds = idle_seconds
+        self._lock = threading.Lock()
+        self._locks = {}         # key -> threading.Lock, one question per session at a time
+        self._async_locks = {}   # key -> asyncio.Lock
+        self._sessions = self.load()
+
+    def load(self) -> dict:
+        if not self.path:
+            return {}
+        try:
+            with open(self.path) as f:
+                return {key: Session(**value) for key, value in json.load(f).items()}
+        except (FileNotFoundError, json.JSONDecodeError, TypeError):
+            return {}
+
+    def save(self, session: Session):
+        with self._lock:
+            self._sessions[session.key] = session
+            if not self.path:
+                return
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({key: asdict(value) for key, value in self._sessions.items()}, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.path)
+
+    def get(self, key: str) -> Session:
+        with self._lock:
+            session = self._sessions.get(key)
+        if session is None or time.time() - session.last_used > self.idle_seconds:
+            return Session(key)
+        return session
+
+    def end(self, key: str):
+        # The next question of this user starts a new thread
+        self.save(Session(key))
+
+    def lock(self, key: str):
+        with self._lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def async_lock(self, key: str):
+        with self._lock:
+            return self._async_locks.setdefault(key, asyncio.Lock())
+
+
+session_store = SessionStore()
+
+
+def session_key(config, user_id: str) -> str:
+    return f"{config.name}:{user_id}"
+
+
+def run_options(question: str = None) -> dict:
+    options = {}
+    if question is not None:
+        options["additional_messages"] = [{"role": "user", "content": question}]
+    if SESSION_CONTEXT_MESSAGES > 0:
+        options["truncation_strategy"] = {"type": "last_messages", "last_messages": SESSION_CONTEXT_MESSAGES}
+    if SESSION_MAX_PROMPT_TOKENS > 0:
+        options["max_prompt_tokens"] = SESSION_MAX_PROMPT_TOKENS
+    return options
+
+
+def run_answer(messages, run_id: str):
+    # Text of the assistant messages this run added, oldest first
+    texts = [content.text.value for message in messages if message.role == "assistant" and message.run_id == run_id
+             for content in message.content if content.type == "text"]
+    return "\n\n".join(texts) if texts else None
+
+
+#-------------------------------------------------------------------------------------------------#
+#function description: ask
+#   First question: threads.create with the question, then the run. Later questions: one
+#   runs.create carrying the question. Either way the answer comes from the messages after the
+#   session's cursor, listed oldest first in pages of SESSION_MESSAGES_PAGE.
+#-------------------------------------------------------------------------------------------------#
+
+def list_new_messages(client, thread_id: str, after: Optional[str]):
+    messages = []
+    while True:
+        page = client.beta.threads.messages.list(thread_id=thread_id, order="asc", limit=SESSION_MESSAGES_PAGE,
+                                                 **({"after": after} if after else {}))
+        messages += page.data
+        if not page.data or not page.has_more:
+            return messages
+        after = page.data[-1].id
+
+
+def ask(question: str, config, user_id: str = "default"):
+    key = session_key(config, user_id)
+    with session_store.lock(key):
+        session = session_store.get(key)
+        telemetry.start_conversation(assistant=config.name, session=user_id)
+        with telemetry.span("conversation", turn=session.turns + 1):
+            client = assistant_registry.get_client()
+            with telemetry.span("assistants.get"):
+                assistant_id = assistant_registry.get_assistant_id(
+                    name=config.name,
+                    instructions=config.instructions,
+                    model=config.model,
+                    tools=config.tools,
+                )
+
+            try:
+                run_status = start_turn(client, session, assistant_id, question, config)
+            except run_waiter.RunTimeoutError as e:
+                return f"Error: {e}"
+            finally:
+                session.last_used = time.time()
+                session_store.save(session)
+
+            if run_status.status != 'completed':
+                return assistant_engine.run_error(run_status)
+
+            with telemetry.span("messages.list") as span:
+                messages = list_new_messages(client, session.thread_id, session.last_message_id)
+                answer = run_answer(messages, run_status.id)
+                span.set(payload_bytes=len(answer or ""), messages=len(messages))
+            if messages:
+                session.last_message_id = messages[-1].id
+            session.turns += 1
+            session_store.save(session)
+            return answer
+
+
+def start_turn(client, session: Session, assistant_id: str, question: str, config):
+    trace = assistant_engine.RunTrace()
+    if session.thread_id is not None:
+        telemetry.bind(thread_id=session.thread_id)
+        try:
+            return assistant_engine.drive_run(client, session.thread_id, assistant_id, config, trace, **run_options(question))
+        except NotFoundError:
+            # The thread was deleted or expired on the service side: start over
+            session.thread_id = None
+
+    with telemetry.span("threads.create", payload_bytes=len(question)):
+        thread = client.beta.threads.create(messages=[{"role": "user", "content": question}])
+    session.thread_id, session.last_message_id = thread.id, None
+    telemetry.bind(thread_id=thread.id)
+    return assistant_engine.drive_run(client, thread.id, assistant_id, config, trace, **run_options())
+
+
+#-------------------------------------------------------------------------------------------------#
+#function description: ask_async - same turn on AsyncAzureOpenAI
+#-------------------------------------------------------------------------------------------------#
+
+async def list_new_messages_async(client, thread_id: str, after: Optional[str]):
+    messages = []
+    while True:
+        page = await client.beta.threads.messages.list(thread_id=thread_id, order="asc", limit=SESSION_MESSAGES_PAGE,
+                                                       **({"after": after} if after else {}))
+        messages += page.data
+        if not page.data or not page.has_more:
+            return messages
+        after = page.data[-1].id
+
+
+async def ask_async(question: str, config, user_id: str = "default"):
+    key = session_key(config, user_id)
+    async with session_store.async_lock(key), assistant_engine.conversation_slots():
+        session = session_store.get(key)
+        telemetry.start_conversation(assistant=config.name, session=user_id)
+        with telemetry.span("conversation", turn=session.turns + 1):
+            client = assistant_registry.get_async_client()
+            with telemetry.span("assistants.get"):
+                assistant_id = await asyncio.to_thread(
+                    assistant_registry.get_assistant_id,
+                    name=config.name,
+                    instructions=config.instructions,
+                    model=config.model,
+                    tools=config.tools,
+                )
+
+            try:
+                run_status = await start_turn_async(client, session, assistant_id, question, config)
+            except run_waiter.RunTimeoutError as e:
+                return f"Error: {e}"
+            finally:
+                session.last_used = time.time()
+                session_store.save(session)
+
+            if run_status.status != 'completed':
+                return assistant_engine.run_error(run_status)
+
+            with telemetry.span("messages.list") as span:
+                messages = await list_new_messages_async(client, session.thread_id, session.last_message_id)
+                answer = run_answer(messages, run_status.id)
+                span.set(payload_bytes=len(answer or ""), messages=len(messages))
+            if messages:
+                session.last_message_id = messages[-1].id
+            session.turns += 1
+            session_store.save(session)
+            return answer
+
+
+async def start_turn_async(client, session: Session, assistant_id: str, question: str, config):
+    trace = assistant_engine.RunTrace()
+    if session.thread_id is not None:
+        telemetry.bind(thread_id=session.thread_id)
+        try:
+            return await assistant_engine.drive_run_async(client, session.thread_id, assistant_id, config, trace,
+                                                          **run_options(question))
+        except NotFoundError:
+            session.thread_id = None
+
+    with telemetry.span("threads.create", payload_bytes=len(question)):
+        thread = await client.beta.threads.create(messages=[{"role": "user", "content": question}])
+    session.thread_id, session.last_message_id = thread.id, None
+    telemetry.bind(thread_id=thread.id)
+    return await assistant_engine.drive_run_async(client, thread.id, assistant_id, config, trace, **run_options())
+
+
+#-------------------------------------------------------------------------------------------------#
+#function description: stream / stream_async
+#   Same turn as ask, as StreamEvents (streaming.py). The cursor moves to the last message the
+#   stream completed, so a later ask or stream lists only what comes after it.
+#-------------------------------------------------------------------------------------------------#
+
+def stream(question: str, config, user_id: str = "default"):
+    key = session_key(config, user_id)
+    with session_store.lock(key):
+        started = time.monotonic()
+        session = session_store.get(key)
+        telemetry.start_conversation(assistant=config.name, session=user_id, stream=True)
+        client = assistant_registry.get_client()
+        with telemetry.span("assistants.get"):
+            assistant_id = assistant_registry.get_assistant_id(
+                name=config.name,
+                instructions=config.instructions,
+                model=config.model,
+                tools=config.tools,
+            )
+
+        try:
+            if session.thread_id is not None:
+                telemetry.bind(thread_id=session.thread_id)
+                events = streaming.stream_run(client, session.thread_id, assistant_id, config, started, **run_options(question))
+                try:
+                    first = next(events)
+                except NotFoundError:
+                    session.thread_id = None
+                else:
+                    yield from turn_events(session, first, events)
+                    return
+
+            with telemetry.span("threads.create", payload_bytes=len(question)):
+                thread = client.beta.threads.create(messages=[{"role": "user", "content": question}])
+            session.thread_id, session.last_message_id = thread.id, None
+            telemetry.bind(thread_id=thread.id)
+            events = streaming.stream_run(client, thread.id, assistant_id, config, started, **run_options())
+            yield from turn_events(session, next(events), events)
+        finally:
+            session.last_used = time.time()
+            session_store.save(session)
+
+
+def turn_events(session: Session, first, events):
+    for event in itertools.chain((first,), events):
+        if event.type == "done":
+            session.last_message_id = event.data["message_id"] or session.last_message_id
+            session.turns += 1
+        yield event
+
+
+async def stream_async(question: str, config, user_id: str = "default"):
+    key = session_key(config, user_id)
+    async with session_store.async_lock(key), assistant_engine.conversation_slots():
+        started = time.monotonic()
+        session = session_store.get(key)
+        telemetry.start_conversation(assistant=config.name, session=user_id, stream=True)
+        client = assistant_registry.get_async_client()
+        with telemetry.span("assistants.get"):
+            assistant_id = await asyncio.to_thread(
+                assistant_registry.get_assistant_id,
+                name=config.name,
+                instructions=config.instructions,
+                model=config.model,
+                tools=config.tools,
+            )
+
+        try:
+            events = None
+            if session.thread_id is not None:
+                telemetry.bind(thread_id=session.thread_id)
+                events = streaming.stream_run_async(client, session.thread_id, assistant_id, config, started,
+                                                    **run_options(question))
+                try:
+                    first = await anext(events)
+                except NotFoundError:
+                    session.thread_id, events = None, None
+
+            if events is None:
+                with telemetry.span("threads.create", payload_bytes=len(question)):
+                    thread = await client.beta.threads.create(messages=[{"role": "user", "content": question}])
+                session.thread_id, session.last_message_id = thread.id, None
+                telemetry.bind(thread_id=thread.id)
+                events = streaming.stream_run_async(client, thread.id, assistant_id, config, started, **run_options())
+                first = await anext(events)
+
+            async for event in turn_events_async(session, first, events):
+                yield event
+        finally:
+            session.last_used = time.time()
+            session_store.save(session)
+
+
+async def turn_events_async(session: Session, first, events):
+    for event in turn_events(session, first, ()):
+        yield event
+    async for event in events:
+        for event in turn_events(session, event, ()):
+            yield event
@@ -0,0 +1,162 @@
+import os
+import time
+import threading
+from concurrent.futures import Future
+from datetime import datetime, timedelta, tzinfo
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+
+#-------------------------------------------------------------------------------------------------#
+#----Quote service: latest close per symbol, bulk downloads, market-hours-aware expiry------------#
+#-------------------------------------------------------------------------------------------------#
+
+STOCK_QUOTE_TTL = float(os.getenv("STOCK_QUOTE_TTL_SECONDS", "60"))           # while the market is open
+STOCK_BATCH_WINDOW = float(os.getenv("STOCK_BATCH_WINDOW_SECONDS", "0.02"))   # wait to batch concurrent misses
+STOCK_FETCH_TIMEOUT = float(os.getenv("STOCK_FETCH_TIMEOUT_SECONDS", "15"))
+
+class USEastern(tzinfo):
+    # UTC-5, UTC-4 from the second Sunday of March to the first Sunday of November (2 a.m. local).
+    # Used when the system has no IANA time zone database and the tzdata package is missing.
+    def utcoffset(self, dt):
+        return timedelta(hours=-5) + self.dst(dt)
+
+    def dst(self, dt):
+        if dt is None:
+            return timedelta(0)
+        starts = self.sunday(dt.year, 3, 8).replace(hour=2)
+        ends = self.sunday(dt.year, 11, 1).replace(hour=1)   # 2 a.m. daylight time is 1 a.m. standard time
+        return timedelta(hours=1) if starts <= dt.replace(tzinfo=None) < ends else timedelta(0)
+
+    def tzname(self, dt):
+        return "EDT" if self.dst(dt) else "EST"
+
+    @staticmethod
+    def sunday(year: int, month: int, first_day: int) -> datetime:
+        day = datetime(year, month, first_day)
+        return day + timedelta(days=6 - day.weekday())
+
+
+try:
+    MARKET_TIMEZONE = ZoneInfo("America/New_York")
+except ZoneInfoNotFoundError:
+    MARKET_TIMEZONE = USEastern()
+MARKET_OPEN = (9, 30)
+MARKET_CLOSE = (16, 0)
+
+
+def quote_expiry(now: float) -> float:
+    # While the market is open a close moves, so keep it for STOCK_QUOTE_TTL. Outside trading
+    # hours the last close holds until the next session opens (exchange holidays are ignored).
+    # STOCK_QUOTE_TTL_SECONDS=0 turns the cache off at any hour.
+    if STOCK_QUOTE_TTL <= 0:
+        return now
+    local = datetime.fromtimestamp(now, MARKET_TIMEZONE)
+    opens = local.replace(hour=MARKET_OPEN[0], minute=MARKET_OPEN[1], second=0, microsecond=0)
+    closes = local.replace(hour=MARKET_CLOSE[0], minute=MARKET_CLOSE[1], second=0, microsecond=0)
+
+    if local.weekday() < 5 and opens <= local < closes:
+        return min(now + STOCK_QUOTE_TTL, closes.timestamp() + STOCK_QUOTE_TTL)
+
+    next_open = opens if local < opens else opens + timedelta(days=1)
+    while next_open.weekday() >= 5:
+        next_open += timedelta(days=1)
+    return next_open.timestamp()
+
+
+def yfinance_module():
+    # yfinance pulls in pandas, which makes it slow to import: loaded on the first download, or by warm_up
+    import yfinance
+    return yfinance
+
+
+def download_closes(symbols) -> dict:
+    # One bulk download for all symbols; "5d" so there is a close on weekends and before the open
+    data = yfinance_module().download(symbols, period="5d", progress=False, auto_adjust=False, threads=True)
+    closes = data["Close"]
+    if getattr(closes, "ndim", 1) == 1:
+        closes = closes.to_frame(symbols[0])
+
+    result = {}
+    for symbol in symbols:
+        if symbol in closes:
+            column = closes[symbol].dropna()
+            if not column.empty:
+                result[symbol] = float(column.iloc[-1])
+    return result
+
+
+class QuoteService:
+    def __init__(self, download=download_closes, batch_window: float = STOCK_BATCH_WINDOW):
+        self.download = download
+        self.batch_window = batch_window
+        self.downloads = 0
+        self._lock = threading.Lock()
+        self._cache = {}      # symbol -> (price, expires_at)
+        self._inflight = {}   # symbol -> Future shared by every caller waiting on it
+        self._pending = set() # symbols for the next bulk download
+        self._batch_open = False
+
+    def get_prices(self, symbols) -> dict:
+        symbols = [symbol.strip().upper() for symbol in symbols]
+        now = time.time()
+        prices, waiting = {}, {}
+
+        with self._lock:
+            for symbol in dict.fromkeys(symbols):
+                cached = self._cache.get(symbol)
+                if cached and cached[1] > now:
+                    prices[symbol] = cached[0]
+                    continue
+                if symbol not in self._inflight:
+                    self._inflight[symbol] = Future()
+                    self._pending.add(symbol)
+                waiting[symbol] = self._inflight[symbol]
+
+            lead_batch = bool(self._pending) and not self._batch_open
+            if lead_batch:
+                self._batch_open = True
+
+        if lead_batch:
+            # Give concurrent callers a moment to add their symbols to this download
+            time.sleep(self.batch_window)
+            self.flush()
+
+        for symbol, future in waiting.items():
+            try:
+                prices[symbol] = future.result(timeout=STOCK_FETCH_TIMEOUT)
+            except Exception as e:
+                prices[symbol] = e
+        return prices
+
+    def flush(self):
+        with self._lock:
+            batch = sorted(self._pending)
+            self._pending = set()
+            self._batch_open = False
+        if not batch:
+            return
+
+        try:
+            self.downloads += 1
+            closes = self.download(batch)
+        except Exception as e:
+            closes, error = {}, e
+        else:
+            error = None
+
+        expires_at = quote_expiry(time.time())
+        with self._lock:
+            for symbol in batch:
+                future = self._inflight.pop(symbol)
+                if symbol in closes:
+                    self._cache[symbol] = (closes[symbol], expires_at)
+                    future.set_result(closes[symbol])
+                else:
+                    future.set_exception(error or ValueError(f"No price data for {symbol}"))
+
+
+quote_service = QuoteService()
+
+
+def get_prices(symbols) -> dict:
+    return quote_service.get_prices(symbols)
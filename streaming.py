@@ -0,0 +1,331 @@
+import time
+import asyncio
+from dataclasses import dataclass, field
+
+from openai import BadRequestError, NotFoundError
+
+import telemetry
+import run_waiter
+import tool_executor
+import assistant_engine
+import assistant_registry
+
+
+#-------------------------------------------------------------------------------------------------#
+#----Streaming: text deltas and tool events of a run as they happen. requires_action is handled---#
+#----inside the stream: the tools run and their outputs are submitted with stream=True, so the----#
+#----same iterator continues with the rest of the run.---------------------------------------------#
+#-------------------------------------------------------------------------------------------------#
+
+@dataclass
+class StreamEvent:
+    type: str                                   # "text", "tool_call", "tool_result", "done" or "error"
+    text: str = ""                              # text delta, or the error message
+    data: dict = field(default_factory=dict)    # tool name / arguments / output; timings on "done"
+
+
+class StreamState:
+    def __init__(self, started: float):
+        self.started = started
+        self.first_token_at = None
+        self.streamed = []          # text deltas yielded so far
+        self.message_id = None      # last assistant message completed in the stream
+
+    def text(self, value: str) -> StreamEvent:
+        if self.first_token_at is None:
+            self.first_token_at = time.monotonic()
+            telemetry.record("stream.first_token", self.first_token_at - self.started)
+        self.streamed.append(value)
+        return StreamEvent("text", value)
+
+    def done(self, run_id: str) -> StreamEvent:
+        seconds = time.monotonic() - self.started
+        telemetry.record("stream.total", seconds, run_id=run_id)
+        ttft = self.first_token_at - self.started if self.first_token_at is not None else None
+        return StreamEvent("done", data={"run_id": run_id, "message_id": self.message_id,
+                                         "ttft_seconds": ttft, "seconds": seconds})
+
+
+def delta_text(delta) -> str:
+    return "".join(part.text.value or "" for part in delta.content or []
+                   if part.type == "text" and part.text is not None)
+
+
+def run_text(messages, run_id: str) -> str:
+    return "".join(content.text.value for message in messages if message.role == "assistant" and message.run_id == run_id
+                   for content in message.content if content.type == "text")
+
+
+def tool_events(tool_calls, tools_output):
+    for action, output in zip(tool_calls, tools_output):
+        yield StreamEvent("tool_result", data={"name": action["function"]["name"], "output": output["output"]})
+
+
+def timed_out(state: StreamState) -> bool:
+    return time.monotonic() - state.started > run_waiter.RUN_DEADLINE
+
+
+#-------------------------------------------------------------------------------------------------#
+#function description: stream_run
+#   Streams one run on an existing thread. The last event is "done" (run_id, message_id,
+#   ttft_seconds, seconds) or "error". A dropped stream is finished by polling, and the text
+#   the stream did not deliver is read from the run's messages.
+#-------------------------------------------------------------------------------------------------#
+
+def stream_run(client, thread_id: str, assistant_id: str, config, started: float = None, **run_options):
+    state = StreamState(started or time.monotonic())
+    trace = assistant_engine.RunTrace()
+    events = None
+    if run_waiter._streaming_supported:
+        start = lambda assistant_id: client.beta.threads.runs.create(
+            thread_id=thread_id, assistant_id=assistant_id, stream=True, instructions=config.run_instructions,
+            timeout=run_waiter.stream_timeout(run_waiter.RUN_DEADLINE, state.started), **run_options)
+        try:
+            try:
+                events = start(assistant_id)
+            except NotFoundError:
+                # The assistant may have been deleted after it was verified: recreate it once
+                assistant_id = assistant_engine.replacement_assistant(assistant_id, config)
+                if assistant_id is None:
+                    raise
+                events = start(assistant_id)
+        except BadRequestError as e:
+            if not run_waiter.streaming_unsupported(e):
+                raise
+            run_waiter._streaming_supported = False
+    if events is None:
+        # api-version without streamed runs: one text event with the whole answer
+        yield from answer_without_stream(client, thread_id, assistant_id, config, state, trace, run_options)
+        return
+
+    while True:
+        run = None
+        try:
+            with events:
+                for event in events:
+                    if event.event == "thread.message.delta":
+                        text = delta_text(event.data.delta)
+                        if text:
+                            yield state.text(text)
+                    elif event.event == "thread.message.completed":
+                        state.message_id = event.data.id
+                    elif event.event.startswith("thread.run.") and not event.event.startswith("thread.run.step"):
+                        run = event.data
+                        if run.status in run_waiter.ACTIONABLE_STATUSES or timed_out(state):
+                            break
+        except run_waiter.STREAM_DROPPED:
+            pass   # a stalled or dropped stream: the run is finished by polling below
+
+        if run is None:
+            yield StreamEvent("error", "Error: run event stream ended before the run was created")
+            return
+        try:
+            if run.status not in run_waiter.ACTIONABLE_STATUSES:
+                run, _ = run_waiter.poll_run(client, thread_id, run.id, run_waiter.RUN_DEADLINE, state.started)
+                if run.status == "completed":
+                    yield from missing_text(client.beta.threads.messages.list(thread_id=thread_id, run_id=run.id, order="asc"),
+                                            run.id, state)
+        except run_waiter.RunTimeoutError as e:
+            yield StreamEvent("error", f"Error: {e}")
+            return
+
+        if run.status != "requires_action":
+            yield state.done(run.id) if run.status == "completed" else StreamEvent("error", assistant_engine.run_error(run))
+            return
+
+        tool_calls = run.required_action.submit_tool_outputs.model_dump()["tool_calls"]
+        for action in tool_calls:
+            yield StreamEvent("tool_call", data={"name": action["function"]["name"], "arguments": action["function"]["arguments"]})
+        with telemetry.span("tools", tool_calls=len(tool_calls)) as span:
+            step_events = len(trace.tool_cache_events)
+            tools_output = tool_executor.execute_tool_calls(tool_calls, config.functions, timeouts=config.timeouts,
+                                                            cache_ttls=config.cache_ttls, cache_events=trace.tool_cache_events,
+                                                            prefetch=trace.prefetch)
+            span.set(payload_bytes=assistant_engine.output_bytes(tools_output), **trace.cache_counts(step_events))
+        trace.record(tool_calls, tools_output)
+        yield from tool_events(tool_calls, tools_output)
+
+        events = client.beta.threads.runs.submit_tool_outputs(thread_id=thread_id, run_id=run.id,
+                                                              tool_outputs=tools_output, stream=True,
+                                                              timeout=run_waiter.stream_timeout(run_waiter.RUN_DEADLINE, state.started))
+
+
+def missing_text(messages, run_id: str, state: StreamState):
+    text = run_text(messages.data, run_id)
+    streamed = "".join(state.streamed)
+    if text.startswith(streamed) and len(text) > len(streamed):
+        yield state.text(text[len(streamed):])
+    if messages.data:
+        state.message_id = messages.data[-1].id
+
+
+def answer_without_stream(client, thread_id, assistant_id, config, state, trace, run_options):
+    try:
+        run = assistant_engine.drive_run(client, thread_id, assistant_id, config, trace, **run_options)
+    except run_waiter.RunTimeoutError as e:
+        yield StreamEvent("error", f"Error: {e}")
+        return
+    if run.status != "completed":
+        yield StreamEvent("error", assistant_engine.run_error(run))
+        return
+    yield from missing_text(client.beta.threads.messages.list(thread_id=thread_id, run_id=run.id, order="asc"), run.id, state)
+    yield state.done(run.id)
+
+
+#-------------------------------------------------------------------------------------------------#
+#function description: stream_llm_request - new thread per question, like process_llm_request
+#-------------------------------------------------------------------------------------------------#
+
+def stream_llm_request(question: str, config):
+    started = time.monotonic()
+    telemetry.start_conversation(assistant=config.name, stream=True)
+    client = assistant_registry.get_client()
+    with telemetry.span("assistants.get"):
+        assistant_id = assistant_registry.get_assistant_id(
+            name=config.name,
+            instructions=config.instructions,
+            model=config.model,
+            tools=config.tools,
+        )
+    with telemetry.span("threads.create", payload_bytes=len(question)):
+        thread = client.beta.threads.create(messages=[{"role": "user", "content": question}])
+    telemetry.bind(thread_id=thread.id)
+    yield from stream_run(client, thread.id, assistant_id, config, started)
+
+
+#-------------------------------------------------------------------------------------------------#
+#----Asyncio counterparts: async iterators of the same events--------------------------------------#
+#-------------------------------------------------------------------------------------------------#
+
+async def stream_run_async(client, thread_id: str, assistant_id: str, config, started: float = None, **run_options):
+    state = StreamState(started or time.monotonic())
+    trace = assistant_engine.RunTrace()
+    events = None
+    if run_waiter._streaming_supported:
+        start = lambda assistant_id: client.beta.threads.runs.create(
+            thread_id=thread_id, assistant_id=assistant_id, stream=True, instructions=config.run_instructions,
+            timeout=run_waiter.stream_timeout(run_waiter.RUN_DEADLINE, state.started), **run_options)
+        try:
+            try:
+                events = await start(assistant_id)
+            except NotFoundError:
+                assistant_id = await asyncio.to_thread(assistant_engine.replacement_assistant, assistant_id, config)
+                if assistant_id is None:
+                    raise
+                events = await start(assistant_id)
+        except BadRequestError as e:
+            if not run_waiter.streaming_unsupported(e):
+                raise
+            run_waiter._streaming_supported = False
+    if events is None:
+        async for event in answer_without_stream_async(client, thread_id, assistant_id, config, state, trace, run_options):
+            yield event
+        return
+
+    while True:
+        run = None
+        try:
+            async with events:
+                async for event in events:
+                    if event.event == "thread.message.delta":
+                        text = delta_text(event.data.delta)
+                        if text:
+                            yield state.text(text)
+                    elif event.event == "thread.message.completed":
+                        state.message_id = event.data.id
+                    elif event.event.startswith("thread.run.") and not event.event.startswith("thread.run.step"):
+                        run = event.data
+                        if run.status in run_waiter.ACTIONABLE_STATUSES or timed_out(state):
+                            break
+        except run_waiter.STREAM_DROPPED:
+            pass   # a stalled or dropped stream: the run is finished by polling below
+
+        if run is None:
+            yield StreamEvent("error", "Error: run event stream ended before the run was created")
+            return
+        try:
+            if run.status not in run_waiter.ACTIONABLE_STATUSES:
+                run, _ = await run_waiter.poll_run_async(client, thread_id, run.id, run_waiter.RUN_DEADLINE, state.started)
+                if run.status == "completed":
+                    messages = await client.beta.threads.messages.list(thread_id=thread_id, run_id=run.id, order="asc")
+                    for event in missing_text(messages, run.id, state):
+                        yield event
+        except run_waiter.RunTimeoutError as e:
+            yield StreamEvent("error", f"Error: {e}")
+            return
+
+        if run.status != "requires_action":
+            yield state.done(run.id) if run.status == "completed" else StreamEvent("error", assistant_engine.run_error(run))
+            return
+
+        tool_calls = run.required_action.submit_tool_outputs.model_dump()["tool_calls"]
+        for action in tool_calls:
+            yield StreamEvent("tool_call", data={"name": action["function"]["name"], "arguments": action["function"]["arguments"]})
+        with telemetry.span("tools", tool_calls=len(tool_calls)) as span:
+            step_events = len(trace.tool_cache_events)
+            tools_output = await tool_executor.execute_tool_calls_async(tool_calls, config.functions, timeouts=config.timeouts,
+                                                                        cache_ttls=config.cache_ttls, cache_events=trace.tool_cache_events,
+                                                                        prefetch=trace.prefetch)
+            span.set(payload_bytes=assistant_engine.output_bytes(tools_output), **trace.cache_counts(step_events))
+        trace.record(tool_calls, tools_output)
+        for event in tool_events(tool_calls, tools_output):
+            yield event
+
+        events = await client.beta.threads.runs.submit_tool_outputs(thread_id=thread_id, run_id=run.id,
+                                                                    tool_outputs=tools_output, stream=True,
+                                                              timeout=run_waiter.stream_timeout(run_waiter.RUN_DEADLINE, state.started))
+
+
+async def answer_without_stream_async(client, thread_id, assistant_id, config, state, trace, run_options):
+    try:
+        run = await assistant_engine.drive_run_async(client, thread_id, assistant_id, config, trace, **run_options)
+    except run_waiter.RunTimeoutError as e:
+        yield StreamEvent("error", f"Error: {e}")
+        return
+    if run.status != "completed":
+        yield StreamEvent("error", assistant_engine.run_error(run))
+        return
+    messages = await client.beta.threads.messages.list(thread_id=thread_id, run_id=run.id, order="asc")
+    for event in missing_text(messages, run.id, state):
+        yield event
+    yield state.done(run.id)
+
+
+async def stream_llm_request_async(question: str, config):
+    started = time.monotonic()
+    telemetry.start_conversation(assistant=config.name, stream=True)
+    async with assistant_engine.conversation_slots():
+        client = assistant_registry.get_async_client()
+        with telemetry.span("assistants.get"):
+            assistant_id = await asyncio.to_thread(
+                assistant_registry.get_assistant_id,
+                name=config.name,
+                instructions=config.instructions,
+                model=config.model,
+                tools=config.tools,
+            )
+        with telemetry.span("threads.create", payload_bytes=len(question)):
+            thread = await client.beta.threads.create(messages=[{"role": "user", "content": question}])
+        telemetry.bind(thread_id=thread.id)
+        async for event in stream_run_async(client, thread.id, assistant_id, config, started):
+            yield event
+
+
+#-------------------------------------------------------------------------------------------------#
+#function description: print_stream - CLI output: text as it arrives, then time to first token
+#-------------------------------------------------------------------------------------------------#
+
+def print_stream(events) -> str:
+    parts = []
+    for event in events:
+        if event.type == "text":
+            print(event.text, end="", flush=True)
+            parts.append(event.text)
+        elif event.type == "error":
+            print(event.text)
+        elif event.type == "done":
+            ttft = event.data["ttft_seconds"]
+            print()
+            print(f"\033[90mFirst token after {ttft:.2f}s, answer in {event.data['seconds']:.2f}s\033[0m"
+                  if ttft is not None else f"\033[90mAnswer in {event.data['seconds']:.2f}s\033[0m")
+    return "".join(parts)
@@ -0,0 +1,224 @@
+import os
+import time
+import threading
+import contextvars
+from collections import Counter, defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+#-------------------------------------------------------------------------------------------------#
+#----Telemetry: timing spans around each phase of a conversation and each tool call---------------#
+#----TELEMETRY_EXPORT is a comma separated list of exporters:--------------------------------------#
+#----   prometheus  latency histograms, served as text on TELEMETRY_PROMETHEUS_PORT (/metrics)-------#
+#----   otel        OpenTelemetry spans through opentelemetry-api (the SDK decides where they go)----#
+#----Empty (default) turns span() into a shared no-op object.--------------------------------------#
+#-------------------------------------------------------------------------------------------------#
+
+TELEMETRY_EXPORT = {name.strip() for name in os.getenv("TELEMETRY_EXPORT", "").lower().split(",") if name.strip()}
+TELEMETRY_PROMETHEUS_PORT = int(os.getenv("TELEMETRY_PROMETHEUS_PORT", "0"))   # 0 = render_prometheus() only
+TELEMETRY_PROMETHEUS_HOST = os.getenv("TELEMETRY_PROMETHEUS_HOST", "127.0.0.1")   # "0.0.0.0" to let other hosts scrape
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Attributes every span of the current conversation carries (thread_id, run_id). Tool calls run on
+# the tool pool with a copy of the caller's context, so they see the same dict.
+_conversation = contextvars.ContextVar("telemetry_conversation", default=None)
+
+
+def start_conversation(**attributes):
+    _conversation.set(dict(attributes))
+
+
+def bind(**attributes):
+    # Adds attributes (thread_id once the thread exists, run_id once the run does) to every later span
+    conversation = _conversation.get()
+    if conversation is not None:
+        conversation.update(attributes)
+
+
+#-------------------------------------------------------------------------------------------------#
+#----Prometheus exporter: one histogram per phase plus error, poll and payload counters-----------#
+#-------------------------------------------------------------------------------------------------#
+
+class PhaseHistograms:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counts = defaultdict(lambda: [0] * (len(buckets) + 1))   # phase -> count per bucket, +Inf last
+        self._sums = Counter()
+        self._errors = Counter()
+        self._polls = Counter()
+        self._payload_bytes = Counter()
+        self._reused = Counter()
+
+    def observe(self, phase: str, seconds: float, attributes: dict, error: bool):
+        index = next((i for i, bound in enumerate(self.buckets) if seconds <= bound), len(self.buckets))
+        with self._lock:
+            self._counts[phase][index] += 1
+            self._sums[phase] += seconds
+            if error:
+                self._errors[phase] += 1
+            self._polls[phase] += attributes.get("polls", 0)
+            self._payload_bytes[phase] += attributes.get("payload_bytes", 0)
+            # Set on "tools" spans (assistant_engine.RunTrace.cache_counts)
+            self._reused[phase] += sum(attributes.get(name, 0) for name in ("cache_hits", "cache_shared", "prefetched"))
+
+    def render(self) -> str:
+        lines = [
+            "# HELP assistant_phase_duration_seconds Time spent in each phase of a conversation",
+            "# TYPE assistant_phase_duration_seconds histogram",
+        ]
+        with self._lock:
+            for phase in sorted(self._counts):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), self._counts[phase]):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f'assistant_phase_duration_seconds_bucket{{phase="{phase}",le="{le}"}} {cumulative}')
+                lines.append(f'assistant_phase_duration_seconds_sum{{phase="{phase}"}} {self._sums[phase]:.6f}')
+                lines.append(f'assistant_phase_duration_seconds_count{{phase="{phase}"}} {cumulative}')
+            for name, help_text, counter in (
+                ("assistant_phase_errors_total", "Phases that raised", self._errors),
+                ("assistant_run_polls_total", "runs.retrieve calls made while waiting on a run", self._polls),
+                ("assistant_phase_payload_bytes_total", "Bytes of tool outputs and answers", self._payload_bytes),
+                ("assistant_tool_outputs_reused_total", "Tool outputs from the tool cache, a shared call or a prefetch", self._reused),
+            ):
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+                lines += [f'{name}{{phase="{phase}"}} {value}' for phase, value in sorted(counter.items()) if value]
+        return "\n".join(lines) + "\n"
+
+
+histograms = PhaseHistograms()
+
+
+def render_prometheus() -> str:
+    return histograms.render()
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port: int = TELEMETRY_PROMETHEUS_PORT, host: str = TELEMETRY_PROMETHEUS_HOST):
+    global _server
+    with _server_lock:
+        if _server is None:
+            _server = ThreadingHTTPServer((host, port), MetricsHandler)
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, name="metrics", daemon=True).start()
+        return _server
+
+
+#-------------------------------------------------------------------------------------------------#
+#----OpenTelemetry exporter: optional, needs opentelemetry-api (and an SDK to export anywhere)----#
+#-------------------------------------------------------------------------------------------------#
+
+_tracer = None
+if "otel" in TELEMETRY_EXPORT:
+    try:
+        from opentelemetry import trace as otel_trace
+        _tracer = otel_trace.get_tracer("assistant_engine")
+    except ImportError as e:
+        print(f"OpenTelemetry export disabled: {e}")
+        TELEMETRY_EXPORT.discard("otel")
+
+if "prometheus" in TELEMETRY_EXPORT and TELEMETRY_PROMETHEUS_PORT:
+    start_metrics_server()
+
+
+#-------------------------------------------------------------------------------------------------#
+#----Spans----------------------------------------------------------------------------------------#
+#-------------------------------------------------------------------------------------------------#
+
+class Span:
+    __slots__ = ("name", "attributes", "started", "otel_context")
+
+    def __init__(self, name: str, attributes: dict):
+        self.name = name
+        self.attributes = attributes
+        self.otel_context = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def __enter__(self):
+        conversation = _conversation.get()
+        if conversation:
+            self.attributes = {**conversation, **self.attributes}
+        if _tracer is not None:
+            self.otel_context = _tracer.start_as_current_span(self.name)
+            self.otel_context.__enter__()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self.started
+        conversation = _conversation.get()
+        if conversation:
+            # IDs bound while the span was open (the run is created inside "runs.create")
+            self.attributes = {**conversation, **self.attributes}
+        if "prometheus" in TELEMETRY_EXPORT:
+            histograms.observe(self.name, seconds, self.attributes, exc_type is not None)
+        if self.otel_context is not None:
+            otel_span = otel_trace.get_current_span()
+            otel_span.set_attributes({key: value for key, value in self.attributes.items()
+                                      if isinstance(value, (str, bool, int, float))})
+            self.otel_context.__exit__(exc_type, exc, tb)
+        return False
+
+
+class NoopSpan:
+    __slots__ = ()
+
+    def set(self, **attributes):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP_SPAN = NoopSpan()
+
+
+def span(name: str, **attributes):
+    if not TELEMETRY_EXPORT:
+        return NOOP_SPAN
+    return Span(name, attributes)
+
+
+def record(name: str, seconds: float, **attributes):
+    # A phase timed by the caller that ended just now; for phases that span generator yields,
+    # where a span would stay current in the consumer's context
+    if not TELEMETRY_EXPORT:
+        return
+    attributes = {**(_conversation.get() or {}), **attributes}
+    if "prometheus" in TELEMETRY_EXPORT:
+        histograms.observe(name, seconds, attributes, False)
+    if _tracer is not None:
+        ended = time.time_ns()
+        otel_span = _tracer.start_span(name, start_time=ended - int(seconds * 1e9), attributes={
+            key: value for key, value in attributes.items() if isinstance(value, (str, bool, int, float))})
+        otel_span.end(end_time=ended)
+
+
+def enabled() -> bool:
+    return bool(TELEMETRY_EXPORT)
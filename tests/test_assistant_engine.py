@@ -0,0 +1,97 @@
+import os
+import sys
+import json
+import types
+import asyncio
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import pytest
+
+import telemetry
+import tool_registry
+import assistant_engine
+import assistant_registry
+
+
+class Assistants:
+    def __init__(self, error=None):
+        self.error = error
+
+    def retrieve(self, assistant_id):
+        if self.error:
+            raise self.error
+
+
+class AsyncAssistants(Assistants):
+    async def retrieve(self, assistant_id):
+        super().retrieve(assistant_id)
+
+
+def client(assistants):
+    return type("Client", (), {"beta": type("Beta", (), {"assistants": assistants})()})()
+
+
+CONFIG = assistant_engine.AssistantConfig(name="Test", instructions="", model="m", tools=[], functions={})
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    monkeypatch.setattr(assistant_registry, "get_client", lambda: client(Assistants(ConnectionError("service down"))))
+    monkeypatch.setattr(assistant_registry, "get_async_client", lambda: client(AsyncAssistants(ConnectionError("service down"))))
+    monkeypatch.setattr(assistant_registry, "get_assistant_id", lambda **kwargs: "asst_1")
+
+
+def test_warm_up_records_failed_steps_instead_of_raising(registry):
+    loaded = []
+
+    def rates():
+        raise ConnectionError("fx api unreachable")
+
+    def yfinance_module():
+        loaded.append("yfinance")
+
+    timings = assistant_engine.warm_up(CONFIG, preload=[rates, yfinance_module])
+
+    assert {"client", "assistant", "connection_failed", "endpoints", "rates_failed", "yfinance_module"} <= set(timings)
+    assert loaded == ["yfinance"]
+
+
+def test_warm_up_async_records_a_failed_retrieve(registry):
+    timings = asyncio.run(assistant_engine.warm_up_async(CONFIG))
+
+    assert "async_connection_failed" in timings
+
+
+def test_warm_up_raises_when_the_assistant_cannot_be_created(registry, monkeypatch):
+    def get_assistant_id(**kwargs):
+        raise RuntimeError("no deployment")
+    monkeypatch.setattr(assistant_registry, "get_assistant_id", get_assistant_id)
+
+    with pytest.raises(RuntimeError):
+        assistant_engine.warm_up(CONFIG)
+
+
+def test_the_tools_span_counts_reused_outputs(monkeypatch):
+    monkeypatch.setattr(telemetry, "TELEMETRY_EXPORT", "prometheus")
+    monkeypatch.setattr(telemetry, "histograms", telemetry.PhaseHistograms())
+    tools = tool_registry.ToolRegistry()
+
+    @tools.register(cache_ttl=60)
+    def get_quote(symbol: str):
+        return {"symbol": symbol}
+
+    calls = [{"id": f"call_{index}", "type": "function",
+              "function": {"name": "get_quote", "arguments": json.dumps({"symbol": "SPAN-TEST"})}} for index in range(2)]
+    action = types.SimpleNamespace(submit_tool_outputs=types.SimpleNamespace(model_dump=lambda: {"tool_calls": calls}))
+    wait = assistant_engine.run_waiter.RunWait("poll", "requires_action", 0.1)
+    monkeypatch.setattr(assistant_engine.run_waiter, "create_run",
+                        lambda *args, **kwargs: (types.SimpleNamespace(id="run_1", status="requires_action", required_action=action), wait))
+    monkeypatch.setattr(assistant_engine.run_waiter, "submit_tool_outputs",
+                        lambda *args, **kwargs: (types.SimpleNamespace(id="run_1", status="completed"), wait))
+    config = assistant_engine.AssistantConfig(name="Test", instructions="", model="m", tools=tools.tools_list,
+                                              functions=tools.dispatch_table, cache_ttls=tools.cache_ttls)
+
+    assistant_engine.drive_run(None, "thread_1", "asst_1", config, assistant_engine.RunTrace())
+
+    assert 'assistant_tool_outputs_reused_total{phase="tools"} 1' in telemetry.render_prometheus()
@@ -0,0 +1,112 @@
+import os
+import sys
+import json
+import types
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import pytest
+from openai import NotFoundError
+
+try:
+    import httpx2 as httpx
+except ImportError:
+    import httpx
+
+import assistant_engine
+import assistant_registry
+
+
+def not_found():
+    request = httpx.Request("POST", "https://example.test/openai/threads/runs")
+    return NotFoundError("not found", response=httpx.Response(404, request=request), body=None)
+
+
+class FakeAssistants:
+    def __init__(self, existing=(), listed=()):
+        self.existing = set(existing)
+        self.listed = list(listed)
+        self.created = []
+        self.deleted = []
+
+    def retrieve(self, assistant_id):
+        if assistant_id not in self.existing:
+            raise not_found()
+
+    def create(self, **kwargs):
+        assistant = types.SimpleNamespace(id=f"asst_new{len(self.created)}", created_at=1)
+        self.created.append(kwargs)
+        self.existing.add(assistant.id)
+        return assistant
+
+    def list(self, **kwargs):
+        return types.SimpleNamespace(data=self.listed, has_more=False)
+
+    def delete(self, assistant_id):
+        self.deleted.append(assistant_id)
+
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    assistants = FakeAssistants()
+    monkeypatch.setattr(assistant_registry, "ASSISTANT_CACHE_PATH", str(tmp_path / "assistants.json"))
+    monkeypatch.setattr(assistant_registry, "_cache", None)
+    monkeypatch.setattr(assistant_registry, "_verified", set())
+    monkeypatch.setattr(assistant_registry, "get_client", lambda: types.SimpleNamespace(beta=types.SimpleNamespace(assistants=assistants)))
+    return assistants
+
+
+CONFIG = assistant_engine.AssistantConfig(name="Test", instructions="Be brief", model="m", tools=[], functions={})
+
+
+def get_id():
+    return assistant_registry.get_assistant_id(CONFIG.name, CONFIG.instructions, CONFIG.model, CONFIG.tools)
+
+
+def test_a_deleted_assistant_is_recreated_once_on_not_found(registry, monkeypatch):
+    old_id = get_id()
+    registry.existing.clear()   # deleted by a cleanup on another host
+    started = []
+
+    def create_run(client, thread_id, assistant_id, **kwargs):
+        started.append(assistant_id)
+        if assistant_id == old_id:
+            raise not_found()
+        return types.SimpleNamespace(id="run_1", status="completed"), assistant_engine.run_waiter.RunWait("poll", "completed", 0.1)
+    monkeypatch.setattr(assistant_engine.run_waiter, "create_run", create_run)
+
+    run = assistant_engine.drive_run(None, "thread_1", old_id, CONFIG, assistant_engine.RunTrace())
+
+    assert run.status == "completed"
+    assert started == [old_id, "asst_new1"]
+    assert get_id() == "asst_new1"
+    with open(assistant_registry.ASSISTANT_CACHE_PATH) as f:
+        assert [entry["id"] for entry in json.load(f).values()] == ["asst_new1"]
+
+
+def test_not_found_for_an_existing_assistant_is_raised(registry, monkeypatch):
+    assistant_id = get_id()
+
+    def create_run(client, thread_id, assistant_id, **kwargs):
+        raise not_found()   # the thread is the missing resource
+    monkeypatch.setattr(assistant_engine.run_waiter, "create_run", create_run)
+
+    with pytest.raises(NotFoundError):
+        assistant_engine.drive_run(None, "thread_1", assistant_id, CONFIG, assistant_engine.RunTrace())
+    assert len(registry.created) == 1
+
+
+def test_cleanup_keeps_assistants_with_a_current_key_from_other_hosts(registry):
+    keyed = lambda assistant_id, key: types.SimpleNamespace(id=assistant_id, name="Test", created_at=0,
+                                                            metadata={"registry_key": key})
+    registry.listed = [
+        keyed("asst_other_host", "current"),
+        keyed("asst_superseded", "old"),
+        types.SimpleNamespace(id="asst_orphan", name="Orphan", created_at=0, metadata={}),
+        types.SimpleNamespace(id="asst_unrelated", name="Someone else's", created_at=0, metadata={}),
+    ]
+
+    stale = assistant_registry.cleanup_assistants(names=["Orphan"], keep_keys={"current"})
+
+    assert [assistant.id for assistant in stale] == ["asst_superseded", "asst_orphan"]
+    assert registry.deleted == ["asst_superseded", "asst_orphan"]
@@ -0,0 +1,85 @@
+import os
+import sys
+import json
+import asyncio
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import batch
+
+
+def write_lines(path, lines):
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def test_blank_and_retried_lines_do_not_stall_the_checkpoint(tmp_path):
+    questions, answers = tmp_path / "questions.jsonl", tmp_path / "answers.jsonl"
+    write_lines(questions, ['"q0"', "", '"q2"', '"q3"', ""] + [f'"q{line}"' for line in range(5, 200)])
+    results = [{"line": line, "error": "boom" if line == 3 else None} for line in range(200) if line not in (1, 4)]
+    write_lines(answers, [json.dumps(result) for result in results])
+
+    done = batch.answered_lines(str(answers), retry_errors=True, input_path=str(questions))
+
+    assert done.contiguous == 200 and not done.above
+    assert 3 not in done and all(line in done for line in range(200) if line != 3)
+
+
+def test_a_retried_line_that_succeeds_later_is_done(tmp_path):
+    answers = tmp_path / "answers.jsonl"
+    write_lines(answers, [json.dumps({"line": 0, "error": "boom"}), json.dumps({"line": 0, "error": None})])
+
+    assert 0 in batch.answered_lines(str(answers), retry_errors=True)
+
+
+class Answers:
+    # Stands in for an assistant script: answers "qN" with "aN", fails the questions in `failing`
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.asked = []
+
+    async def process_llm_request_async(self, question, use_cache=True):
+        self.asked.append(question)
+        return "Error: service unavailable" if question in self.failing else question.replace("q", "a")
+
+
+def last_results(path):
+    results = {}
+    with open(path) as f:
+        for text in f:
+            try:
+                record = json.loads(text)
+            except ValueError:
+                continue
+            results[record["line"]] = record
+    return results
+
+
+def test_a_rerun_answers_only_the_lines_missing_from_the_output(tmp_path):
+    questions, answers = tmp_path / "questions.jsonl", tmp_path / "answers.jsonl"
+    write_lines(questions, [f'"q{line}"' for line in range(6)])
+    write_lines(answers, [json.dumps({"line": 0, "answer": "a0", "error": None}), json.dumps({"line": 3, "answer": "a3", "error": None})])
+    with open(answers, "a") as f:
+        f.write('{"line": 4, "ans')   # cut short by the interruption
+
+    module = Answers()
+    stats = asyncio.run(batch.run_batch(module, str(questions), str(answers), concurrency=2))
+
+    assert sorted(module.asked) == ["q1", "q2", "q4", "q5"]
+    assert stats["answered"] == 4 and stats["skipped"] == 2
+    assert {line: record["answer"] for line, record in last_results(answers).items()} == {line: f"a{line}" for line in range(6)}
+    assert sum(1 for _ in open(answers)) == 7   # the new results start on a line of their own
+
+
+def test_retry_errors_answers_the_failed_lines_again(tmp_path):
+    questions, answers = tmp_path / "questions.jsonl", tmp_path / "answers.jsonl"
+    write_lines(questions, ['"q0"', '"q1"', "not json"])
+
+    asyncio.run(batch.run_batch(Answers(failing={"q1"}), str(questions), str(answers), concurrency=2))
+    first = last_results(answers)
+    module = Answers()
+    asyncio.run(batch.run_batch(module, str(questions), str(answers), concurrency=2, retry_errors=True))
+
+    assert first[1]["error"] == "service unavailable" and first[2]["error"].startswith("Invalid input line")
+    assert module.asked == ["q1"]   # the unreadable line is answered with its error again, without a call
+    assert last_results(answers)[1]["answer"] == "a1"
@@ -0,0 +1,32 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import context_packer
+
+
+def test_pack_cuts_a_first_sentence_longer_than_the_budget():
+    long_sentence = " ".join(f"word{index}" for index in range(400)) + "."
+    chunks = [
+        {"chunk_id": "a", "title": "Plans", "content": long_sentence + " A short second sentence.", "search_score": 2.0},
+        {"chunk_id": "b", "title": "Roaming", "content": "Roaming is free in the EU.", "search_score": 1.0},
+    ]
+
+    text, stats = context_packer.pack(chunks, token_budget=50)
+
+    assert text.startswith(context_packer.chunk_label(chunks[0], 1) + "\nword0 word1")
+    assert text.endswith("...")
+    assert 0 < stats.tokens_out <= 50
+    assert context_packer.count_tokens(text.split("\n", 1)[1]) <= 50
+    assert stats.chunks_out == 1 and stats.truncated
+    assert stats.dropped == ["b"]
+
+
+def test_pack_keeps_whole_sentences_within_the_budget():
+    chunks = [{"chunk_id": "a", "title": "Plans", "content": "One sentence. Another sentence.", "search_score": 1.0}]
+
+    text, stats = context_packer.pack(chunks, token_budget=1200)
+
+    assert text.endswith("One sentence. Another sentence.")
+    assert not stats.truncated
@@ -0,0 +1,30 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import embedding_cache
+
+
+def test_a_hole_left_by_a_rewritten_key_is_reused_within_capacity(tmp_path):
+    store = embedding_cache.DiskVectorStore(str(tmp_path), max_bytes=3 * 2 * embedding_cache.FLOAT_SIZE)   # 3 slots of dim 2
+    for key in ("a", "b", "c"):
+        store.put(key, "embeddings", [1.0, 2.0])
+    store.put("a", "embeddings", [1.0, 2.0, 3.0])   # moves "a" to the dim 3 file, freeing slot 0
+
+    store.put("d", "embeddings", [4.0, 5.0])
+
+    assert store.evictions == 0
+    assert [store.get(key, "embeddings") for key in ("a", "b", "c", "d")] == [[1.0, 2.0, 3.0], [1.0, 2.0], [1.0, 2.0], [4.0, 5.0]]
+
+
+def test_a_full_store_evicts_the_least_recently_used_vector(tmp_path):
+    store = embedding_cache.DiskVectorStore(str(tmp_path), max_bytes=2 * 2 * embedding_cache.FLOAT_SIZE, touch_batch=1)
+    store.put("a", "embeddings", [1.0, 0.0])
+    store.put("b", "embeddings", [0.0, 1.0])
+    store.get("a", "embeddings")
+
+    store.put("c", "embeddings", [1.0, 1.0])
+
+    assert store.evictions == 1
+    assert store.get("b", "embeddings") is None and store.get("a", "embeddings") == [1.0, 0.0]
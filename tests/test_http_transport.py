@@ -0,0 +1,87 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import pytest
+
+import http_transport
+
+
+class Response:
+    def __init__(self, source, status_code=200):
+        self.source = source
+        self.status_code = status_code
+        self.headers = {}
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def tracker(monkeypatch):
+    # A hedger that has already seen 10 ms latencies, with the credit for one hedge per request
+    tracker = http_transport.Hedger(percentile=0.5, budget=1.0, min_samples=1)
+    tracker.record(0.01)
+    monkeypatch.setitem(http_transport._hedgers, "test", tracker)
+    return tracker
+
+
+def fake_send(monkeypatch, replies):
+    # replies: one (seconds, status) per copy, in the order the copies are sent
+    sent, responses = [], []
+
+    def send_request(method, url, service, settings, **kwargs):
+        index = len(sent)
+        sent.append((url, settings.retries))
+        seconds, status = replies[min(index, len(replies) - 1)]
+        time.sleep(seconds)
+        responses.append(Response(f"copy{index}", status))
+        return responses[-1]
+    monkeypatch.setattr(http_transport, "send_request", send_request)
+    return sent, responses
+
+
+def test_a_slow_first_copy_is_hedged_and_the_faster_copy_wins(monkeypatch, tracker):
+    sent, responses = fake_send(monkeypatch, [(0.3, 200), (0.0, 200)])
+
+    response = http_transport.hedged_request("GET", "https://api.example.test/q", "test", http_transport.ServiceSettings())
+
+    assert response.source == "copy1"
+    assert [retries for _, retries in sent] == [0, 0]   # each copy makes a single attempt
+    assert tracker.stats()["hedges"] == 1 and tracker.stats()["hedge_wins"] == 1
+    time.sleep(0.35)
+    assert [reply.closed for reply in responses if reply.source == "copy0"] == [True]   # the loser, once it finished
+
+
+def test_without_credit_the_request_is_not_duplicated(monkeypatch, tracker):
+    tracker.budget = 0.0
+    sent, _ = fake_send(monkeypatch, [(0.05, 200)])
+
+    response = http_transport.hedged_request("GET", "https://api.example.test/q", "test", http_transport.ServiceSettings())
+
+    assert response.source == "copy0" and len(sent) == 1
+    assert tracker.stats()["over_budget"] == 1
+
+
+def test_when_both_copies_fail_the_retries_follow_without_hedging(monkeypatch, tracker):
+    monkeypatch.setattr(http_transport, "retry_delay", lambda response, attempt, settings: 0)
+    sent, responses = fake_send(monkeypatch, [(0.05, 503), (0.0, 503), (0.0, 200)])
+
+    response = http_transport.hedged_request("GET", "https://api.example.test/q", "test",
+                                             http_transport.ServiceSettings(retries=2))
+
+    assert response.source == "copy2" and response.status_code == 200
+    assert sent[-1][1] == 1                             # the first attempt counts against the retries
+    assert all(earlier.closed for earlier in responses[:2])
+
+
+def test_the_hedge_goes_to_the_secondary_region_with_its_key():
+    settings = http_transport.ServiceSettings(hedge_url="https://secondary.example.test", hedge_key="key2")
+
+    url, kwargs = http_transport.hedge_target("https://primary.example.test/search?q=1", settings,
+                                              {"headers": {"api-key": "key1"}})
+
+    assert url == "https://secondary.example.test/search?q=1" and kwargs["headers"]["api-key"] == "key2"
@@ -0,0 +1,50 @@
+import os
+import sys
+import time
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import news
+
+
+def bing_response(title):
+    return {"news": {"value": [{"name": title, "url": "https://example.test/story", "description": "d"}]}}
+
+
+def test_followers_wait_for_a_slow_leader_and_share_its_request():
+    release = threading.Event()
+
+    def slow_fetch(company_name):
+        release.wait(5)
+        return bing_response("Contoso earnings beat estimates")
+
+    service = news.NewsService(fetch=slow_fetch, ttl=0, coalesce=True)
+    results = []
+    callers = [threading.Thread(target=lambda: results.append(service.latest("Contoso"))) for _ in range(4)]
+    for caller in callers:
+        caller.start()
+    time.sleep(0.2)
+    release.set()
+    for caller in callers:
+        caller.join(5)
+
+    assert service.fetches == 1
+    assert len(results) == 4 and all(result == results[0] for result in results)
+
+
+def test_a_failed_leader_fails_its_followers_and_is_not_cached():
+    calls = []
+
+    def failing_fetch(company_name):
+        calls.append(company_name)
+        raise ConnectionError("bing unreachable")
+
+    service = news.NewsService(fetch=failing_fetch, ttl=300, coalesce=True)
+    for _ in range(2):
+        try:
+            service.latest("Contoso")
+        except ConnectionError:
+            pass
+
+    assert len(calls) == 2 and service.fetches == 2
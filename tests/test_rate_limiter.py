@@ -0,0 +1,72 @@
+import os
+import sys
+import time
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import rate_limiter
+
+
+def test_aimd_grows_until_throttled_then_halves_once_per_window():
+    limiter = rate_limiter.EndpointLimiter("test", concurrency=8, max_concurrency=16)
+    for _ in range(4):
+        limiter.acquire()
+
+    limiter.release(200)                         # slow start: +1 per success
+    assert limiter.limit == 9
+    limiter.release(429, {"Retry-After": "0"})   # halved from the calls in flight, not the old limit
+    assert limiter.limit == 1.5 and not limiter.slow_start
+    limiter.release(429, {"Retry-After": "0"})   # same throttle window: no second decrease
+    assert limiter.limit == 1.5
+    limiter.release(200)                         # then +1/limit per success
+    assert abs(limiter.limit - (1.5 + 1 / 1.5)) < 1e-9
+    assert limiter.snapshot()["throttled"] == 2 and limiter.in_flight == 0
+
+
+def test_retry_after_blocks_new_calls():
+    limiter = rate_limiter.EndpointLimiter("test", concurrency=4)
+    limiter.acquire()
+    limiter.release(429, {"retry-after-ms": "150"})
+
+    started = time.monotonic()
+    limiter.acquire()
+
+    assert time.monotonic() - started >= 0.14
+    limiter.release(200)
+
+
+def test_interactive_calls_go_ahead_of_queued_batch_calls():
+    limiter = rate_limiter.EndpointLimiter("test", concurrency=1, max_concurrency=1)
+    limiter.acquire()
+    granted = []
+
+    def call(name, priority):
+        with rate_limiter.priority(priority):
+            limiter.acquire()
+        granted.append(name)
+        limiter.release(200)
+
+    waiting = [threading.Thread(target=call, args=("batch", rate_limiter.BATCH))]
+    waiting[0].start()
+    while len(limiter._queue) < 1:
+        time.sleep(0.001)
+    waiting.append(threading.Thread(target=call, args=("interactive", rate_limiter.INTERACTIVE)))
+    waiting[1].start()
+    while len(limiter._queue) < 2:
+        time.sleep(0.001)
+
+    limiter.release(200)
+    for thread in waiting:
+        thread.join(5)
+
+    assert granted == ["interactive", "batch"]
+
+
+def test_rate_limit_headers_set_the_request_rate():
+    limiter = rate_limiter.EndpointLimiter("test")
+    limiter.acquire()
+
+    limiter.release(200, {"x-ratelimit-remaining-requests": "100", "x-ratelimit-reset-requests": "10s"})
+
+    assert limiter.rate == 100 * rate_limiter.RATE_LIMIT_HEADROOM / 10
@@ -0,0 +1,123 @@
+import os
+import sys
+import types
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import pytest
+from openai import APIConnectionError, BadRequestError
+
+try:
+    import httpx2 as httpx
+except ImportError:
+    import httpx
+
+import run_waiter
+
+
+def run(status, run_id="run_1"):
+    return types.SimpleNamespace(id=run_id, status=status, created_at=100, started_at=100, completed_at=None,
+                                 failed_at=None, cancelled_at=None, expires_at=None)
+
+
+def event(status):
+    return types.SimpleNamespace(event=f"thread.run.{status}", data=run(status))
+
+
+class Events:
+    # A run event stream: yields the events, then raises `error` if it is set (a dropped connection)
+    def __init__(self, events, error=None):
+        self.events = events
+        self.error = error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __iter__(self):
+        yield from self.events
+        if self.error is not None:
+            raise self.error
+
+
+class Runs:
+    def __init__(self, stream=None, polled=("in_progress", "completed"), create_error=None):
+        self.stream = stream
+        self.polled = list(polled)
+        self.create_error = create_error
+        self.calls = []
+
+    def create(self, stream=False, **kwargs):
+        self.calls.append("create(stream)" if stream else "create")
+        if stream and self.create_error is not None:
+            raise self.create_error
+        return self.stream if stream else run("queued")
+
+    def retrieve(self, thread_id, run_id):
+        self.calls.append("retrieve")
+        return run(self.polled.pop(0), run_id)
+
+    def cancel(self, thread_id, run_id):
+        self.calls.append("cancel")
+
+
+def client(runs):
+    return types.SimpleNamespace(beta=types.SimpleNamespace(threads=types.SimpleNamespace(runs=runs)))
+
+
+def bad_request(message, param=None):
+    request = httpx.Request("POST", "https://example.test/openai/threads/runs")
+    return BadRequestError(message, response=httpx.Response(400, request=request), body={"message": message, "param": param})
+
+
+@pytest.fixture(autouse=True)
+def fast_polls(monkeypatch):
+    monkeypatch.setattr(run_waiter, "POLL_INITIAL_INTERVAL", 0.001)
+    monkeypatch.setattr(run_waiter, "_streaming_supported", True)
+
+
+def test_a_streamed_run_settles_without_polling():
+    runs = Runs(stream=Events([event("queued"), event("in_progress"), event("requires_action")]))
+
+    settled, wait = run_waiter.create_run(client(runs), "thread_1", "asst_1")
+
+    assert settled.status == "requires_action"
+    assert wait.mode == "stream" and wait.polls == 0 and runs.calls == ["create(stream)"]
+
+
+def test_a_dropped_stream_is_finished_by_polling():
+    dropped = APIConnectionError(request=httpx.Request("POST", "https://example.test/openai/threads/runs"))
+    runs = Runs(stream=Events([event("queued"), event("in_progress")], error=dropped))
+
+    settled, wait = run_waiter.create_run(client(runs), "thread_1", "asst_1")
+
+    assert settled.status == "completed"
+    assert wait.mode == "stream+poll" and wait.polls == 2
+
+
+def test_an_api_version_without_streamed_runs_falls_back_to_polling():
+    runs = Runs(create_error=bad_request("Unrecognized request argument supplied: stream", param="stream"))
+
+    settled, wait = run_waiter.create_run(client(runs), "thread_1", "asst_1")
+
+    assert settled.status == "completed" and wait.mode == "poll"
+    assert runs.calls == ["create(stream)", "create", "retrieve", "retrieve"]
+    assert run_waiter._streaming_supported is False
+
+
+def test_other_bad_requests_are_raised():
+    runs = Runs(create_error=bad_request("Thread thread_1 already has an active run"))
+
+    with pytest.raises(BadRequestError):
+        run_waiter.create_run(client(runs), "thread_1", "asst_1")
+    assert run_waiter._streaming_supported is True
+
+
+def test_polling_past_the_deadline_cancels_the_run():
+    runs = Runs(polled=["in_progress"] * 1000)
+
+    with pytest.raises(run_waiter.RunTimeoutError):
+        run_waiter.poll_run(client(runs), "thread_1", "run_1", deadline=0.05)
+    assert runs.calls[-1] == "cancel"
@@ -0,0 +1,26 @@
+import os
+import sys
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import stock_quotes
+
+
+def test_the_fallback_time_zone_follows_us_daylight_saving_time():
+    eastern = stock_quotes.USEastern()
+
+    assert datetime(2026, 3, 8, 1, 59, tzinfo=eastern).utcoffset().total_seconds() == -5 * 3600
+    assert datetime(2026, 3, 8, 3, 0, tzinfo=eastern).utcoffset().total_seconds() == -4 * 3600
+    assert datetime(2026, 11, 1, 0, 59, tzinfo=eastern).utcoffset().total_seconds() == -4 * 3600
+    assert datetime(2026, 11, 1, 2, 0, tzinfo=eastern).utcoffset().total_seconds() == -5 * 3600
+
+
+def test_quotes_expire_at_the_next_open_with_the_fallback_time_zone(monkeypatch):
+    monkeypatch.setattr(stock_quotes, "MARKET_TIMEZONE", stock_quotes.USEastern())
+    friday_evening = datetime(2026, 7, 17, 18, 0, tzinfo=stock_quotes.MARKET_TIMEZONE).timestamp()
+
+    expiry = stock_quotes.quote_expiry(friday_evening)
+
+    assert expiry == datetime(2026, 7, 20, 9, 30, tzinfo=stock_quotes.MARKET_TIMEZONE).timestamp()
+    assert expiry - friday_evening == (2 * 24 + 15.5) * 3600
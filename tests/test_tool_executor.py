@@ -0,0 +1,105 @@
+import os
+import sys
+import json
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import tool_executor
+import tool_registry
+
+
+def call(call_id, name, **arguments):
+    return {"id": call_id, "type": "function", "function": {"name": name, "arguments": json.dumps(arguments)}}
+
+
+def test_a_burst_of_a_limited_tool_does_not_hold_the_shared_pool():
+    tools = tool_registry.ToolRegistry()
+
+    @tools.register(concurrency=1)
+    def slow_quote(symbol: str):
+        time.sleep(0.05)
+        return {"symbol": symbol}
+
+    @tools.register
+    def fast_lookup(key: str):
+        return {"key": key}
+
+    # The burst is queued before the fast call, which must still finish within its 0.5 s timeout
+    burst = [call(f"q{index}", "slow_quote", symbol=f"S{index}") for index in range(tool_executor.TOOL_MAX_WORKERS * 2)]
+    started = time.monotonic()
+    outputs = [tool_executor.submit_run_tool("slow_quote", tools.dispatch_table["slow_quote"], {"symbol": action["id"]})
+               for action in burst]
+    fast = tool_executor.execute_tool_calls([call("fast", "fast_lookup", key="k")], tools.dispatch_table,
+                                            timeouts={"fast_lookup": 0.5})
+
+    assert fast == [{"tool_call_id": "fast", "output": '{"key": "k"}'}]
+    assert [json.loads(output.result())["symbol"] for output in outputs] == [action["id"] for action in burst]
+    assert time.monotonic() - started >= 0.05 * len(burst)   # the limit still holds
+
+
+def test_outputs_keep_the_order_of_the_tool_calls():
+    tools = tool_registry.ToolRegistry()
+
+    @tools.register
+    def wait_then_echo(key: str, seconds: float):
+        time.sleep(seconds)
+        return {"key": key}
+
+    calls = [call(f"c{index}", "wait_then_echo", key=f"k{index}", seconds=seconds) for index, seconds in enumerate((0.1, 0.0, 0.05))]
+
+    outputs = tool_executor.execute_tool_calls(calls, tools.dispatch_table)
+
+    assert outputs == [{"tool_call_id": f"c{index}", "output": json.dumps({"key": f"k{index}"})} for index in range(3)]
+
+
+def test_a_slow_or_failing_call_gets_an_error_output_and_the_rest_are_kept():
+    tools = tool_registry.ToolRegistry()
+
+    @tools.register(timeout=0.05)
+    def slow_lookup(key: str):
+        time.sleep(0.5)
+        return {"key": key}
+
+    @tools.register
+    def broken_lookup(key: str):
+        raise RuntimeError("backend down")
+
+    @tools.register
+    def fast_lookup(key: str):
+        return {"key": key}
+
+    calls = [call("slow", "slow_lookup", key="a"), call("broken", "broken_lookup", key="b"), call("fast", "fast_lookup", key="c"),
+             call("unknown", "missing_tool"), call("invalid", "fast_lookup", key=1)]
+
+    outputs = {output["tool_call_id"]: json.loads(output["output"]) for output in
+               tool_executor.execute_tool_calls(calls, tools.dispatch_table, timeouts=tools.timeouts)}
+
+    assert outputs == {
+        "slow": {"error": "slow_lookup timed out"},
+        "broken": {"error": "broken_lookup failed: backend down"},
+        "fast": {"key": "c"},
+        "unknown": {"error": "Function missing_tool not found"},
+        "invalid": {"error": "Invalid arguments for fast_lookup: key: expected a string"},
+    }
+
+
+def test_identical_cached_calls_share_one_execution():
+    tools = tool_registry.ToolRegistry()
+    runs = []
+
+    @tools.register(cache_ttl=60)
+    def counted_lookup(key: str):
+        runs.append(key)
+        time.sleep(0.05)
+        return {"key": key}
+
+    calls = [call(f"c{index}", "counted_lookup", key="single-flight") for index in range(3)]
+    events = []
+
+    first = tool_executor.execute_tool_calls(calls, tools.dispatch_table, cache_ttls=tools.cache_ttls, cache_events=events)
+    second = tool_executor.execute_tool_calls(calls[:1], tools.dispatch_table, cache_ttls=tools.cache_ttls, cache_events=events)
+
+    assert runs == ["single-flight"]
+    assert [output["output"] for output in first + second] == ['{"key": "single-flight"}'] * 4
+    assert events == [("counted_lookup", "shared"), ("counted_lookup", "shared"), ("counted_lookup", "hit")]
@@ -0,0 +1,53 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import tool_prefetch
+import tool_registry
+
+
+def learned_tools():
+    tools = tool_registry.ToolRegistry()
+
+    @tools.register(cache_ttl=300, cache_class="market")
+    def get_stock_price(symbol: str):
+        return {"symbol": symbol, "price": 415.5}
+
+    @tools.register(cache_ttl=300, cache_class="market")
+    def get_fx_rate(amount: float):
+        return {"amount": amount}
+
+    @tools.register
+    def place_order(symbol: str):
+        return {"ordered": symbol}
+
+    @tools.register(cache_ttl=300, cache_class="account")
+    def get_account_positions(symbol: str):
+        return {"symbol": symbol}
+    return tools
+
+
+def test_learned_rules_only_start_tools_that_opted_in():
+    tools = learned_tools()
+    prefetcher = tool_prefetch.Prefetcher(learn_min=1, min_probability=0.5)
+    previous = [("get_stock_price", {"symbol": "MSFT", "price": 415.5})]
+    prefetcher.count_producers(["get_stock_price"])
+    prefetcher.observe(previous, [("get_fx_rate", {"amount": 415.5}), ("place_order", {"symbol": "MSFT"}),
+                                  ("get_account_positions", {"symbol": "MSFT"})])
+
+    consumers = {consumer for _, consumer, _ in prefetcher.rules(tools.dispatch_table, tools.cache_ttls)}
+
+    assert consumers == {"get_fx_rate"}
+
+
+def test_declared_rules_are_kept_without_a_cache_ttl():
+    tools = tool_registry.ToolRegistry()
+
+    @tools.register(follows={"get_customer_information": {"account_number": "account_number"}})
+    def get_promotions(account_number: str):
+        return []
+
+    rules = tool_prefetch.Prefetcher().rules(tools.dispatch_table, tools.cache_ttls)
+
+    assert rules == [("get_customer_information", "get_promotions", (("account_number", ("account_number",)),))]
@@ -0,0 +1,100 @@
+import os
+import re
+import sys
+import json
+from typing import Literal, Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import pytest
+
+import tool_registry
+
+
+def test_a_long_list_output_keeps_whole_items_and_stays_json():
+    tool = tool_registry.Tool(lambda company_name: None, name="latest_news", max_output_chars=300)
+    articles = [{"title": f"Story {index}", "description": "x" * 40} for index in range(20)]
+
+    output = tool.limit_output(json.dumps(articles))
+
+    value = json.loads(output)
+    assert len(output) <= 300
+    assert value["truncated"] and value["items"] == articles[:len(value["items"])]
+    assert value["omitted_items"] == len(articles) - len(value["items"]) > 0
+
+
+def test_a_long_list_field_is_trimmed_in_place():
+    tool = tool_registry.Tool(lambda query: None, name="search", max_output_chars=200)
+    result = {"query": "roaming", "chunks": ["chunk text " * 5 for _ in range(10)]}
+
+    value = json.loads(tool.limit_output(json.dumps(result)))
+
+    assert value["query"] == "roaming" and value["truncated"]
+    assert len(value["chunks"]) + value["omitted_items"] == 10
+
+
+def test_a_long_string_output_is_wrapped_as_json():
+    tool = tool_registry.Tool(lambda: None, name="report", max_output_chars=100)
+    output = json.dumps({"report": 'a "quoted" line\n' * 50})
+
+    value = json.loads(tool.limit_output(output))
+
+    assert len(tool.limit_output(output)) <= 100
+    assert value["truncated"] and output.startswith(value["text"])
+    assert value["omitted_chars"] == len(output) - len(value["text"])
+
+
+def register_quote_tool():
+    tools = tool_registry.ToolRegistry()
+
+    @tools.register(timeout=15)
+    def get_stock_price(symbol: str | list[str], currency: Literal["USD", "GBP"] = "USD", days: Optional[int] = None):
+        """Retrieve the latest closing price of a stock
+
+        symbol: The ticker symbol of the stock
+        currency: The currency of the price
+        """
+        return {}
+    return tools, tools.tools["get_stock_price"]
+
+
+def test_the_schema_comes_from_the_signature_and_the_docstring():
+    tools, _ = register_quote_tool()
+    function = tools.tools_list[0]["function"]
+
+    assert function["description"] == "Retrieve the latest closing price of a stock"
+    assert function["parameters"] == {
+        "type": "object",
+        "properties": {
+            "symbol": {"anyOf": [{"type": "string"}, {"type": "array", "items": {"type": "string"}}],
+                       "description": "The ticker symbol of the stock"},
+            "currency": {"type": "string", "enum": ["USD", "GBP"], "description": "The currency of the price"},
+            "days": {"type": "integer"},
+        },
+        "required": ["symbol"],
+    }
+    assert tools.timeouts == {"get_stock_price": 15} and tools.tools_list is tools.tools_list
+
+
+@pytest.mark.parametrize("arguments, error", [
+    ({}, "missing symbol"),
+    ({"symbol": "MSFT", "exchange": "NASDAQ"}, "unexpected argument exchange"),
+    ({"symbol": 42}, "symbol: expected a string or an array of strings"),
+    ({"symbol": ["MSFT", 42]}, "symbol: expected a string or an array of strings"),
+    ({"symbol": "MSFT", "currency": "EUR"}, "currency: expected one of ['GBP', 'USD']"),
+    ({"symbol": "MSFT", "days": True}, "days: expected an integer"),
+    ({"symbol": "MSFT", "days": 2.5}, "days: expected an integer"),
+    ("MSFT", "arguments must be a JSON object"),
+])
+def test_invalid_arguments_are_rejected_with_a_reason(arguments, error):
+    _, tool = register_quote_tool()
+
+    with pytest.raises(tool_registry.ToolArgumentError, match=re.escape(error)):
+        tool.validate(arguments)
+
+
+def test_valid_arguments_pass_unchanged():
+    _, tool = register_quote_tool()
+    arguments = {"symbol": ["MSFT", "AAPL"], "currency": "GBP", "days": 5}
+
+    assert tool.validate(arguments) is arguments
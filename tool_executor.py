@@ -0,0 +1,244 @@
+import os
+import json
+import time
+import asyncio
+import threading
+import contextvars
+from collections import Counter, OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError
+
+import telemetry
+
+
+#-------------------------------------------------------------------------------------------------#
+#----Tool executor: runs all tool_calls of a requires_action step at once on a bounded pool-------#
+#-------------------------------------------------------------------------------------------------#
+
+TOOL_MAX_WORKERS = int(os.getenv("TOOL_MAX_WORKERS", "16"))
+TOOL_TIMEOUT = float(os.getenv("TOOL_TIMEOUT_SECONDS", "30"))
+TOOL_CACHE_ENABLED = os.getenv("TOOL_CACHE_ENABLED", "true").lower() == "true"
+TOOL_CACHE_MAX_ENTRIES = int(os.getenv("TOOL_CACHE_MAX_ENTRIES", "4096"))
+
+# Shared by every conversation in the process so the number of tool threads stays bounded
+_executor = ThreadPoolExecutor(max_workers=TOOL_MAX_WORKERS, thread_name_prefix="tool")
+
+
+def error_output(message: str) -> str:
+    return json.dumps({"error": message})
+
+
+def is_error_output(output: str) -> bool:
+    return output.startswith('{"error": ')
+
+
+def run_tool(func_name, func, arguments):
+    # Tools from tool_registry.py carry an output size limit
+    with telemetry.span(f"tool.{func_name}") as span:
+        result = func(**arguments)
+        # Ensure the output is a JSON string
+        output = json.dumps(result) if not isinstance(result, str) else result
+        if hasattr(func, "limit_output"):
+            output = func.limit_output(output)
+        span.set(payload_bytes=len(output))
+    return output
+
+
+def submit_run_tool(func_name, func, arguments):
+    # A tool with a concurrency limit has its own pool (tool_registry.py); the others share this one.
+    # The copied context carries the conversation's telemetry attributes into the pool thread.
+    executor = getattr(func, "executor", None) or _executor
+    return executor.submit(contextvars.copy_context().run, run_tool, func_name, func, arguments)
+
+
+#-------------------------------------------------------------------------------------------------#
+#----Tool result cache: outputs keyed by function name + canonical JSON arguments, kept for the---#
+#----TTL the assistant declares for that function (cache_ttls). Identical calls in flight at the--#
+#----same time share one execution, within a batch, across steps and across conversations.--------#
+#-------------------------------------------------------------------------------------------------#
+
+def tool_cache_key(func_name: str, arguments: dict) -> str:
+    return func_name + ":" + json.dumps(arguments, sort_keys=True, separators=(",", ":"))
+
+
+class ToolResultCache:
+    def __init__(self, max_entries: int = TOOL_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.counters = Counter()
+        self._entries = OrderedDict()   # key -> (expires_at, output), least recently used first
+        self._inflight = {}             # key -> Future of the running call
+        self._lock = threading.Lock()
+
+    def submit(self, key: str, ttl: float, func_name, func, arguments):
+        # Returns (future, source): source is "hit", "shared" (joined a running call) or "run"
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None and cached[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.counters["hits"] += 1
+                future = Future()
+                future.set_result(cached[1])
+                return future, "hit"
+            if key in self._inflight:
+                self.counters["shared"] += 1
+                return self._inflight[key], "shared"
+
+            self.counters["misses"] += 1
+            future = submit_run_tool(func_name, func, arguments)
+            self._inflight[key] = future
+        future.add_done_callback(lambda done: self.finish(key, ttl, done))
+        return future, "run"
+
+    def finish(self, key: str, ttl: float, future):
+        with self._lock:
+            self._inflight.pop(key, None)
+            # Failures, and outputs that report an error, are retried on the next call
+            if future.cancelled() or future.exception() is not None or is_error_output(future.result()):
+                return
+            self._entries[key] = (time.monotonic() + ttl, future.result())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        stats = dict(self.counters)
+        calls = sum(stats.values())
+        stats["hit_rate"] = (stats.get("hits", 0) + stats.get("shared", 0)) / calls if calls else 0.0
+        stats["entries"] = len(self._entries)
+        return stats
+
+
+tool_cache = ToolResultCache()
+
+
+def submit_tool(action, func, arguments, cache_ttls, cache_events):
+    func_name = action["function"]["name"]
+    ttl = cache_ttls.get(func_name, 0) if TOOL_CACHE_ENABLED else 0
+    if ttl <= 0:
+        return submit_run_tool(func_name, func, arguments)
+
+    future, source = tool_cache.submit(tool_cache_key(func_name, arguments), ttl, func_name, func, arguments)
+    if source != "run":
+        print(f"\033[90mFunction: {func_name} ({source} result)\033[0m")
+        if cache_events is not None:
+            cache_events.append((func_name, source))
+    return future
+
+
+#-------------------------------------------------------------------------------------------------#
+#function description: execute_tool_calls
+#   tool_calls:  required_actions["tool_calls"] as returned by submit_tool_outputs.model_dump()
+#   timeouts:    optional per function timeout in seconds, TOOL_TIMEOUT otherwise
+#   cache_ttls:  optional per function seconds to reuse an output for the same arguments
+#   cache_events: optional list; (function name, "hit" | "shared" | "prefetched") is appended for reused outputs
+#   prefetch:    optional tool_prefetch.RunPrefetch of the run; serves calls started speculatively
+#                after the previous step and starts the likely calls of the next one
+#   returns:     tool_outputs ready for submit_tool_outputs, in the order of tool_calls.
+#                A call that fails, times out or names an unknown function gets an error output
+#                so the rest of the batch is still submitted.
+#-------------------------------------------------------------------------------------------------#
+
+def resolve_tool_call(action, function_dispatch_table, outputs):
+    # Returns (func, arguments), or None after recording an error output for this call
+    func_name = action["function"]["name"]
+    func = function_dispatch_table.get(func_name)
+    if not func:
+        print(f"Function {func_name} not found")
+        outputs[action["id"]] = error_output(f"Function {func_name} not found")
+        return None
+
+    try:
+        arguments = json.loads(action["function"]["arguments"] or "{}")
+    except json.JSONDecodeError as e:
+        outputs[action["id"]] = error_output(f"Invalid arguments for {func_name}: {e}")
+        return None
+
+    if hasattr(func, "validate"):
+        # Checked against the tool's schema before anything runs (tool_registry.py)
+        try:
+            arguments = func.validate(arguments)
+        except ValueError as e:
+            outputs[action["id"]] = error_output(f"Invalid arguments for {func_name}: {e}")
+            return None
+
+    print(f"\033[93mFunction: {func_name}, Arguments: {arguments}\033[0m")
+    return func, arguments
+
+
+def prefetched(action, arguments, prefetch, cache_events):
+    # The future of a speculative call with exactly these arguments, if one was started
+    future = prefetch.claim(action["function"]["name"], arguments) if prefetch is not None else None
+    if future is not None:
+        print(f"\033[90mFunction: {action['function']['name']} (prefetched result)\033[0m")
+        if cache_events is not None:
+            cache_events.append((action["function"]["name"], "prefetched"))
+    return future
+
+
+def execute_tool_calls(tool_calls, function_dispatch_table, timeouts=None, cache_ttls=None, cache_events=None, prefetch=None):
+    timeouts = timeouts or {}
+    cache_ttls = cache_ttls or {}
+    outputs = {}
+    pending = []
+
+    for action in tool_calls:
+        resolved = resolve_tool_call(action, function_dispatch_table, outputs)
+        if resolved:
+            func_name = action["function"]["name"]
+            deadline = time.monotonic() + timeouts.get(func_name, TOOL_TIMEOUT)
+            future = prefetched(action, resolved[1], prefetch, cache_events) or submit_tool(action, *resolved, cache_ttls, cache_events)
+            pending.append((action["id"], func_name, deadline, future))
+
+    for tool_call_id, func_name, deadline, future in pending:
+        try:
+            outputs[tool_call_id] = future.result(timeout=max(0, deadline - time.monotonic()))
+        except TimeoutError:
+            if not cache_ttls.get(func_name):
+                future.cancel()   # a cached call may be shared with other callers
+            outputs[tool_call_id] = error_output(f"{func_name} timed out")
+        except Exception as e:
+            outputs[tool_call_id] = error_output(f"{func_name} failed: {e}")
+
+    if prefetch is not None:
+        prefetch.step(tool_calls, outputs, function_dispatch_table, cache_ttls)
+    return [{"tool_call_id": action["id"], "output": outputs[action["id"]]} for action in tool_calls]
+
+
+#-------------------------------------------------------------------------------------------------#
+#function description: execute_tool_calls_async - same contract, awaited from an event loop.
+#   The functions themselves are blocking, so they still run on the shared pool.
+#-------------------------------------------------------------------------------------------------#
+
+async def execute_tool_calls_async(tool_calls, function_dispatch_table, timeouts=None, cache_ttls=None, cache_events=None,
+                                   prefetch=None):
+    timeouts = timeouts or {}
+    cache_ttls = cache_ttls or {}
+    outputs = {}
+
+    async def run_one(action, func, arguments):
+        func_name = action["function"]["name"]
+        future = prefetched(action, arguments, prefetch, cache_events) or submit_tool(action, func, arguments, cache_ttls, cache_events)
+        try:
+            # shield: a timeout here must not cancel an execution other callers share
+            outputs[action["id"]] = await asyncio.wait_for(
+                asyncio.shield(asyncio.wrap_future(future)),
+                timeout=timeouts.get(func_name, TOOL_TIMEOUT)
+            )
+        except asyncio.TimeoutError:
+            outputs[action["id"]] = error_output(f"{func_name} timed out")
+        except Exception as e:
+            outputs[action["id"]] = error_output(f"{func_name} failed: {e}")
+
+    calls = []
+    for action in tool_calls:
+        resolved = resolve_tool_call(action, function_dispatch_table, outputs)
+        if resolved:
+            calls.append(run_one(action, *resolved))
+    await asyncio.gather(*calls)
+
+    if prefetch is not None:
+        prefetch.step(tool_calls, outputs, function_dispatch_table, cache_ttls)
+    return [{"tool_call_id": action["id"], "output": outputs[action["id"]]} for action in tool_calls]
@@ -0,0 +1,253 @@
+import os
+import json
+import time
+import weakref
+import threading
+from collections import Counter
+
+import tool_executor
+
+
+#-------------------------------------------------------------------------------------------------#
+#----Speculative prefetch of chained tool calls---------------------------------------------------#
+#----When a step's tools finish, the call the model is likely to make next is started in the------#
+#----background with arguments taken from their outputs (get_customer_information -> get_promotions#
+#----with its account_number). If the next step asks for that call (numbers equal to the cent),--#
+#----its output comes from the prefetch instead of a fresh execution.----------------------------#
+#----Dependencies are declared on the consumer, @tools.register(follows={producer: {argument:-----#
+#----"key.path"}}) ("" = the whole output), or learned from runs where an argument of one step----#
+#----equals a value in the output of the step before.--------------------------------------------#
+#-------------------------------------------------------------------------------------------------#
+
+TOOL_PREFETCH_ENABLED = os.getenv("TOOL_PREFETCH_ENABLED", "true").lower() == "true"
+TOOL_PREFETCH_MAX_INFLIGHT = int(os.getenv("TOOL_PREFETCH_MAX_INFLIGHT", "8"))           # speculative calls at once, process wide
+TOOL_PREFETCH_LEARN_MIN = int(os.getenv("TOOL_PREFETCH_LEARN_MIN", "3"))                 # observations before a learned rule is used
+TOOL_PREFETCH_MIN_PROBABILITY = float(os.getenv("TOOL_PREFETCH_MIN_PROBABILITY", "0.5"))  # share of producer calls followed by it
+PRICE_DECIMALS = 2   # numeric arguments of a claim match when equal to the cent
+
+
+def parse_path(path: str) -> tuple:
+    return tuple(path.split(".")) if path else ()
+
+
+def value_at(output, path: tuple):
+    for key in path:
+        if not isinstance(output, dict) or key not in output:
+            raise KeyError(key)
+        output = output[key]
+    return output
+
+
+def same_value(a, b) -> bool:
+    if isinstance(a, bool) or isinstance(b, bool):
+        return False
+    if isinstance(a, (int, float)) and isinstance(b, (int, float)):
+        return round(a, PRICE_DECIMALS) == round(b, PRICE_DECIMALS)
+    return a == b
+
+
+def find_path(output, value, path=(), depth=3):
+    # Where in a parsed output an argument value came from; only distinctive values count
+    if isinstance(value, bool) or (isinstance(value, str) and len(value) < 3):
+        return None
+    if same_value(output, value):
+        return path
+    if isinstance(output, dict) and depth:
+        for key, item in output.items():
+            found = find_path(item, value, path + (key,), depth - 1)
+            if found is not None:
+                return found
+    return None
+
+
+def parse_output(output: str):
+    try:
+        return json.loads(output)
+    except ValueError:
+        return output
+
+
+def rounded(value):
+    # A model rarely echoes a float bit for bit ("415.5" for 415.50000001): floats match to the cent
+    if isinstance(value, float):
+        return round(value, PRICE_DECIMALS)
+    if isinstance(value, dict):
+        return {key: rounded(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [rounded(item) for item in value]
+    return value
+
+
+def call_key(func_name: str, arguments: dict) -> str:
+    return tool_executor.tool_cache_key(func_name, rounded(arguments))
+
+
+#-------------------------------------------------------------------------------------------------#
+#----Prefetcher: learned rules, the speculative concurrency cap and the metrics, process wide-----#
+#-------------------------------------------------------------------------------------------------#
+
+class Prefetcher:
+    def __init__(self, max_inflight: int = TOOL_PREFETCH_MAX_INFLIGHT, learn_min: int = TOOL_PREFETCH_LEARN_MIN,
+                 min_probability: float = TOOL_PREFETCH_MIN_PROBABILITY):
+        self.learn_min = learn_min
+        self.min_probability = min_probability
+        self.counters = Counter()
+        self._slots = threading.BoundedSemaphore(max_inflight)
+        self._lock = threading.Lock()
+        self._producer_calls = Counter()   # producer -> calls that ended a step
+        self._observed = Counter()         # (producer, consumer, ((argument, path), ...)) -> times seen
+
+    def observe(self, previous, current):
+        # previous: (name, parsed output) of the last step; current: (name, arguments) of this one
+        with self._lock:
+            for consumer, arguments in current:
+                for producer, output in previous:
+                    mapping = []
+                    for argument, value in sorted(arguments.items()):
+                        path = find_path(output, value)
+                        if path is None:
+                            break
+                        mapping.append((argument, path))
+                    else:
+                        if mapping:
+                            self._observed[(producer, consumer, tuple(mapping))] += 1
+
+    def count_producers(self, names):
+        with self._lock:
+            self._producer_calls.update(names)
+
+    def rules(self, function_dispatch_table, cache_ttls=None) -> list:
+        # (producer, consumer, ((argument, path), ...)): the declared ones and the learned ones.
+        # A learned rule only starts a consumer that opted in (prefetchable).
+        rules = set()
+        for consumer, func in function_dispatch_table.items():
+            for producer, arguments in (getattr(func, "follows", None) or {}).items():
+                rules.add((producer, consumer, tuple(sorted((argument, parse_path(path)) for argument, path in arguments.items()))))
+        with self._lock:
+            for (producer, consumer, mapping), seen in self._observed.items():
+                calls = self._producer_calls[producer]
+                if (prefetchable(consumer, function_dispatch_table, cache_ttls or {}) and seen >= self.learn_min
+                        and calls and seen / calls >= self.min_probability):
+                    rules.add((producer, consumer, mapping))
+        return sorted(rules)
+
+    def count(self, name: str, amount=1):
+        # Counters are updated from the tool pool threads and the run threads alike
+        with self._lock:
+            self.counters[name] += amount
+
+    def try_acquire(self) -> bool:
+        if self._slots.acquire(blocking=False):
+            return True
+        self.count("skipped")
+        return False
+
+    def release(self):
+        self._slots.release()
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.counters)
+            started = stats.get("started", 0)
+            stats["hit_rate"] = stats.get("hits", 0) / started if started else 0.0
+            stats["wasted_seconds"] = round(stats.get("wasted_seconds", 0.0), 3)
+            stats["learned_rules"] = sum(1 for (producer, _, _), seen in self._observed.items()
+                                         if seen >= self.learn_min and seen / max(self._producer_calls[producer], 1) >= self.min_probability)
+        return stats
+
+
+prefetcher = Prefetcher()
+
+
+def prefetchable(consumer: str, function_dispatch_table, cache_ttls) -> bool:
+    # Safe to run speculatively: the tool declares `follows`, or its output may be reused (a cache TTL)
+    # and is not account-specific. The others only run when the model asks for them.
+    func = function_dispatch_table.get(consumer)
+    if func is None:
+        return False
+    if getattr(func, "follows", None):
+        return True
+    return bool(cache_ttls.get(consumer) or getattr(func, "cache_ttl", 0)) and getattr(func, "cache_class", None) != "account"
+
+
+def settle(prefetcher, speculative):
+    # Speculative calls nobody claimed are wasted work. They are not cancelled: with a tool cache
+    # TTL the future may be shared with other callers, and the output may still serve them.
+    for _, started, finished in list(speculative.values()):
+        prefetcher.count("wasted")
+        if finished:
+            prefetcher.count("wasted_seconds", finished[0] - started)
+    speculative.clear()
+
+
+#-------------------------------------------------------------------------------------------------#
+#----RunPrefetch: the speculative calls of one run (RunTrace.prefetch), kept for one step---------#
+#-------------------------------------------------------------------------------------------------#
+
+class RunPrefetch:
+    def __init__(self, prefetcher: Prefetcher = prefetcher, enabled: bool = TOOL_PREFETCH_ENABLED):
+        self.prefetcher = prefetcher
+        self.enabled = enabled
+        self.previous = []        # (name, parsed output) of the last step's successful calls
+        self.speculative = {}     # call key -> (future, started, [finished] once done)
+        # A run that ends with speculative calls outstanding wasted them
+        weakref.finalize(self, settle, prefetcher, self.speculative)
+
+    def claim(self, func_name: str, arguments: dict):
+        entry = self.speculative.pop(call_key(func_name, arguments), None) if self.enabled else None
+        if entry is None:
+            return None
+        self.prefetcher.count("hits")
+        return entry[0]
+
+    def step(self, tool_calls, outputs, function_dispatch_table, cache_ttls):
+        # Called with the outputs of a finished step: settle, learn, then start the next likely calls
+        if not self.enabled:
+            return
+        settle(self.prefetcher, self.speculative)
+
+        current = []
+        for action in tool_calls:
+            try:
+                current.append((action["function"]["name"], json.loads(action["function"]["arguments"] or "{}")))
+            except ValueError:
+                continue
+        self.prefetcher.observe(self.previous, current)
+
+        self.previous = [
+            (action["function"]["name"], parse_output(outputs[action["id"]]))
+            for action in tool_calls
+            if action["id"] in outputs and not tool_executor.is_error_output(outputs[action["id"]])
+        ]
+        self.prefetcher.count_producers(name for name, _ in self.previous)
+
+        called = {call_key(name, arguments) for name, arguments in current}
+        for producer, consumer, mapping in self.prefetcher.rules(function_dispatch_table, cache_ttls):
+            for name, output in self.previous:
+                if name == producer:
+                    self.start(consumer, mapping, output, function_dispatch_table, cache_ttls, called)
+
+    def start(self, consumer, mapping, output, function_dispatch_table, cache_ttls, called):
+        func = function_dispatch_table.get(consumer)
+        try:
+            arguments = {argument: value_at(output, path) for argument, path in mapping}
+            if hasattr(func, "validate"):
+                arguments = func.validate(arguments)
+        except (KeyError, ValueError):
+            return
+        key = call_key(consumer, arguments)
+        if func is None or key in called or key in self.speculative or not self.prefetcher.try_acquire():
+            return
+
+        prefetcher, finished = self.prefetcher, []
+        prefetcher.count("started")
+        entry = self.speculative[key] = (
+            tool_executor.submit_tool({"function": {"name": consumer}}, func, arguments, cache_ttls, None),
+            time.monotonic(),
+            finished,
+        )
+
+        def done(_):
+            finished.append(time.monotonic())
+            prefetcher.release()
+        entry[0].add_done_callback(done)
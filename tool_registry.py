@@ -0,0 +1,257 @@
+import re
+import json
+import types
+import inspect
+import typing
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+
+#-------------------------------------------------------------------------------------------------#
+#----Tool registry: tools declared once with a decorator------------------------------------------#
+#----The JSON schema comes from the signature and the docstring, argument validators are compiled-#
+#----when the tool is registered, and the tools list / dispatch table are built once and reused.--#
+#----                                                                                             #
+#----   tools = tool_registry.ToolRegistry()                                                      #
+#----   @tools.register(timeout=15, cache_ttl=60, cache_class="market")                          #
+#----   def get_stock_price(symbol: str | list[str]):                                             #
+#----       """Retrieve the latest closing price of a stock                                       #
+#----                                                                                             #
+#----       symbol: The ticker symbol of the stock                                                #
+#----       """                                                                                   #
+#-------------------------------------------------------------------------------------------------#
+
+class ToolArgumentError(ValueError):
+    pass
+
+
+#-------------------------------------------------------------------------------------------------#
+#----Schemas from type annotations, and validators compiled from the schemas----------------------#
+#-------------------------------------------------------------------------------------------------#
+
+SCALAR_TYPES = {str: "string", int: "integer", float: "number", bool: "boolean", dict: "object"}
+UNION_TYPES = (typing.Union, getattr(types, "UnionType", typing.Union))   # Union[a, b] and a | b
+
+
+def annotation_schema(annotation) -> dict:
+    if annotation is inspect.Parameter.empty or annotation is typing.Any:
+        return {}
+    if annotation in SCALAR_TYPES:
+        return {"type": SCALAR_TYPES[annotation]}
+    if annotation is list:
+        return {"type": "array"}
+
+    origin, args = typing.get_origin(annotation), typing.get_args(annotation)
+    if origin is typing.Literal:
+        return {"type": SCALAR_TYPES[type(args[0])], "enum": list(args)}
+    if origin is list:
+        return {"type": "array", "items": annotation_schema(args[0])} if args else {"type": "array"}
+    if origin is dict:
+        return {"type": "object"}
+    if origin in UNION_TYPES:
+        options = [annotation_schema(arg) for arg in args if arg is not type(None)]
+        return options[0] if len(options) == 1 else {"anyOf": options}
+    raise TypeError(f"No JSON schema for annotation {annotation!r}")
+
+
+def compile_check(schema: dict) -> Callable:
+    # Returns check(value) -> error message or None
+    if "anyOf" in schema:
+        options = [compile_check(option) for option in schema["anyOf"]]
+        names = " or ".join(schema_name(option) for option in schema["anyOf"])
+        return lambda value: None if any(check(value) is None for check in options) else f"expected {names}"
+
+    kind = schema.get("type")
+    if kind is None:
+        return lambda value: None
+    if "enum" in schema:
+        allowed = frozenset(schema["enum"])
+        return lambda value: None if value in allowed else f"expected one of {sorted(allowed)}"
+    if kind == "array":
+        check_item = compile_check(schema.get("items", {}))
+
+        def check_array(value):
+            if not isinstance(value, list):
+                return "expected an array"
+            for index, item in enumerate(value):
+                error = check_item(item)
+                if error:
+                    return f"item {index}: {error}"
+            return None
+        return check_array
+
+    accepted = {
+        "string": (str,),
+        "integer": (int,),
+        "number": (int, float),
+        "boolean": (bool,),
+        "object": (dict,),
+    }[kind]
+    message = f"expected {schema_name(schema)}"
+    if kind in ("integer", "number"):
+        # JSON true/false arrive as bool, which is an int subclass
+        return lambda value: None if isinstance(value, accepted) and not isinstance(value, bool) else message
+    return lambda value: None if isinstance(value, accepted) else message
+
+
+TYPE_NAMES = {"string": "a string", "integer": "an integer", "number": "a number", "boolean": "a boolean", "object": "an object"}
+
+
+def schema_name(schema: dict) -> str:
+    item_type = schema.get("items", {}).get("type")
+    if schema.get("type") == "array":
+        return f"an array of {item_type}s" if item_type in TYPE_NAMES else "an array"
+    return TYPE_NAMES.get(schema.get("type"), "any value")
+
+
+def parse_docstring(func, parameter_names):
+    # First paragraph: the tool description. Lines "name: text" below it: parameter descriptions.
+    doc = inspect.getdoc(func) or ""
+    paragraphs = doc.split("\n\n", 1)
+    description = " ".join(paragraphs[0].split())
+    parameters = {}
+    for line in (paragraphs[1] if len(paragraphs) > 1 else "").splitlines():
+        match = re.match(r"\s*(\w+)\s*:\s*(.+)", line)
+        if match and match.group(1) in parameter_names:
+            parameters[match.group(1)] = match.group(2).strip()
+    return description, parameters
+
+
+#-------------------------------------------------------------------------------------------------#
+#----Tool: the function plus its schema, validator and execution limits---------------------------#
+#-------------------------------------------------------------------------------------------------#
+
+class Tool:
+    def __init__(self, func, name: str = None, timeout: float = None, concurrency: int = None,
+                 cache_ttl: float = 0, cache_class: str = None, max_output_chars: int = None, follows: dict = None):
+        self.func = func
+        self.name = name or func.__name__
+        self.timeout = timeout                      # seconds, TOOL_TIMEOUT_SECONDS when None
+        self.cache_ttl = cache_ttl                  # seconds the output is reused, 0 = never
+        self.cache_class = cache_class              # answer cache class (answer_cache.ANSWER_CACHE_TTLS)
+        self.max_output_chars = max_output_chars    # longer outputs are cut before they reach the model
+        self.follows = follows or {}                # producer -> {argument: "key.path" in its output} (tool_prefetch.py)
+        # Calls of this tool in flight at once, across all conversations: a limited tool runs on its
+        # own small pool, so a burst of its calls queues there instead of holding shared pool threads
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix=f"tool-{self.name}") if concurrency else None
+
+        signature = inspect.signature(func)
+        description, descriptions = parse_docstring(func, signature.parameters)
+        properties, required, self._checks = {}, [], {}
+        for parameter in signature.parameters.values():
+            schema = annotation_schema(parameter.annotation)
+            self._checks[parameter.name] = compile_check(schema)
+            if parameter.name in descriptions:
+                schema = dict(schema, description=descriptions[parameter.name])
+            properties[parameter.name] = schema
+            if parameter.default is inspect.Parameter.empty:
+                required.append(parameter.name)
+        self._required = tuple(required)
+
+        self.schema = {
+            "type": "function",
+            "function": {
+                "name": self.name,
+                "description": description,
+                "parameters": {"type": "object", "properties": properties, "required": required},
+            },
+        }
+
+    def __call__(self, **arguments):
+        return self.func(**arguments)
+
+    def validate(self, arguments) -> dict:
+        if not isinstance(arguments, dict):
+            raise ToolArgumentError("arguments must be a JSON object")
+        missing = [name for name in self._required if name not in arguments]
+        if missing:
+            raise ToolArgumentError(f"missing {', '.join(missing)}")
+        for name, value in arguments.items():
+            check = self._checks.get(name)
+            if check is None:
+                raise ToolArgumentError(f"unexpected argument {name}")
+            error = check(value)
+            if error:
+                raise ToolArgumentError(f"{name}: {error}")
+        return arguments
+
+    def limit_output(self, output: str) -> str:
+        # The result stays valid JSON: trailing list items are dropped first, the text is cut otherwise
+        if self.max_output_chars is None or len(output) <= self.max_output_chars:
+            return output
+        try:
+            trimmed = trim_items(json.loads(output), self.max_output_chars)
+        except ValueError:
+            trimmed = None
+        return trimmed if trimmed is not None else truncate_text(output, self.max_output_chars)
+
+
+def trim_items(value, limit: int) -> Optional[str]:
+    # A list, or the longest list field of an object, keeps as many leading items as fit in limit
+    if isinstance(value, list):
+        wrap = lambda items, omitted: {"items": items, "truncated": True, "omitted_items": omitted}
+        items = value
+    elif isinstance(value, dict) and any(isinstance(field, list) for field in value.values()):
+        name = max((key for key, field in value.items() if isinstance(field, list)), key=lambda key: len(json.dumps(value[key])))
+        wrap = lambda items, omitted: dict(value, **{name: items, "truncated": True, "omitted_items": omitted})
+        items = value[name]
+    else:
+        return None
+    for kept in range(len(items) - 1, 0, -1):
+        output = json.dumps(wrap(items[:kept], len(items) - kept))
+        if len(output) <= limit:
+            return output
+    return None
+
+
+def truncate_text(output: str, limit: int) -> str:
+    text = output[:limit]
+    while text:
+        wrapped = json.dumps({"truncated": True, "omitted_chars": len(output) - len(text), "text": text})
+        if len(wrapped) <= limit:
+            return wrapped
+        text = text[:len(text) - (len(wrapped) - limit)]
+    return json.dumps({"truncated": True, "omitted_chars": len(output)})
+
+
+#-------------------------------------------------------------------------------------------------#
+#----ToolRegistry: one per assistant; its tables plug straight into AssistantConfig---------------#
+#-------------------------------------------------------------------------------------------------#
+
+class ToolRegistry:
+    def __init__(self):
+        self.tools = {}             # name -> Tool, in registration order
+        self._tools_list = None
+
+    def register(self, func: Optional[Callable] = None, **options):
+        # @tools.register or @tools.register(timeout=..., concurrency=..., cache_ttl=..., cache_class=...,
+        # max_output_chars=..., follows=..., name=...). The function itself is returned unchanged.
+        def decorate(func):
+            tool = Tool(func, **options)
+            self.tools[tool.name] = tool
+            self._tools_list = None
+            return func
+        return decorate(func) if func is not None else decorate
+
+    @property
+    def tools_list(self) -> list:
+        # Built on first use and shared by every request (and by the assistant registry key)
+        if self._tools_list is None:
+            self._tools_list = [tool.schema for tool in self.tools.values()]
+        return self._tools_list
+
+    @property
+    def dispatch_table(self) -> dict:
+        return dict(self.tools)
+
+    @property
+    def timeouts(self) -> dict:
+        return {name: tool.timeout for name, tool in self.tools.items() if tool.timeout is not None}
+
+    @property
+    def cache_ttls(self) -> dict:
+        return {name: tool.cache_ttl for name, tool in self.tools.items() if tool.cache_ttl}
+
+    @property
+    def cache_classes(self) -> dict:
+        return {name: tool.cache_class for name, tool in self.tools.items() if tool.cache_class}